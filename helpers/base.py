@@ -13,14 +13,15 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from fnmatch import fnmatch
 import logging
 import time
 
-from netaddr import IPAddress, IPNetwork
+from netaddr import IPAddress
 from netaddr.core import AddrFormatError
 
 from stream_alert.shared import NORMALIZATION_KEY
+from stream_alert.rule_processor.networks import compile_networks
+from stream_alert.rule_processor.patterns import compile_patterns
 from stream_alert.rule_processor.threat_intel import StreamThreatIntel
 
 logging.basicConfig()
@@ -37,7 +38,7 @@ def in_set(data, whitelist):
     Returns:
         True/False
     """
-    return any(fnmatch(data, x) for x in whitelist)
+    return compile_patterns(whitelist).matches(data)
 
 
 def last_hour(unixtime, hours=1):
@@ -76,20 +77,13 @@ def in_network(ip_address, cidrs):
 
     Args:
         ip_address (netaddr.IPAddress): IP address to check
-        cidrs (set): String CIDRs
+        cidrs (set): String CIDRs, compiled once per unique collection of CIDRs.
+            Large collections are best declared once, at the module level.
 
     Returns:
         Boolean representing if the given IP is within any CIDRs
     """
-    for cidr in cidrs:
-        try:
-            network = IPNetwork(cidr)
-        except AddrFormatError:
-            LOGGER.error('Invalid IP Network: %s', cidr)
-            continue
-        if ip_address in network:
-            return True
-    return False
+    return ip_address in compile_networks(cidrs)
 
 def fetch_values_by_datatype(rec, datatype):
     """Fetch values of normalized_type.
@@ -145,9 +139,11 @@ def is_ioc(rec, lowercase_ioc=True):
         for result in results:
             if isinstance(result, str):
                 result = result.lower() if lowercase_ioc else result.upper()
-            if (intel.get(datatypes_ioc_mapping[datatype])
-                    and result in intel[datatypes_ioc_mapping[datatype]]):
-                insert_ioc_info(rec, datatypes_ioc_mapping[datatype], result)
+            ioc_type = datatypes_ioc_mapping[datatype]
+            if (intel.get(ioc_type)
+                    and StreamThreatIntel.might_be_ioc(ioc_type, result)
+                    and result in intel[ioc_type]):
+                insert_ioc_info(rec, ioc_type, result)
     if StreamThreatIntel.IOC_KEY in rec:
         return True
 
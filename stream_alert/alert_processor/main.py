@@ -26,10 +26,8 @@ def handler(event, context):
     """StreamAlert Alert Processor
 
     Args:
-        event (dict): contains a 'Records' top level key that holds
-            all of the records for this event. Each record dict then
-            contains a 'Message' key pointing to the alert payload that
-            has been sent from the main StreamAlert Rule processor function
+        event (list): The list of alerts that has been sent from the main StreamAlert
+            Rule processor function. A single alert (dict) is also accepted.
         context (AWSLambdaContext): basically a namedtuple of properties from AWS
 
     Returns:
@@ -47,8 +45,11 @@ def handler(event, context):
     region = context.invoked_function_arn.split(':')[3]
     function_name = context.function_name
 
-    # Return the current list of statuses back to the caller
-    return list(run(event, region, function_name, config))
+    # The rule processor sends alerts in batches, but a single alert is still supported
+    alerts = event if isinstance(event, list) else [event]
+
+    # Return the current list of statuses for all alerts back to the caller
+    return [status for alert in alerts for status in run(alert, region, function_name, config)]
 
 
 def run(alert, region, function_name, config):
@@ -19,8 +19,6 @@ from datetime import datetime
 import json
 import uuid
 
-import backoff
-from botocore.exceptions import ClientError
 import boto3
 
 from stream_alert.alert_processor import LOGGER
@@ -29,11 +27,7 @@ from stream_alert.alert_processor.outputs.output_base import (
     OutputProperty,
     StreamAlertOutput
 )
-from stream_alert.shared.backoff_handlers import (
-    backoff_handler,
-    success_handler,
-    giveup_handler
-)
+from stream_alert.shared.firehose import put_record_batch
 
 
 class AWSOutput(OutputDispatcher):
@@ -104,27 +98,6 @@ class KinesisFirehoseOutput(AWSOutput):
         Returns:
             bool: Indicates a successful or failed dispatch of the alert
         """
-        @backoff.on_exception(backoff.fibo,
-                              ClientError,
-                              max_tries=self.MAX_BACKOFF_ATTEMPTS,
-                              jitter=backoff.full_jitter,
-                              on_backoff=backoff_handler,
-                              on_success=success_handler,
-                              on_giveup=giveup_handler)
-        def _firehose_request_wrapper(json_alert, delivery_stream):
-            """Make the PutRecord request to Kinesis Firehose with backoff
-
-            Args:
-                json_alert (str): The JSON dumped alert body
-                delivery_stream (str): The Firehose Delivery Stream to send to
-
-            Returns:
-                dict: Firehose response in the format below
-                    {'RecordId': 'string'}
-            """
-            return self.__aws_client__.put_record(DeliveryStreamName=delivery_stream,
-                                                  Record={'Data': json_alert})
-
         if self.__aws_client__ is None:
             self.__aws_client__ = boto3.client('firehose', region_name=self.region)
 
@@ -138,15 +111,17 @@ class KinesisFirehoseOutput(AWSOutput):
                     kwargs['rule_name'],
                     delivery_stream)
 
-        resp = _firehose_request_wrapper(json_alert, delivery_stream)
+        result = put_record_batch(self.__aws_client__,
+                                  delivery_stream,
+                                  [json_alert],
+                                  self.MAX_BACKOFF_ATTEMPTS)
 
-        if resp.get('RecordId'):
-            LOGGER.info('Alert [%s] successfully sent to aws-firehose:%s with RecordId:%s',
+        if result.sent:
+            LOGGER.info('Alert [%s] successfully sent to aws-firehose:%s',
                         kwargs['rule_name'],
-                        delivery_stream,
-                        resp['RecordId'])
+                        delivery_stream)
 
-        return self._log_status(resp)
+        return self._log_status(result.sent)
 
 
 @StreamAlertOutput
@@ -0,0 +1,158 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import math
+import mmap
+import struct
+
+from stream_alert.rule_processor.intel_store import encode_indicator
+
+# The default false positive rate for a bloom filter
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+# Extension for serialized bloom filter files, named <ioc_type>.bloom
+PREFILTER_EXTENSION = '.bloom'
+
+# Filter header: magic bytes, the number of bits and the number of hash functions,
+# followed by the bits
+_MAGIC = 'SABLM001'
+_HEADER = struct.Struct('<8sQI')
+
+
+class BloomFilterError(Exception):
+    """Exception indicating a bloom filter file could not be read"""
+
+
+class BloomFilter(object):
+    """Compact approximate membership filter for a fixed collection of string values
+
+    A value that was added is always reported as present, while a value that
+    was not added is reported as present at roughly the configured false positive
+    rate. Positions are derived from the MD5 digest of the UTF-8 encoded value,
+    split into two 64 bit halves for double hashing. Unlike the builtin hash, this
+    is stable across processes, hash seeds and platforms, so filters can be
+    written to a file when the function is packaged and memory mapped at runtime.
+    """
+
+    def __init__(self, values, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+        """Build a filter containing the values
+
+        Args:
+            values (collection): The values to add to the filter, which must support len()
+            false_positive_rate (float): Target rate of false positives, between 0 and 1
+        """
+        count = max(len(values), 1)
+        self.size = max(int(math.ceil(-count * math.log(false_positive_rate) /
+                                      (math.log(2) ** 2))), 8)
+        self.hash_count = max(int(round(float(self.size) / count * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self._offset = 0
+        self._mmap = None
+
+        for value in values:
+            self.add(value)
+
+    @classmethod
+    def load(cls, path):
+        """Memory map a filter file written by `write`
+
+        The loaded filter is read only, so values can only be added to a copy of it.
+
+        Args:
+            path (str): The path of the filter file
+
+        Returns:
+            BloomFilter: The filter backed by the memory mapped file
+        """
+        with open(path, 'rb') as filter_file:
+            filter_mmap = mmap.mmap(filter_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(filter_mmap) < _HEADER.size:
+            raise BloomFilterError('Bloom filter is truncated: {}'.format(path))
+
+        magic, size, hash_count = _HEADER.unpack_from(filter_mmap, 0)
+        if magic != _MAGIC:
+            raise BloomFilterError('Invalid bloom filter: {}'.format(path))
+
+        if len(filter_mmap) < _HEADER.size + (size + 7) // 8:
+            raise BloomFilterError('Bloom filter is truncated: {}'.format(path))
+
+        bloom_filter = cls.__new__(cls)
+        bloom_filter.size, bloom_filter.hash_count = size, hash_count
+        # pylint: disable=protected-access
+        bloom_filter._bits, bloom_filter._offset = filter_mmap, _HEADER.size
+        bloom_filter._mmap = filter_mmap
+        return bloom_filter
+
+    def write(self, path):
+        """Write the filter to a file that can be memory mapped with `load`
+
+        Args:
+            path (str): The path of the filter file to write
+        """
+        with open(path, 'wb') as filter_file:
+            filter_file.write(_HEADER.pack(_MAGIC, self.size, self.hash_count))
+            filter_file.write(self._bytes())
+
+    def close(self):
+        """Unmap the filter file of a loaded filter"""
+        if self._mmap:
+            self._mmap.close()
+
+    def _bytes(self):
+        """Return the bytes holding the bits of the filter"""
+        return self._bits[self._offset:self._offset + (self.size + 7) // 8]
+
+    def add(self, value):
+        """Add a value to the filter
+
+        Values cannot be added to a memory mapped filter, only to a copy of it.
+
+        Args:
+            value (str): The value to add
+        """
+        for position in self._positions(encode_indicator(value)):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def copy(self):
+        """Return a copy of this filter, which values can be added to separately"""
+        bloom_filter = BloomFilter.__new__(BloomFilter)
+        bloom_filter.size, bloom_filter.hash_count = self.size, self.hash_count
+        # pylint: disable=protected-access
+        bloom_filter._bits, bloom_filter._offset = bytearray(self._bytes()), 0
+        bloom_filter._mmap = None
+        return bloom_filter
+
+    def _positions(self, value):
+        """Return the bit positions for a value"""
+        first, second = struct.unpack('<QQ', hashlib.md5(value).digest())
+        # The step between positions must not be a multiple of the size
+        first, second = int(first % self.size), int(second % (self.size - 1)) + 1
+        return [(first + index * second) % self.size for index in xrange(self.hash_count)]
+
+    def __contains__(self, value):
+        value = encode_indicator(value)
+        if value is None:
+            return False
+
+        bits, offset = self._bits, self._offset
+        # Memory mapped filters return bytes as characters rather than ints
+        to_int = ord if self._mmap else int
+        for position in self._positions(value):
+            if not to_int(bits[offset + (position >> 3)]) & (1 << (position & 7)):
+                return False
+
+        return True
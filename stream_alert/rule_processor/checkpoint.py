@@ -0,0 +1,99 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import namedtuple
+import sqlite3
+import time
+
+from stream_alert.rule_processor import LOGGER
+
+# The default location of the checkpoint database, which is kept in the
+# Lambda container's /tmp so it is reused by warm invocations
+DEFAULT_CHECKPOINT_PATH = '/tmp/streamalert_s3_checkpoints.db'
+
+# The position to resume reading an S3 object from. The offset is the byte
+# offset to start the ranged read at, which is always the start of a line for
+# plaintext objects and the start of a gzip member for gzipped objects. The
+# skip_lines are the lines after the offset that were already processed.
+S3Checkpoint = namedtuple('S3Checkpoint', 'offset, skip_lines')
+
+
+class S3CheckpointStore(object):
+    """SQLite backed store of the progress made processing large S3 objects"""
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        """
+        Args:
+            path (str): The path of the SQLite database file
+        """
+        self.path = path
+        self._conn = None
+
+    def _connection(self):
+        """Open the database on first use, creating the checkpoints table if needed"""
+        if not self._conn:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                               'object_id TEXT PRIMARY KEY, '
+                               'offset INTEGER NOT NULL, '
+                               'skip_lines INTEGER NOT NULL, '
+                               'updated REAL NOT NULL)')
+        return self._conn
+
+    def load(self, object_id):
+        """Load the checkpoint for an S3 object
+
+        Args:
+            object_id (str): The unique identifier of the S3 object
+
+        Returns:
+            S3Checkpoint: The position to resume from, or None if there is no checkpoint
+        """
+        try:
+            row = self._connection().execute(
+                'SELECT offset, skip_lines FROM checkpoints WHERE object_id = ?',
+                (object_id,)).fetchone()
+        except sqlite3.Error as err:
+            LOGGER.error('Failed to load checkpoint for S3 object %s: %s', object_id, err)
+            return
+
+        return S3Checkpoint(*row) if row else None
+
+    def save(self, object_id, checkpoint):
+        """Save the checkpoint for an S3 object, replacing any previous one
+
+        Args:
+            object_id (str): The unique identifier of the S3 object
+            checkpoint (S3Checkpoint): The position to resume from
+        """
+        try:
+            with self._connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)',
+                             (object_id, checkpoint.offset, checkpoint.skip_lines,
+                              time.time()))
+        except sqlite3.Error as err:
+            LOGGER.error('Failed to save checkpoint for S3 object %s: %s', object_id, err)
+
+    def clear(self, object_id):
+        """Remove the checkpoint for an S3 object once it is fully processed
+
+        Args:
+            object_id (str): The unique identifier of the S3 object
+        """
+        try:
+            with self._connection() as conn:
+                conn.execute('DELETE FROM checkpoints WHERE object_id = ?', (object_id,))
+        except sqlite3.Error as err:
+            LOGGER.error('Failed to clear checkpoint for S3 object %s: %s', object_id, err)
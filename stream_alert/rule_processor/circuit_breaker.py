@@ -0,0 +1,172 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+
+from stream_alert.rule_processor import LOGGER
+
+# The number of buckets that the rolling window of each rule is split into
+WINDOW_BUCKETS = 10
+
+# The options of the circuit breaker that can be set in the rules_engine config
+CIRCUIT_BREAKER_OPTIONS = frozenset([
+    'window_seconds',
+    'min_invocations',
+    'max_error_rate',
+    'max_latency_ms',
+    'max_slow_rate',
+    'cooldown_seconds'
+])
+
+
+class _RuleWindow(object):
+    """Rolling window of invocation outcomes for a single rule
+
+    The window is split into fixed size time buckets so the memory used by
+    each rule does not grow with the number of records it processes.
+    """
+    __slots__ = ('buckets', 'open_until')
+
+    def __init__(self):
+        # List of [bucket start, invocations, errors, slow invocations]
+        self.buckets = []
+        self.open_until = None
+
+    def add(self, bucket_start, error, slow, window_start):
+        """Add an invocation to the window, dropping buckets that are outside of it"""
+        while self.buckets and self.buckets[0][0] < window_start:
+            self.buckets.pop(0)
+
+        if not self.buckets or self.buckets[-1][0] != bucket_start:
+            self.buckets.append([bucket_start, 0, 0, 0])
+
+        bucket = self.buckets[-1]
+        bucket[1] += 1
+        bucket[2] += error
+        bucket[3] += slow
+
+    def totals(self):
+        """Return the total invocations, errors and slow invocations in the window"""
+        return tuple(sum(bucket[index] for bucket in self.buckets) for index in (1, 2, 3))
+
+
+class RuleCircuitBreaker(object):
+    """Per-rule circuit breaker that skips rules which error or run slowly
+
+    The outcome of every invocation of a rule is tracked over a rolling window.
+    Once a rule has been invoked at least `min_invocations` times within the
+    window, the breaker trips if the rate of errors or of invocations slower than
+    `max_latency_ms` reaches its threshold. A tripped rule is skipped until the
+    cooldown has passed, after which it is re-enabled with an empty window. State
+    is kept for the lifetime of the container, so a rule can be tripped by records
+    from several invocations of the function.
+    """
+
+    def __init__(self, window_seconds=300, min_invocations=20, max_error_rate=0.5,
+                 max_latency_ms=1000, max_slow_rate=0.5, cooldown_seconds=300):
+        """
+        Args:
+            window_seconds (int): The length of the rolling window
+            min_invocations (int): Minimum invocations within the window before the
+                breaker can trip
+            max_error_rate (float): Rate of invocations that raise an exception at
+                which the breaker trips
+            max_latency_ms (float): Invocations that take at least this long are slow
+            max_slow_rate (float): Rate of slow invocations at which the breaker trips
+            cooldown_seconds (int): How long a tripped rule is skipped for
+        """
+        self.window_seconds = window_seconds
+        self.min_invocations = min_invocations
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency_ms / 1000.0
+        self.max_slow_rate = max_slow_rate
+        self.cooldown_seconds = cooldown_seconds
+        self._bucket_seconds = float(window_seconds) / WINDOW_BUCKETS
+        self._windows = {}
+        self._stats = {'trips': 0, 'skipped': 0}
+
+    def allow(self, rule_name):
+        """Check if a rule should be invoked, re-enabling it if its cooldown has passed
+
+        Args:
+            rule_name (str): The name of the rule
+
+        Returns:
+            bool: False if the breaker for this rule is open and the rule should be skipped
+        """
+        window = self._windows.get(rule_name)
+        if not (window and window.open_until):
+            return True
+
+        if time.time() < window.open_until:
+            self._stats['skipped'] += 1
+            return False
+
+        LOGGER.info('Circuit breaker for rule [%s] has cooled down, re-enabling rule',
+                    rule_name)
+        del self._windows[rule_name]
+        return True
+
+    def record(self, rule_name, elapsed, error):
+        """Add the outcome of an invocation of a rule and trip the breaker if needed
+
+        Args:
+            rule_name (str): The name of the rule
+            elapsed (float): The wall time of the invocation, in seconds
+            error (bool): True if the rule raised an exception
+        """
+        window = self._windows.get(rule_name)
+        if window is None:
+            window = self._windows[rule_name] = _RuleWindow()
+
+        now = time.time()
+        bucket_start = now - now % self._bucket_seconds
+        window.add(bucket_start, bool(error), elapsed >= self.max_latency,
+                   now - self.window_seconds)
+
+        invocations, errors, slow = window.totals()
+        if invocations < self.min_invocations:
+            return
+
+        error_rate = float(errors) / invocations
+        slow_rate = float(slow) / invocations
+        if error_rate < self.max_error_rate and slow_rate < self.max_slow_rate:
+            return
+
+        window.open_until = now + self.cooldown_seconds
+        self._stats['trips'] += 1
+        LOGGER.error('Circuit breaker tripped for rule [%s], skipping rule for %d seconds '
+                     '(%d invocations, error rate %.2f, slow rate %.2f)',
+                     rule_name, self.cooldown_seconds, invocations, error_rate, slow_rate)
+
+    def is_open(self, rule_name):
+        """Check if the breaker for a rule is currently tripped, without changing its state"""
+        window = self._windows.get(rule_name)
+        return bool(window and window.open_until and time.time() < window.open_until)
+
+    def get_stats(self, reset=False):
+        """Return the number of times breakers tripped and rule invocations skipped
+
+        Args:
+            reset (bool): Reset the counts after returning them
+
+        Returns:
+            dict: The 'trips' and 'skipped' counts
+        """
+        stats = dict(self._stats)
+        if reset:
+            self._stats.update(trips=0, skipped=0)
+
+        return stats
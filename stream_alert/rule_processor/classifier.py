@@ -17,20 +17,100 @@ from collections import namedtuple, OrderedDict
 import json
 
 from stream_alert.rule_processor import LOGGER, LOGGER_DEBUG_ENABLED
-from stream_alert.rule_processor.parsers import get_parser
+from stream_alert.rule_processor.parsers import get_parser, JSONParser
+from stream_alert.rule_processor.schema import compile_schema
 from stream_alert.shared.stats import time_me
 
 # Set the below to True when we want to support matching on multiple schemas
 # and then log_patterns will be used as a fall back for key/value matching
 SUPPORT_MULTIPLE_SCHEMA_MATCHING = False
 
+# A single step of a classification plan, which is a tuple of these for a service/entity
+LogPlan = namedtuple('LogPlan', 'log_name, parser, schema')
+
+SchemaMatch = namedtuple('SchemaMatch', 'log_name, root_schema, parser, parsed_data')
+
+# Maximum number of record shapes remembered by the classifier's shape cache
+SHAPE_CACHE_SIZE = 1024
+
+# Cached value for record shapes that did not match any log in the plan
+NO_MATCH = -1
+
+
+def _shape_fingerprint(record):
+    """Build a structural fingerprint of a decoded JSON record
+
+    The fingerprint contains the record's keys, where any key with a map value is
+    paired with the fingerprint of that map. Lists and scalar values are not inspected.
+
+    Args:
+        record (dict): A decoded JSON record
+
+    Returns:
+        frozenset: The hashable fingerprint of the record's keys and nested map keys
+    """
+    return frozenset((key, _shape_fingerprint(value)) if isinstance(value, dict) else key
+                     for key, value in record.iteritems())
+
+
+def _is_shape_determined(log_plan):
+    """Check if the classification result for a log only depends on the record's shape
+
+    This is true for JSON logs that do not extract records with a json_path or
+    json_regex_key and do not use log_patterns, since the result of the key check
+    for these logs is decided by the record's keys and nested map keys alone.
+
+    Args:
+        log_plan (LogPlan): A single step of a classification plan
+
+    Returns:
+        bool: True if the shape fingerprint determines if this log matches
+    """
+    options = log_plan.parser.options
+    return (isinstance(log_plan.parser, JSONParser) and
+            not any(options.get(key) for key in ('json_path', 'json_regex_key', 'log_patterns')))
+
 
 class StreamClassifier(object):
-    """Classify, map source, and parse a raw record into its declared type."""
+    """Classify, map source, and parse a raw record into its declared type.
+
+    Classification plans are cached for the lifetime of the container and are
+    shared by all classifiers that use the same config object. Each cached value
+    is a tuple of (log sources, plan) keyed by (service, entity), where the plan
+    is an ordered tuple of LogPlan entries with a prebuilt parser and compiled schema.
+
+    The shape cache is a bounded LRU that maps (service, entity, record shape
+    fingerprint) to the index of the log in the plan that matched a JSON record
+    of that shape, or to NO_MATCH. Results are only cached when they could not
+    have depended on the record's values, so repeat shapes can go straight to the
+    matching log and known bad shapes can be rejected without trying any logs.
+
+    For multi-record payloads, such as S3 objects, the log that matched the
+    previous record is stored on the payload as its sticky log and is tried
+    first for the next record, for every parser type. The plan order decides the
+    log for the first record of an object and the sticky log keeps it for the
+    rest of that object. The full plan is only used when the sticky log fails to
+    parse a record, which is counted as a sticky fallback.
+    """
+    __plans = {}
+    __plans_config = None
+    __shape_cache = OrderedDict()
 
     def __init__(self, config):
         self._config = config
         self._entity_log_sources = []
+        self._plan = ()
+        self._source = None
+        self._shape_prefix = 0
+        self.shape_cache_hits = 0
+        self.shape_cache_misses = 0
+        self.sticky_fallbacks = 0
+
+        # Discard any cached plans if they were built from a different config
+        if StreamClassifier.__plans_config is not config:
+            StreamClassifier.__plans.clear()
+            StreamClassifier.__shape_cache.clear()
+            StreamClassifier.__plans_config = config
 
     @staticmethod
     def extract_service_and_entity(raw_record):
@@ -69,7 +149,7 @@ class StreamClassifier(object):
         return service, entity
 
     def load_sources(self, service, entity):
-        """Load the sources for this payload.
+        """Load the sources and classification plan for this payload.
 
         Args:
             service (str): Source service
@@ -78,8 +158,14 @@ class StreamClassifier(object):
         Returns:
             bool: True if the entity's log sources loaded properly
         """
-        # Clear the list from any previous runs
-        del self._entity_log_sources[:]
+        self._source = (service, entity)
+        cached = self.__plans.get(self._source)
+        if cached:
+            self._entity_log_sources, self._plan, self._shape_prefix = cached
+            return bool(self._plan)
+
+        # Clear any sources from previous runs
+        self._entity_log_sources, self._plan, self._shape_prefix = (), (), 0
 
         # Get all logs for the configured service/entity (s3, kinesis, or sns)
         service_entities = self._config['sources'].get(service)
@@ -96,10 +182,57 @@ class StreamClassifier(object):
                 service)
             return False
 
-        # Get a copy of the logs list by slicing here, not a pointer to the list reference
-        self._entity_log_sources = config_entity['logs'][:]
+        # Store an immutable copy of the logs list, not a pointer to the list reference
+        self._entity_log_sources = tuple(config_entity['logs'])
+        self._plan = self._build_plan()
+
+        # Count the leading logs in the plan that can use the shape cache
+        for log_plan in self._plan:
+            if not _is_shape_determined(log_plan):
+                break
+            self._shape_prefix += 1
+
+        self.__plans[self._source] = (self._entity_log_sources, self._plan, self._shape_prefix)
+
+        return bool(self._plan)
+
+    def _build_plan(self):
+        """Build the classification plan for the currently loaded log sources
 
-        return bool(self._entity_log_sources)
+        Returns:
+            tuple: LogPlan entries, in the order they are declared in logs.json
+        """
+        plan = []
+        for log_name, attributes in self.get_log_info_for_source().iteritems():
+            options = attributes.get('configuration', {})
+            parser = get_parser(attributes['parser'])(options)
+            # Schemas are compiled when the config is loaded, so this is a no-op
+            # unless the config was built elsewhere
+            schema = compile_schema(attributes['schema'], options)
+            plan.append(LogPlan(log_name, parser, schema))
+
+        return tuple(plan)
+
+    def dump_classification_plans(self):
+        """Log and return all of the cached classification plans, for debugging
+
+        Returns:
+            dict: Each 'service:entity' mapped to a list of the log name, parser
+                type, and schema keys for each step in its classification plan
+        """
+        plans = {
+            '{}:{}'.format(service, entity): [
+                {
+                    'log_name': log_plan.log_name,
+                    'parser': log_plan.parser.__parserid__,
+                    'schema_keys': sorted(log_plan.schema.key_signature)
+                } for log_plan in plan
+            ] for (service, entity), (_, plan, _) in self.__plans.iteritems()
+        }
+
+        LOGGER.debug('Classification plans:\n%s', json.dumps(plans, indent=2, sort_keys=True))
+
+        return plans
 
     def get_log_info_for_source(self):
         """Return a mapping of all log sources to a given entity with attributes.
@@ -191,6 +324,90 @@ class StreamClassifier(object):
 
         return schema_matches[0]
 
+    def _shape_cache_key(self, payload, decoded_json):
+        """Get the shape cache key for a record, if the shape cache can be used for it
+
+        Args:
+            payload: A StreamAlert payload object
+            decoded_json: The decoded JSON data for the record, or None
+
+        Returns:
+            tuple: The (service, entity, fingerprint) key for the record, or None
+        """
+        if (SUPPORT_MULTIPLE_SCHEMA_MATCHING or payload.type or not self._shape_prefix
+                or not isinstance(decoded_json, dict)):
+            return None
+
+        return self._source + (_shape_fingerprint(decoded_json),)
+
+    def _cache_shape(self, shape_key, result):
+        """Add a classification result to the shape cache, evicting the oldest shape
+
+        Args:
+            shape_key (tuple): The (service, entity, fingerprint) key for the record
+            result (int): The index of the log that matched in the plan, or NO_MATCH
+        """
+        self.__shape_cache[shape_key] = result
+        if len(self.__shape_cache) > SHAPE_CACHE_SIZE:
+            self.__shape_cache.popitem(last=False)
+
+    @staticmethod
+    def _is_json(log_plan, payload):
+        """Check if a log from the classification plan will parse the record as JSON
+
+        Args:
+            log_plan (LogPlan): A single step of the classification plan
+            payload: A StreamAlert payload object
+
+        Returns:
+            bool: True if the record will be parsed with the JSON parser
+        """
+        if payload.type:
+            return payload.type == JSONParser.__parserid__
+
+        return isinstance(log_plan.parser, JSONParser)
+
+    def _match_log(self, log_plan, payload, decoded_json):
+        """Try to parse a record with one log from the classification plan
+
+        Args:
+            log_plan (LogPlan): A single step of the classification plan
+            payload: A StreamAlert payload object
+            decoded_json: The decoded JSON data for the record, or None if it is not JSON
+
+        Returns:
+            SchemaMatch: The match for this log, or None if the record did not parse
+                or, when multiple schema matching is not supported, if it did not
+                match the log_patterns for this log
+        """
+        log_name, parser, schema = log_plan
+
+        # Use the parser for the payload type, if one has already been set
+        if payload.type and payload.type != parser.type():
+            parser = get_parser(payload.type)(parser.options)
+
+        data = payload.pre_parsed_record
+        if isinstance(parser, JSONParser):
+            if decoded_json is None:
+                return None
+            data = decoded_json
+
+        # Get a list of parsed records
+        LOGGER.debug('Trying schema: %s', log_name)
+        parsed_data = parser.parse(schema, data)
+
+        if not parsed_data:
+            return None
+
+        LOGGER.debug('Parsed %d records with schema %s', len(parsed_data), log_name)
+
+        if not SUPPORT_MULTIPLE_SCHEMA_MATCHING:
+            log_patterns = parser.options.get('log_patterns')
+            if not all(parser.matched_log_pattern(rec, log_patterns) for rec in parsed_data):
+                return None
+
+        return SchemaMatch(log_name, schema, parser, parsed_data)
+
     @time_me
     def _process_log_schemas(self, payload):
         """Get any log schemas that matched this log format
@@ -203,39 +420,80 @@ class StreamClassifier(object):
                 Each list entry contains the namedtuple of 'SchemaMatch' with
                 values of log_name, root_schema, parser, and parsed_data
         """
-        schema_match = namedtuple('SchemaMatch',
-                                  'log_name, root_schema, parser, parsed_data')
         schema_matches = []
-        log_info = self.get_log_info_for_source()
 
-        # Loop over all logs declared in logs.json
-        for log_name, attributes in log_info.iteritems():
-            # Get the parser type to use for this log
-            parser_name = payload.type or attributes['parser']
+        # JSON data is decoded at most once and shared by all JSON parsers,
+        # which do not modify the decoded data
+        decoded_json, json_decoded = None, False
 
-            schema = attributes['schema']
-            options = attributes.get('configuration', {})
+        sticky_log = None if SUPPORT_MULTIPLE_SCHEMA_MATCHING else payload.sticky_log
+        if sticky_log:
+            if self._is_json(sticky_log, payload):
+                decoded_json, json_decoded = JSONParser.decode(payload.pre_parsed_record), True
 
-            # Setup the parser class
-            parser_class = get_parser(parser_name)
-            parser = parser_class(options)
+            schema_match = self._match_log(sticky_log, payload, decoded_json)
+            if schema_match:
+                return [schema_match]
 
-            # Get a list of parsed records
-            LOGGER.debug('Trying schema: %s', log_name)
-            parsed_data = parser.parse(schema, payload.pre_parsed_record)
+            self.sticky_fallbacks += 1
 
-            if not parsed_data:
+        shape_key = None
+        if self._shape_prefix:
+            # The first log in the plan is JSON, so the record is always decoded
+            if not json_decoded:
+                decoded_json, json_decoded = JSONParser.decode(payload.pre_parsed_record), True
+            shape_key = self._shape_cache_key(payload, decoded_json)
+
+        if shape_key:
+            cached = self.__shape_cache.get(shape_key)
+            if cached is None:
+                self.shape_cache_misses += 1
+            else:
+                self.shape_cache_hits += 1
+                if cached == NO_MATCH:
+                    return schema_matches
+
+                # Mark this shape as the most recently used
+                self.__shape_cache[shape_key] = self.__shape_cache.pop(shape_key)
+
+                log_plan = self._plan[cached]
+                schema_match = log_plan is not sticky_log and self._match_log(
+                    log_plan, payload, decoded_json)
+                if schema_match:
+                    payload.sticky_log = log_plan
+                    return [schema_match]
+
+                # The cached log can still fail on this record's values, such as
+                # log_patterns, so fall back on trying every log in the plan
+                del self.__shape_cache[shape_key]
+
+        # Loop over all logs declared in logs.json for this entity
+        for index, log_plan in enumerate(self._plan):
+            # The sticky log has already failed for this record
+            if log_plan is sticky_log:
                 continue
 
-            LOGGER.debug('Parsed %d records with schema %s', len(parsed_data), log_name)
+            if not json_decoded and self._is_json(log_plan, payload):
+                decoded_json, json_decoded = JSONParser.decode(payload.pre_parsed_record), True
+
+            schema_match = self._match_log(log_plan, payload, decoded_json)
+            if not schema_match:
+                continue
 
             if SUPPORT_MULTIPLE_SCHEMA_MATCHING:
-                schema_matches.append(schema_match(log_name, schema, parser, parsed_data))
+                schema_matches.append(schema_match)
                 continue
 
-            log_patterns = parser.options.get('log_patterns')
-            if all(parser.matched_log_pattern(rec, log_patterns) for rec in parsed_data):
-                return [schema_match(log_name, schema, parser, parsed_data)]
+            # This match is only decided by shape if every log before it is
+            if shape_key and index <= self._shape_prefix:
+                self._cache_shape(shape_key, index)
+
+            payload.sticky_log = log_plan
+            return [schema_match]
+
+        # No match is only decided by shape if every log in the plan is
+        if shape_key and self._shape_prefix == len(self._plan):
+            self._cache_shape(shape_key, NO_MATCH)
 
         return schema_matches
 
@@ -249,6 +507,8 @@ class StreamClassifier(object):
             payload.log_source: The detected log name from the data_sources config.
             payload.type: The record's type.
             payload.records: The parsed records as a list.
+            payload.normalized_types: The normalized types declared for the log.
+            payload.normalized_paths: The key paths of the normalized types in the log.
 
         Returns:
             bool: the success of the parse.
@@ -283,6 +543,10 @@ class StreamClassifier(object):
         payload.type = schema_match.parser.type()
         payload.records = schema_match.parsed_data
         payload.normalized_types = normalized_types.get(payload.log_source.split(':')[0])
+        # The key paths are computed from the schema when the config is loaded
+        payload.normalized_paths = (
+            compile_schema(schema_match.root_schema).normalized_paths(payload.normalized_types)
+            if payload.normalized_types else None)
 
         return True
 
@@ -296,55 +560,10 @@ class StreamClassifier(object):
 
         Args:
             payload (dict): Parsed payload dict
-            schema (dict): data schema for a specific log source
+            schema (dict): data schema for a specific log source, which is
+                compiled here if it is not already a CompiledSchema
 
         Returns:
-            dict: parsed dict payload with typed values
+            bool: True if all of the payload's values were converted
         """
-        for key, value in schema.iteritems():
-            key = str(key)
-            # if the schema value is declared as string
-            if value == 'string':
-                try:
-                    payload[key] = str(payload[key])
-                except UnicodeEncodeError:
-                    payload[key] = unicode(payload[key])
-
-            # if the schema value is declared as integer
-            elif value == 'integer':
-                try:
-                    payload[key] = int(payload[key])
-                except (ValueError, TypeError):
-                    LOGGER.error('Invalid schema. Value for key [%s] is not an int: %s',
-                                 key, payload[key])
-                    return False
-
-            elif value == 'float':
-                try:
-                    payload[key] = float(payload[key])
-                except (ValueError, TypeError):
-                    LOGGER.error('Invalid schema. Value for key [%s] is not a float: %s',
-                                 key, payload[key])
-                    return False
-
-            elif value == 'boolean':
-                payload[key] = str(payload[key]).lower() == 'true'
-
-            elif isinstance(value, dict):
-                if not value:
-                    continue  # allow empty maps (dict)
-
-                # Skip the values for the 'streamalert:envelope_keys' key that we've
-                # added during parsing if the do not conform to being a dict
-                if key == 'streamalert:envelope_keys' and not isinstance(payload[key], dict):
-                    continue
-
-                return cls._convert_type(payload[key], schema[key])
-
-            elif isinstance(value, list):
-                pass
-
-            else:
-                LOGGER.error('Unsupported schema type: %s', value)
-
-        return True
+        return compile_schema(schema).convert(payload)
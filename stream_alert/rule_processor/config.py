@@ -17,6 +17,8 @@ from collections import OrderedDict
 import json
 import os
 
+from stream_alert.rule_processor.schema import compile_schema
+
 class ConfigError(Exception):
     """Exception class for config file errors"""
 
@@ -47,6 +49,10 @@ def load_config(conf_dir='conf/'):
     # which bubbles up and will immediately break execution of the function
     _validate_config(config)
 
+    # Compile each log schema once so records are not validated and
+    # converted by walking the raw schema every time
+    _compile_schemas(config)
+
     return config
 
 
@@ -89,6 +95,19 @@ def _validate_config(config):
                 raise ConfigError(
                     'List of \'logs\' is empty for entity: {}'.format(entity))
 
+def _compile_schemas(config):
+    """Replace each log's schema with a CompiledSchema
+
+    The compiled schema includes the envelope keys declared in the log's
+    `configuration`, since these are added to every record during parsing.
+    The key paths of each log's normalized types are also precomputed here.
+    """
+    normalized_types = config.get('types', {})
+    for log_name, attrs in config['logs'].iteritems():
+        attrs['schema'] = compile_schema(attrs['schema'], attrs.get('configuration'))
+        attrs['schema'].normalized_paths(normalized_types.get(log_name.split(':')[0]))
+
+
 def load_env(context):
     """Get the current environment for the running Lambda function.
 
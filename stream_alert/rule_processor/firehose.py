@@ -0,0 +1,224 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import namedtuple
+import re
+import threading
+
+from stream_alert.rule_processor import LOGGER
+
+# Firehose Limits: http://bit.ly/2fw5UY2
+MAX_BATCH_COUNT = 500
+MAX_BATCH_SIZE = 4000 * 1000
+
+# The default amount of serialized records that can be buffered or in flight before
+# the largest buffers are sent early, which is enough to hold several full batches
+DEFAULT_MAX_BUFFERED_BYTES = 4 * MAX_BATCH_SIZE
+
+# Used to detect special characters in payload keys.
+# This is necessary for sanitization of data prior to searching in Athena.
+SPECIAL_CHAR_REGEX = re.compile(r'\W')
+SPECIAL_CHAR_SUB = '_'
+
+# The Firehose routing information for a log type, where the key map holds the
+# sanitized name of each key in the log's schema
+FirehoseRoute = namedtuple('FirehoseRoute', 'enabled, stream_name, key_map')
+
+
+def _sanitized_key_map(schema):
+    """Map each key of a schema to its sanitized name and the map for its nested keys
+
+    Args:
+        schema (dict): The log schema, or a nested map within it
+
+    Returns:
+        dict: Map of each key to a tuple of the sanitized key and the key map
+            for its nested schema, which is None if the nested keys are unknown
+    """
+    return {
+        key: (SPECIAL_CHAR_REGEX.sub(SPECIAL_CHAR_SUB, key),
+              _sanitized_key_map(value) if isinstance(value, dict) and value else None)
+        for key, value in schema.iteritems()
+    }
+
+
+def build_firehose_routes(config):
+    """Build the Firehose routing table for all of the log types in the config
+
+    Args:
+        config (dict): The loaded config
+
+    Returns:
+        dict: FirehoseRoute for each log type, keyed by the log type
+    """
+    disabled_logs = set(config['global'].get('infrastructure', {}).get(
+        'firehose', {}).get('disabled_logs', []))
+
+    return {
+        log_type: FirehoseRoute(
+            log_type.split(':')[0] not in disabled_logs,
+            # This same method is used when naming the Delivery Streams
+            'streamalert_data_{}'.format(log_type.replace(':', '_')),
+            _sanitized_key_map(attrs['schema']))
+        for log_type, attrs in config['logs'].iteritems()
+    }
+
+
+def sanitize_keys(record, key_map=None):
+    """Remove special characters from parsed record keys
+
+    This is required when searching in Athena. Keys can only have
+    a period or underscore. Keys found in the key map use their precomputed
+    sanitized name, while any other keys are sanitized with a regex. A new
+    dictionary is only built if a key or nested value actually changed, so
+    records with clean keys are returned as they are.
+
+    Args:
+        record (dict): Original parsed record
+        key_map (dict): Optional sanitized key map for the record's schema
+
+    Returns:
+        dict: A sanitized record
+    """
+    key_map = key_map or {}
+    sanitized_record = None
+    for key, value in record.iteritems():
+        if key in key_map:
+            sanitized_key, nested_key_map = key_map[key]
+        else:
+            sanitized_key, nested_key_map = SPECIAL_CHAR_REGEX.sub(SPECIAL_CHAR_SUB, key), None
+
+        # Handle nested objects
+        sanitized_value = (sanitize_keys(value, nested_key_map)
+                           if isinstance(value, dict) else value)
+
+        if sanitized_key == key and sanitized_value is value:
+            continue
+
+        if sanitized_record is None:
+            sanitized_record = dict(record)
+
+        if sanitized_key != key:
+            del sanitized_record[key]
+        sanitized_record[sanitized_key] = sanitized_value
+
+    return record if sanitized_record is None else sanitized_record
+
+
+class _LogTypeBuffer(object):
+    """Serialized records waiting to be sent to the Delivery Stream of a log type"""
+    __slots__ = ('records', 'size')
+
+    def __init__(self):
+        self.records = []
+        self.size = 0
+
+
+class FirehoseBuffer(object):
+    """Bounded per log type buffer of serialized records to send to Firehose
+
+    Records are added to the buffer for their log type as they are classified. A
+    batch is sent as soon as the next record would not fit in a PutRecordBatch
+    request for the log type. Batches remain in flight until `batch_sent` is
+    called for them. If the total size of the buffered and in flight records
+    exceeds the byte budget, adding records blocks until in flight batches are
+    sent, and the largest buffer is sent early, to bound memory usage.
+    """
+
+    def __init__(self, send_batch, max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES):
+        """
+        Args:
+            send_batch (callable): Function called with a log type and a list of
+                serialized records to send them to Firehose, which must call
+                `batch_sent` with the list once the records have been sent
+            max_buffered_bytes (int): The byte budget for all buffered and in flight records
+        """
+        self._send_batch = send_batch
+        self.max_buffered_bytes = max_buffered_bytes
+        self._buffers = {}
+        self._sent = threading.Condition()
+        self.buffered_bytes = 0
+        self.in_flight_bytes = 0
+        self.peak_buffered_bytes = 0
+
+    def add(self, log_type, serialized_records):
+        """Add serialized records to the buffer for a log type
+
+        Args:
+            log_type (str): The log type of the records
+            serialized_records (list): JSON encoded records, each ending with a newline
+        """
+        buf = self._buffers.get(log_type)
+        if buf is None:
+            buf = self._buffers[log_type] = _LogTypeBuffer()
+
+        for data in serialized_records:
+            if buf.records and (len(buf.records) == MAX_BATCH_COUNT or
+                                buf.size + len(data) > MAX_BATCH_SIZE):
+                self._flush_log_type(log_type)
+
+            buf.records.append(data)
+            buf.size += len(data)
+            self.buffered_bytes += len(data)
+            self.peak_buffered_bytes = max(self.peak_buffered_bytes,
+                                           self.buffered_bytes + self.in_flight_bytes)
+
+            while self.buffered_bytes + self.in_flight_bytes > self.max_buffered_bytes:
+                if self.in_flight_bytes:
+                    self._wait_for_sent_batch()
+                    continue
+
+                largest = max(self._buffers, key=lambda key: self._buffers[key].size)
+                LOGGER.debug('Firehose buffer is over budget with %d bytes, sending %d '
+                             'bytes of \'%s\' records', self.buffered_bytes,
+                             self._buffers[largest].size, largest)
+                self._flush_log_type(largest)
+
+    def _wait_for_sent_batch(self):
+        """Block until at least one of the batches in flight has been sent"""
+        with self._sent:
+            in_flight_bytes = self.in_flight_bytes
+            while self.in_flight_bytes >= in_flight_bytes:
+                self._sent.wait()
+
+    def batch_sent(self, batch):
+        """Release the bytes of a batch once the request that sent it has finished
+
+        This may be called from any thread.
+
+        Args:
+            batch (list): The serialized records of the batch
+        """
+        with self._sent:
+            self.in_flight_bytes -= sum(len(data) for data in batch)
+            self._sent.notify_all()
+
+    def _flush_log_type(self, log_type):
+        """Send all of the buffered records for a log type"""
+        buf = self._buffers[log_type]
+        if not buf.records:
+            return
+
+        batch = buf.records
+        self.buffered_bytes -= buf.size
+        with self._sent:
+            self.in_flight_bytes += buf.size
+        buf.records, buf.size = [], 0
+        self._send_batch(log_type, batch)
+
+    def flush(self):
+        """Send all of the buffered records"""
+        for log_type in self._buffers:
+            self._flush_log_type(log_type)
@@ -13,37 +13,39 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from collections import defaultdict
 from logging import DEBUG as LOG_LEVEL_DEBUG
 import json
-import re
 
-import backoff
 import boto3
 from botocore.exceptions import ClientError
-from botocore.vendored.requests.exceptions import ConnectionError
 
 from stream_alert.rule_processor import FUNCTION_NAME, LOGGER
+from stream_alert.rule_processor.checkpoint import S3CheckpointStore
 from stream_alert.rule_processor.classifier import StreamClassifier
 from stream_alert.rule_processor.config import load_config, load_env
-from stream_alert.rule_processor.payload import load_stream_payload
+from stream_alert.rule_processor.firehose import (
+    build_firehose_routes,
+    DEFAULT_MAX_BUFFERED_BYTES,
+    FirehoseBuffer,
+    sanitize_keys
+)
+from stream_alert.rule_processor.io_pool import io_worker_count, IOWorkerPool
+from stream_alert.rule_processor.payload import (
+    load_stream_payload,
+    s3_reserved_time,
+    S3_CHECKPOINT_KEY,
+    S3_MAX_RESERVED_TIME_MS
+)
 from stream_alert.rule_processor.rules_engine import StreamRules
 from stream_alert.rule_processor.threat_intel import StreamThreatIntel
 from stream_alert.rule_processor.sink import StreamSink
-from stream_alert.shared.backoff_handlers import (
-    backoff_handler,
-    success_handler,
-    giveup_handler
-)
+from stream_alert.shared.firehose import put_record_batch
 from stream_alert.shared.metrics import MetricLogger
 
 # For Firehose PutRecordBatch backoff
 MAX_BACKOFF_ATTEMPTS = 10
 # Adds a max of 20 seconds more to the Lambda function
 MAX_BACKOFF_FIBO_VALUE = 8
-# Firehose Limits: http://bit.ly/2fw5UY2
-MAX_BATCH_COUNT = 500
-MAX_BATCH_SIZE = 4000 * 1000
 # The subtraction of 2 accounts for the newline at the end
 MAX_RECORD_SIZE = 1000 * 1000 - 2
 
@@ -51,10 +53,9 @@ MAX_RECORD_SIZE = 1000 * 1000 - 2
 class StreamAlert(object):
     """Wrapper class for handling StreamAlert classificaiton and processing"""
     config = {}
-    # Used to detect special characters in payload keys.
-    # This is necessary for sanitization of data prior to searching in Athena.
-    special_char_regex = re.compile(r'\W')
-    special_char_sub = '_'
+    # The Firehose routing table is built once for the cached config
+    _firehose_routes = {}
+    _firehose_routes_config = None
 
     def __init__(self, context, enable_alert_processor=True):
         """Initializer
@@ -73,9 +74,22 @@ class StreamAlert(object):
         # Load the environment from the context arn
         self.env = load_env(context)
 
+        # The time left in the invocation is used to stop reading large S3 objects
+        # early enough to continue them in a new invocation
+        self._remaining_time = getattr(context, 'get_remaining_time_in_millis', None)
+        # The context does not provide the function's timeout, but the time left at the
+        # start of the invocation is the closest measure of it
+        self._s3_reserved_time = (s3_reserved_time(self._remaining_time())
+                                  if self._remaining_time else S3_MAX_RESERVED_TIME_MS)
+        self._checkpoint_store = S3CheckpointStore()
+        self._continuations = []
+
+        # Alert and Firehose requests for this run are sent concurrently from this pool
+        self._io_pool = IOWorkerPool(io_worker_count())
+
         # Instantiate the sink here to handle sending the triggered alerts to the
         # alert processor
-        self.sinker = StreamSink(self.env)
+        self.sinker = StreamSink(self.env, self._io_pool)
 
         # Instantiate a classifier that is used for this run
         self.classifier = StreamClassifier(config=self.config)
@@ -85,14 +99,23 @@ class StreamAlert(object):
         self._processed_size = 0
         self._alerts = []
 
-        # Create a dictionary to hold parsed payloads by log type.
-        # Firehose needs this information to send to its corresponding
-        # delivery stream.
-        self.categorized_payloads = defaultdict(list)
+        # Buffer the serialized records by log type. Firehose needs this
+        # information to send to its corresponding delivery stream.
+        firehose_config = self.config['global'].get(
+            'infrastructure', {}).get('firehose', {})
+        self.firehose_buffer = FirehoseBuffer(
+            self._send_firehose_batch,
+            firehose_config.get('max_buffered_bytes', DEFAULT_MAX_BUFFERED_BYTES))
 
-        # Firehose client initialization
+        # Firehose client and routing table initialization. Resolving the Delivery
+        # Stream and sanitized keys of each log type walks every log schema, so the
+        # routes are only rebuilt if the config was loaded again.
         self.firehose_client = None
+        if StreamAlert._firehose_routes_config is not self.config:
+            StreamAlert._firehose_routes = build_firehose_routes(self.config)
+            StreamAlert._firehose_routes_config = self.config
         StreamThreatIntel.load_intelligence(self.config)
+        StreamRules.load_config(self.config)
 
     def run(self, event):
         """StreamAlert Lambda function handler.
@@ -122,32 +145,75 @@ class StreamAlert(object):
             self.firehose_client = boto3.client('firehose',
                                                 region_name=self.env['lambda_region'])
 
-        for raw_record in records:
-            # Get the service and entity from the payload. If the service/entity
-            # is not in our config, log and error and go onto the next record
-            service, entity = self.classifier.extract_service_and_entity(raw_record)
-            if not service:
-                LOGGER.error('No valid service found in payload\'s raw record. Skipping '
-                             'record: %s', raw_record)
-                continue
+        # The I/O pool is always drained, so alert and Firehose requests that were
+        # already queued are sent even if processing a record fails
+        try:
+            for raw_record in records:
+                # Get the service and entity from the payload. If the service/entity
+                # is not in our config, log and error and go onto the next record
+                service, entity = self.classifier.extract_service_and_entity(raw_record)
+                if not service:
+                    LOGGER.error('No valid service found in payload\'s raw record. Skipping '
+                                 'record: %s', raw_record)
+                    continue
+
+                if not entity:
+                    LOGGER.error(
+                        'Unable to extract entity from payload\'s raw record for service %s. '
+                        'Skipping record: %s', service, raw_record)
+                    continue
+
+                # Cache the log sources for this service and entity on the classifier
+                if not self.classifier.load_sources(service, entity):
+                    continue
+
+                # Create the StreamPayload to use for encapsulating parsed info
+                payload = load_stream_payload(service, entity, raw_record,
+                                              remaining_time=self._remaining_time,
+                                              reserved_time=self._s3_reserved_time,
+                                              checkpoint_store=self._checkpoint_store)
+                if not payload:
+                    continue
+
+                self._process_alerts(payload)
+
+                # S3 objects that could not be read in time are continued by a new invocation
+                if payload.service() == 's3' and payload.checkpoint:
+                    self._continuations.append(payload.continuation_record())
+
+            # Send any alerts that are still buffered in the sink
+            if self.enable_alert_processor:
+                self.sinker.flush()
 
-            if not entity:
-                LOGGER.error(
-                    'Unable to extract entity from payload\'s raw record for service %s. '
-                    'Skipping record: %s', service, raw_record)
-                continue
+            if self.firehose_client:
+                self._send_to_firehose()
+        finally:
+            self._finish_invocation()
 
-            # Cache the log sources for this service and entity on the classifier
-            if not self.classifier.load_sources(service, entity):
-                continue
+        # Check if debugging logging is on before json dumping alerts since
+        # this can be time consuming if there are a lot of alerts
+        if self._alerts and LOGGER.isEnabledFor(LOG_LEVEL_DEBUG):
+            LOGGER.debug('Alerts:\n%s', json.dumps(self._alerts, indent=2))
 
-            # Create the StreamPayload to use for encapsulating parsed info
-            payload = load_stream_payload(service, entity, raw_record)
-            if not payload:
-                continue
+        return self._failed_record_count == 0
 
-            self._process_alerts(payload)
+    def _finish_invocation(self):
+        """Wait for the I/O pool, then continue partially read objects and log metrics
 
+        Waiting for all of the alert and Firehose requests to finish raises any
+        failed request again, after partially read objects are continued and the
+        metrics for this invocation are logged.
+        """
+        try:
+            self._io_pool.shutdown()
+        finally:
+            # A failed request for records already read does not affect the rest
+            # of a partially read object, so it is continued either way
+            self._invoke_continuations()
+            self._log_metrics()
+
+    def _log_metrics(self):
+        """Log the metrics and stats collected during this invocation"""
         MetricLogger.log_metric(FUNCTION_NAME,
                                 MetricLogger.TOTAL_PROCESSED_SIZE,
                                 self._processed_size)
@@ -158,21 +224,72 @@ class StreamAlert(object):
                                 MetricLogger.FAILED_PARSES,
                                 self._failed_record_count)
 
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.SHAPE_CACHE_HITS,
+                                self.classifier.shape_cache_hits)
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.SHAPE_CACHE_MISSES,
+                                self.classifier.shape_cache_misses)
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.STICKY_SCHEMA_FALLBACKS,
+                                self.classifier.sticky_fallbacks)
+
         LOGGER.debug('%s alerts triggered', len(self._alerts))
 
         MetricLogger.log_metric(
             FUNCTION_NAME, MetricLogger.TRIGGERED_ALERTS, len(
                 self._alerts))
 
-        # Check if debugging logging is on before json dumping alerts since
-        # this can be time consuming if there are a lot of alerts
-        if self._alerts and LOGGER.isEnabledFor(LOG_LEVEL_DEBUG):
-            LOGGER.debug('Alerts:\n%s', json.dumps(self._alerts, indent=2))
+        prefilter_stats = StreamThreatIntel.get_prefilter_stats(reset=True)
+        LOGGER.debug('Threat intel prefilter rejected %d of %d values',
+                     prefilter_stats['rejections'], prefilter_stats['checks'])
 
-        if self.firehose_client:
-            self._send_to_firehose()
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.THREAT_INTEL_PREFILTER_CHECKS,
+                                prefilter_stats['checks'])
 
-        return self._failed_record_count == 0
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.THREAT_INTEL_PREFILTER_REJECTIONS,
+                                prefilter_stats['rejections'])
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.THREAT_INTEL_VERSION,
+                                StreamThreatIntel.get_version())
+
+        matcher_stats = StreamRules.get_matcher_stats(reset=True)
+        LOGGER.debug('Matchers were called %d times and %d calls were saved',
+                     matcher_stats['calls'], matcher_stats['saved'])
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.MATCHER_CALLS,
+                                matcher_stats['calls'])
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.MATCHER_CALLS_SAVED,
+                                matcher_stats['saved'])
+
+        if self.sinker.invocations:
+            MetricLogger.log_metric(FUNCTION_NAME,
+                                    MetricLogger.ALERTS_PER_INVOKE,
+                                    float(self.sinker.alerts_batched) / self.sinker.invocations)
+
+            MetricLogger.log_metric(FUNCTION_NAME,
+                                    MetricLogger.ALERT_INVOKES_SAVED,
+                                    self.sinker.alerts_batched - self.sinker.invocations)
+
+        breaker_stats = StreamRules.get_circuit_breaker_stats(reset=True)
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.RULE_CIRCUIT_BREAKER_TRIPS,
+                                breaker_stats['trips'])
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.RULE_CIRCUIT_BREAKER_SKIPS,
+                                breaker_stats['skipped'])
+
+        StreamRules.log_rule_stats()
 
     def get_alerts(self):
         """Public method to return alerts from class. Useful for testing.
@@ -183,57 +300,41 @@ class StreamAlert(object):
         return self._alerts
 
     @staticmethod
-    def _segment_records_by_count(record_list, max_count):
-        """Segment records by length
-
-        Args:
-            record_list (list): The original records list to be segmented
-            max_count (int): The max amount of records to yield per group
-        """
-        for index in range(0, len(record_list), max_count):
-            yield record_list[index:index + max_count]
+    def _serialize_records(records, key_map=None):
+        """Sanitize and serialize records to be sent to Firehose
 
-    def _segment_records_by_size(self, record_batch):
-        """Segment record groups by size
+        Each record is serialized exactly once. Records that are larger than the
+        Firehose record size limit are logged and left out of the result.
 
         Args:
-            record_batch (list): The original record batch to measure and segment
+            records (list): The parsed records to serialize
+            key_map (dict): Optional sanitized key map for the schema of the records
 
         Returns:
-            generator: Used to iterate on each newly segmented group
+            list: JSON encoded records, each ending with a newline
         """
-        split_factor = 1
-        len_batch = len(record_batch)
-
-        # Sample the first batch of records to determine the split factor.
-        # Generally, it's very rare for a group of records to have
-        # drastically different sizes in a single Lambda invocation.
-        while len(json.dumps(record_batch[:len_batch / split_factor],
-                             separators=(",", ":"))) > MAX_BATCH_SIZE:
-            split_factor += 1
-
-        return self._segment_records_by_count(record_batch, len_batch / split_factor)
-
-    @staticmethod
-    def _limit_record_size(batch):
-        """Limit the record size to be sent to Firehose
-
-        Args:
-            batch (list): Record batch to iterate on
-        """
-        for index, record in enumerate(batch):
-            if len(json.dumps(record, separators=(",", ":"))) > MAX_RECORD_SIZE:
+        serialized_records = []
+        for record in records:
+            data = json.dumps(sanitize_keys(record, key_map), separators=(',', ':'))
+            if len(data) > MAX_RECORD_SIZE:
                 # Show the first 1k bytes in order to not overload
                 # CloudWatch logs
-                LOGGER.error('The following record is too large'
-                             'be sent to Firehose: %s', str(record)[:1000])
+                LOGGER.error('The following record is too large to '
+                             'be sent to Firehose: %s', data[:1000])
                 MetricLogger.log_metric(FUNCTION_NAME,
                                         MetricLogger.FIREHOSE_FAILED_RECORDS,
                                         1)
-                batch.pop(index)
+                continue
+
+            # The newline at the end is required by Firehose,
+            # otherwise all records will be on a single line and
+            # unsearchable in Athena.
+            serialized_records.append(data + '\n')
 
-    @classmethod
-    def sanitize_keys(cls, record):
+        return serialized_records
+
+    @staticmethod
+    def sanitize_keys(record):
         """Remove special characters from parsed record keys
 
         This is required when searching in Athena.  Keys can only have
@@ -245,109 +346,109 @@ class StreamAlert(object):
         Returns:
             dict: A sanitized record
         """
-        new_record = {}
-        for key, value in record.iteritems():
-            sanitized_key = re.sub(cls.special_char_regex,
-                                   cls.special_char_sub,
-                                   key)
-
-            # Handle nested objects
-            if isinstance(value, dict):
-                new_record[sanitized_key] = cls.sanitize_keys(record[key])
-            else:
-                new_record[sanitized_key] = record[key]
-
-        return new_record
+        return sanitize_keys(record)
 
     def _firehose_request_helper(self, stream_name, record_batch):
         """Send record batches to Firehose
 
+        Only the records that fail are resent on each retry, so records that
+        were already delivered are not duplicated in the Delivery Stream.
+
         Args:
             stream_name (str): The name of the Delivery Stream to send to
-            record_batch (list): The records to send
+            record_batch (list): The JSON encoded records to send
         """
-        resp = {}
-        record_batch_size = len(record_batch)
-        exceptions_to_backoff = (ClientError, ConnectionError)
-
-        @backoff.on_predicate(backoff.fibo,
-                              lambda resp: resp['FailedPutCount'] > 0,
-                              max_tries=MAX_BACKOFF_ATTEMPTS,
-                              max_value=MAX_BACKOFF_FIBO_VALUE,
-                              jitter=backoff.full_jitter,
-                              on_backoff=backoff_handler,
-                              on_success=success_handler,
-                              on_giveup=giveup_handler)
-        @backoff.on_exception(backoff.fibo,
-                              exceptions_to_backoff,
-                              max_tries=MAX_BACKOFF_ATTEMPTS,
-                              jitter=backoff.full_jitter,
-                              on_backoff=backoff_handler,
-                              on_success=success_handler,
-                              on_giveup=giveup_handler)
-        def firehose_request_wrapper():
-            """Firehose request wrapper to use with backoff"""
-            LOGGER.info('[Firehose] Sending %d records to %s',
-                        record_batch_size,
-                        stream_name)
-            return self.firehose_client.put_record_batch(
-                DeliveryStreamName=stream_name,
-                # The newline at the end is required by Firehose,
-                # otherwise all records will be on a single line and
-                # unsearchable in Athena.
-                Records=[{'Data': json.dumps(self.sanitize_keys(record),
-                                             separators=(",", ":")) + '\n'}
-                         for record
-                         in record_batch])
-
-        # The try/except here is to catch the raised error at the
-        # end of the backoff.
-        try:
-            resp = firehose_request_wrapper()
-        except exceptions_to_backoff as firehose_err:
-            LOGGER.error(firehose_err)
+        result = put_record_batch(self.firehose_client,
+                                  stream_name,
+                                  record_batch,
+                                  MAX_BACKOFF_ATTEMPTS,
+                                  MAX_BACKOFF_FIBO_VALUE)
+
+        if result.resent_bytes:
             MetricLogger.log_metric(FUNCTION_NAME,
-                                    MetricLogger.FIREHOSE_FAILED_RECORDS,
-                                    record_batch_size)
-            return
+                                    MetricLogger.FIREHOSE_BYTES_RESENT,
+                                    result.resent_bytes)
+            MetricLogger.log_metric(FUNCTION_NAME,
+                                    MetricLogger.FIREHOSE_RECORDS_DUPLICATED,
+                                    result.duplicated)
+
+        if result.sent:
+            MetricLogger.log_metric(FUNCTION_NAME,
+                                    MetricLogger.FIREHOSE_RECORDS_SENT,
+                                    result.sent)
+            LOGGER.info('[Firehose] Successfully sent %d messages to %s',
+                        result.sent,
+                        stream_name)
 
         # Error handle if failures occured in PutRecordBatch after
         # several backoff attempts
-        if resp.get('FailedPutCount') > 0:
-            failed_records = [failed
-                              for failed
-                              in resp['RequestResponses']
-                              if failed.get('ErrorCode')]
+        if result.failed:
             MetricLogger.log_metric(FUNCTION_NAME,
                                     MetricLogger.FIREHOSE_FAILED_RECORDS,
-                                    resp['FailedPutCount'])
+                                    result.failed)
             # Only print the first 100 failed records to Cloudwatch logs
-            LOGGER.error('[Firehose] The following records failed to put to '
-                         'the Delivery Stream %s: %s',
+            LOGGER.error('[Firehose] %d records failed to put to the Delivery Stream %s: %s',
+                         result.failed,
                          stream_name,
-                         json.dumps(failed_records[:100], indent=2))
-        else:
-            MetricLogger.log_metric(FUNCTION_NAME,
-                                    MetricLogger.FIREHOSE_RECORDS_SENT,
-                                    record_batch_size)
-            LOGGER.info('[Firehose] Successfully sent %d messages to %s',
-                        record_batch_size,
-                        stream_name)
+                         json.dumps(result.errors[:100], indent=2))
+
+    def _send_firehose_batch(self, log_type, record_batch):
+        """Send a batch of records to the Firehose Delivery Stream for a log type
+
+        The batches for each Delivery Stream are sent from the I/O worker pool in
+        order, while batches for different Delivery Streams are sent concurrently.
+
+        Args:
+            log_type (str): The log type of the records
+            record_batch (list): The JSON encoded records to send
+        """
+        stream_name = self._firehose_routes[log_type].stream_name
+
+        self._io_pool.submit(self._send_firehose_request,
+                             stream_name, record_batch, key=stream_name)
+
+    def _send_firehose_request(self, stream_name, record_batch):
+        """Send a batch of records, releasing it from the Firehose buffer once done
+
+        Args:
+            stream_name (str): The name of the Delivery Stream to send to
+            record_batch (list): The JSON encoded records to send
+        """
+        try:
+            self._firehose_request_helper(stream_name, record_batch)
+        finally:
+            self.firehose_buffer.batch_sent(record_batch)
 
     def _send_to_firehose(self):
-        """Send all classified records to a respective Firehose Delivery Stream"""
-        delivery_stream_name_pattern = 'streamalert_data_{}'
+        """Send all of the records that are still buffered to Firehose"""
+        self.firehose_buffer.flush()
+
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.FIREHOSE_BUFFER_PEAK_BYTES,
+                                self.firehose_buffer.peak_buffered_bytes)
 
-        # Iterate through each payload type
-        for log_type, records in self.categorized_payloads.items():
-            # This same method is used when naming the Delivery Streams
-            formatted_log_type = log_type.replace(':', '_')
+    def _invoke_continuations(self):
+        """Asynchronously invoke this function to continue reading partially read S3 objects"""
+        if not self._continuations:
+            return
+
+        client = boto3.client('lambda', region_name=self.env['lambda_region'])
+        for raw_record in self._continuations:
+            try:
+                client.invoke(
+                    FunctionName=self.env['lambda_function_name'],
+                    InvocationType='Event',
+                    Payload=json.dumps({'Records': [raw_record]}),
+                    Qualifier=self.env['lambda_alias']
+                )
+            except ClientError as err:
+                LOGGER.error('Failed to continue processing S3 object %s from byte offset '
+                             '%d: %s', raw_record['s3']['object']['key'],
+                             raw_record[S3_CHECKPOINT_KEY]['offset'], err.response)
 
-            for record_batch in self._segment_records_by_count(records, MAX_BATCH_COUNT):
-                stream_name = delivery_stream_name_pattern.format(formatted_log_type)
-                self._limit_record_size(record_batch)
-                for sized_batch in self._segment_records_by_size(record_batch):
-                    self._firehose_request_helper(stream_name, sized_batch)
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.S3_CONTINUATIONS,
+                                len(self._continuations))
 
     def _process_alerts(self, payload):
         """Process records for alerts and send them to the correct places
@@ -379,13 +480,15 @@ class StreamAlert(object):
                          len(payload.records),
                          len(record_alerts))
 
-            # Add all parsed records to the categorized payload dict
-            # only if Firehose is enabled
+            # Buffer all parsed records to be sent to Firehose, where full batches
+            # are sent while the remaining records are still being processed
             if self.firehose_client:
                 # Only send payloads with enabled types
-                if payload.log_source.split(':')[0] not in self.config['global'] \
-                    ['infrastructure'].get('firehose', {}).get('disabled_logs', []):
-                    self.categorized_payloads[payload.log_source].extend(payload.records)
+                route = self._firehose_routes[payload.log_source]
+                if route.enabled:
+                    self.firehose_buffer.add(
+                        payload.log_source,
+                        self._serialize_records(payload.records, route.key_map))
 
             if not record_alerts:
                 continue
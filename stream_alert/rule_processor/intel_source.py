@@ -0,0 +1,134 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from abc import ABCMeta, abstractmethod
+from cStringIO import StringIO
+import json
+import os
+
+import boto3
+
+# The manifest of a versioned intel source, which lists its delta files
+MANIFEST = 'manifest.json'
+
+
+def load_intel_source(location):
+    """Return the right IntelSource subclass for a location
+
+    Args:
+        location (str): An S3 prefix, such as 's3://bucket/threat_intel',
+            or a local directory
+
+    Returns:
+        IntelSource: The intel source for this location
+    """
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3IntelSource(bucket, prefix)
+
+    return LocalIntelSource(location)
+
+
+class IntelSource(object):
+    """A versioned source of threat intel delta files
+
+    The source's manifest holds its current version and the delta files
+    for each version, where each delta has add and/or remove csv.gz files
+    for any IOC type:
+        {
+            "version": 3,
+            "deltas": [
+                {
+                    "version": 2,
+                    "files": {
+                        "ip": {"add": "2/ip_add.csv.gz", "remove": "2/ip_remove.csv.gz"}
+                    }
+                },
+                {
+                    "version": 3,
+                    "files": {
+                        "domain": {"add": "3/domain_add.csv.gz"}
+                    }
+                }
+            ]
+        }
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def manifest_tag(self):
+        """Return a value that changes whenever the manifest changes, such as an ETag
+
+        This should be much cheaper than reading the manifest.
+        """
+
+    @abstractmethod
+    def open(self, name):
+        """Open a file within the source for reading
+
+        Args:
+            name (str): The path of the file, relative to the source
+
+        Returns:
+            file: A file-like object with the file's contents
+        """
+
+    def read_manifest(self):
+        """Read and decode the source's manifest
+
+        Returns:
+            dict: The decoded manifest
+        """
+        return json.load(self.open(MANIFEST))
+
+
+class LocalIntelSource(IntelSource):
+    """An intel source in a local directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def manifest_tag(self):
+        stat = os.stat(os.path.join(self.path, MANIFEST))
+        return stat.st_mtime, stat.st_size
+
+    def open(self, name):
+        return open(os.path.join(self.path, name), 'rb')
+
+
+class S3IntelSource(IntelSource):
+    """An intel source under an S3 prefix"""
+
+    def __init__(self, bucket, prefix):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        """Create the S3 client when the source is first used"""
+        if not self._client:
+            self._client = boto3.client('s3')
+        return self._client
+
+    def _key(self, name):
+        return '/'.join(part for part in (self.prefix.rstrip('/'), name) if part)
+
+    def manifest_tag(self):
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(MANIFEST))['ETag']
+
+    def open(self, name):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        return StringIO(response['Body'].read())
@@ -0,0 +1,218 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import Mapping
+import json
+import mmap
+import struct
+
+# Extension for compiled intel store files, named <ioc_type>.ioc
+STORE_EXTENSION = '.ioc'
+
+# Store header: magic bytes and the number of indicators
+_MAGIC = 'SAIOC001'
+_HEADER = struct.Struct('<8sI')
+
+# Offset of each entry from the start of the file, in sorted key order
+_OFFSET = struct.Struct('<I')
+
+# Entry header: key length and value length, followed by the key and value bytes
+_ENTRY = struct.Struct('<HI')
+
+
+class IntelStoreError(Exception):
+    """Exception indicating an intel store file could not be read"""
+
+
+def encode_indicator(key):
+    """Encode an indicator as the bytes used as its key in a store
+
+    Returns:
+        str: The key bytes, or None if the indicator cannot be a key
+    """
+    if isinstance(key, unicode):
+        return key.encode('utf-8')
+
+    return key if isinstance(key, str) else None
+
+
+def write_intel_store(path, indicators):
+    """Write indicators to a sorted, binary intel store file
+
+    The file contains a header, a table of entry offsets sorted by indicator, and
+    the entries themselves. Each entry is the indicator and its JSON encoded values.
+
+    Args:
+        path (str): The path of the store file to write
+        indicators (dict): Map of indicator -> list of values, such as
+            {"evil1.com": ["apt_domain", "source1 reported evil1.com"]}
+    """
+    entries = sorted((encode_indicator(key), json.dumps(values))
+                     for key, values in indicators.iteritems())
+
+    offset = _HEADER.size + _OFFSET.size * len(entries)
+    with open(path, 'wb') as store_file:
+        store_file.write(_HEADER.pack(_MAGIC, len(entries)))
+        for key, value in entries:
+            store_file.write(_OFFSET.pack(offset))
+            offset += _ENTRY.size + len(key) + len(value)
+
+        for key, value in entries:
+            store_file.write(_ENTRY.pack(len(key), len(value)))
+            store_file.write(key)
+            store_file.write(value)
+
+
+class IntelStore(Mapping):
+    """Read only mapping of indicator -> values, backed by a memory mapped store file
+
+    Indicators are found with a binary search over the sorted offset table, so
+    lookups are O(log n) and the store is never loaded into the heap.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as store_file:
+            self._mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < _HEADER.size:
+            raise IntelStoreError('Intel store is truncated: {}'.format(path))
+
+        magic, self._count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise IntelStoreError('Invalid intel store: {}'.format(path))
+
+        self.path = path
+
+    def _entry(self, index):
+        """Return the key and the (offset, length) of the value for an entry"""
+        offset = _OFFSET.unpack_from(self._mmap, _HEADER.size + _OFFSET.size * index)[0]
+        key_len, value_len = _ENTRY.unpack_from(self._mmap, offset)
+        key_start = offset + _ENTRY.size
+        value_start = key_start + key_len
+        return self._mmap[key_start:value_start], (value_start, value_len)
+
+    def _find(self, key):
+        """Binary search for an indicator
+
+        Returns:
+            tuple: The (offset, length) of the indicator's value, or None if not found
+        """
+        key = encode_indicator(key)
+        if key is None:
+            return None
+
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key, value = self._entry(middle)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return value
+
+        return None
+
+    def __getitem__(self, key):
+        value = self._find(key)
+        if value is None:
+            raise KeyError(key)
+
+        start, length = value
+        return json.loads(self._mmap[start:start + length])
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        for index in xrange(self._count):
+            yield self._entry(index)[0]
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Unmap the store file"""
+        self._mmap.close()
+
+
+class IntelOverlay(Mapping):
+    """Read only mapping of indicator -> values that applies added and removed
+    indicators on top of a base mapping, such as an IntelStore
+
+    Overlays are never modified. Applying more changes creates a new overlay on
+    the same base, so the base is never copied and lookups against an existing
+    overlay are not affected while a new one is built.
+    """
+
+    def __init__(self, base, added=None, removed=None):
+        self.base = base
+        self.added = added or {}
+        self.removed = removed or frozenset()
+        self._count = (len(base) +
+                       sum(1 for key in self.added if key not in base) -
+                       sum(1 for key in self.removed if key in base))
+
+    def apply(self, adds, removes):
+        """Return a new overlay with more indicators added and removed
+
+        Args:
+            adds (dict): Map of indicator -> list of values to add or replace
+            removes (iterable): Indicators to remove, which are removed before any adds
+
+        Returns:
+            IntelOverlay: The new overlay on the same base
+        """
+        added, removed = dict(self.added), set(self.removed)
+        for key in removes:
+            key = encode_indicator(key)
+            added.pop(key, None)
+            removed.add(key)
+
+        for key, values in adds.iteritems():
+            key = encode_indicator(key)
+            removed.discard(key)
+            added[key] = values
+
+        return IntelOverlay(self.base, added, frozenset(removed))
+
+    def __getitem__(self, key):
+        key = encode_indicator(key)
+        if key is None or key in self.removed:
+            raise KeyError(key)
+
+        if key in self.added:
+            return self.added[key]
+
+        return self.base[key]
+
+    def __contains__(self, key):
+        key = encode_indicator(key)
+        if key is None or key in self.removed:
+            return False
+
+        return key in self.added or key in self.base
+
+    def __iter__(self):
+        for key in self.added:
+            yield key
+
+        for key in self.base:
+            if key not in self.added and key not in self.removed:
+                yield key
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,154 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import deque
+import os
+from Queue import Queue
+import sys
+import threading
+
+from stream_alert.rule_processor import LOGGER
+
+# The number of worker threads used when it is not configured for the cluster
+DEFAULT_IO_WORKERS = 4
+
+
+def io_worker_count():
+    """Return the number of I/O worker threads configured for this function
+
+    The count is set from the cluster's 'rule_processor' config through the
+    IO_WORKERS environment variable of the function.
+
+    Returns:
+        int: The number of worker threads, where 1 or less runs all I/O serially
+    """
+    try:
+        return int(os.environ.get('IO_WORKERS', DEFAULT_IO_WORKERS))
+    except ValueError as err:
+        LOGGER.error('Invalid value for the number of I/O workers, expected an int: %s',
+                     err.message)
+        return DEFAULT_IO_WORKERS
+
+
+class IOWorkerPool(object):
+    """Bounded pool of threads that runs blocking network calls concurrently
+
+    Tasks that are submitted with the same key run one at a time, in the order they
+    were submitted, to keep the ordering of calls to the same stream. Tasks without
+    a key run in any order. Exceptions raised by tasks are logged, and the first
+    one is raised again from `wait` once all of the tasks have finished.
+
+    With a single worker, or less, tasks are run immediately in the calling thread.
+    """
+
+    def __init__(self, max_workers=DEFAULT_IO_WORKERS):
+        self.max_workers = max_workers
+        self._queue = Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._error = None
+
+    def submit(self, func, *args, **kwargs):
+        """Run a function in the pool
+
+        Args:
+            func (callable): The function to run
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function, where the optional 'key'
+                keyword is used by the pool to order tasks for the same key
+        """
+        key = kwargs.pop('key', None)
+        task = (key, func, args, kwargs)
+
+        if self.max_workers <= 1:
+            self._run(task)
+            return
+
+        with self._lock:
+            if key is not None:
+                # Hold the task back if another task for this key is queued or running
+                if key in self._pending:
+                    self._pending[key].append(task)
+                    return
+                self._pending[key] = deque()
+
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+        self._queue.put(task)
+
+    def _run(self, task):
+        """Run a task, storing the first exception raised by any task"""
+        _, func, args, kwargs = task
+        try:
+            func(*args, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception('An error occurred in I/O task %s', func.__name__)
+            with self._lock:
+                if self._error is None:
+                    self._error = sys.exc_info()
+
+    def _work(self):
+        """Worker thread loop, which runs tasks until it receives a None task"""
+        while True:
+            task = self._queue.get()
+            if task is None:
+                self._queue.task_done()
+                return
+
+            self._run(task)
+
+            key = task[0]
+            if key is not None:
+                with self._lock:
+                    pending = self._pending[key]
+                    if pending:
+                        # Queue the next task for this key before this one is done
+                        self._queue.put(pending.popleft())
+                    else:
+                        del self._pending[key]
+
+            self._queue.task_done()
+
+    def wait(self):
+        """Wait for all submitted tasks to finish
+
+        Raises:
+            Exception: The first exception that was raised by a task, if any
+        """
+        self._queue.join()
+
+        error, self._error = self._error, None
+        if error:
+            raise error[0], error[1], error[2]
+
+    def shutdown(self):
+        """Wait for all submitted tasks to finish and stop the worker threads
+
+        Raises:
+            Exception: The first exception that was raised by a task, if any
+        """
+        try:
+            self.wait()
+        finally:
+            for _ in self._workers:
+                self._queue.put(None)
+            for worker in self._workers:
+                worker.join()
+            self._workers = []
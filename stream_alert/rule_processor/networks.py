@@ -0,0 +1,130 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from bisect import bisect_right
+
+from netaddr import IPAddress, IPNetwork
+from netaddr.core import AddrFormatError
+
+from stream_alert.rule_processor import LOGGER
+
+# Maximum number of compiled network sets to cache before the cache is reset
+NETWORK_CACHE_SIZE = 256
+
+# Cache of compiled network sets, keyed by the frozenset of their CIDRs
+_NETWORK_SETS = {}
+
+# Cache of (collection, size, compiled network set), keyed by the id of the collection.
+# The reference to the collection keeps its id from being reused while it is cached.
+_NETWORK_SETS_BY_ID = {}
+
+
+def compile_networks(cidrs):
+    """Compile a collection of CIDRs, or return the cached compiled set
+
+    A collection that is reused, such as a set declared at the module level of
+    a rule file, is found by identity, so lookups do not copy or compare its
+    CIDRs. A collection that is changed in place is compiled again when its size
+    changes. Other collections are cached by content, so a collection that is
+    rebuilt on every call is only compiled once.
+
+    Args:
+        cidrs (iterable): String CIDRs or netaddr.IPNetwork objects
+
+    Returns:
+        NetworkSet: The compiled set of networks
+    """
+    if isinstance(cidrs, NetworkSet):
+        return cidrs
+
+    sized = hasattr(cidrs, '__len__')
+    if sized:
+        cached = _NETWORK_SETS_BY_ID.get(id(cidrs))
+        if cached and cached[0] is cidrs and cached[1] == len(cidrs):
+            return cached[2]
+
+    key = frozenset(cidrs)
+    network_set = _NETWORK_SETS.get(key)
+    if network_set is None:
+        if len(_NETWORK_SETS) >= NETWORK_CACHE_SIZE:
+            _NETWORK_SETS.clear()
+        network_set = _NETWORK_SETS[key] = NetworkSet(key)
+
+    if sized:
+        if len(_NETWORK_SETS_BY_ID) >= NETWORK_CACHE_SIZE:
+            _NETWORK_SETS_BY_ID.clear()
+        _NETWORK_SETS_BY_ID[id(cidrs)] = (cidrs, len(cidrs), network_set)
+
+    return network_set
+
+
+class NetworkSet(object):
+    """A compiled collection of networks for fast IP address lookups
+
+    The networks for each IP version are merged into sorted, non-overlapping
+    integer intervals, so a lookup is a binary search over the interval starts.
+    """
+
+    def __init__(self, cidrs):
+        ranges = {}
+        for cidr in cidrs:
+            try:
+                network = IPNetwork(cidr)
+            except (AddrFormatError, TypeError, ValueError):
+                LOGGER.error('Invalid IP Network: %s', cidr)
+                continue
+            ranges.setdefault(network.version, []).append((network.first, network.last))
+
+        # Map of IP version -> (tuple of interval starts, tuple of interval ends)
+        self._intervals = {}
+        for version, version_ranges in ranges.iteritems():
+            starts, ends = [], []
+            for first, last in sorted(version_ranges):
+                # Merge any interval that overlaps or is adjacent to the previous one
+                if ends and first <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], last)
+                    continue
+                starts.append(first)
+                ends.append(last)
+            self._intervals[version] = (tuple(starts), tuple(ends))
+
+    def __len__(self):
+        """Return the number of merged intervals in this set"""
+        return sum(len(starts) for starts, _ in self._intervals.itervalues())
+
+    def __contains__(self, ip_address):
+        """Check if an IP address is within any network in this set
+
+        Args:
+            ip_address (str or netaddr.IPAddress): IP address to check
+
+        Returns:
+            bool: True if the address is within any of the networks
+        """
+        if not self._intervals:
+            return False
+
+        if not isinstance(ip_address, IPAddress):
+            ip_address = IPAddress(ip_address)
+
+        intervals = self._intervals.get(ip_address.version)
+        if not intervals:
+            return False
+
+        starts, ends = intervals
+        value = int(ip_address)
+        index = bisect_right(starts, value) - 1
+
+        return index >= 0 and value <= ends[index]
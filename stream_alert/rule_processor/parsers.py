@@ -16,7 +16,6 @@ limitations under the License.
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
 import csv
-from fnmatch import fnmatch
 import json
 import re
 import StringIO
@@ -24,10 +23,105 @@ import StringIO
 import jsonpath_rw
 
 from stream_alert.rule_processor import LOGGER, LOGGER_DEBUG_ENABLED
+from stream_alert.rule_processor.patterns import compile_patterns
+from stream_alert.rule_processor.schema import compile_schema, ENVELOPE_KEY
 from stream_alert.shared.stats import time_me
 
 PARSERS = {}
-ENVELOPE_KEY = 'streamalert:envelope_keys'
+
+# Cache of JSONPath expression -> compiled function to find values
+_JSON_PATHS = {}
+# A path segment of one or more comma separated field names, optionally followed by [*]
+_SIMPLE_JSON_PATH_SEGMENT = re.compile(
+    r'^(?P<fields>[a-zA-Z_@][\w@\-]*(?:,[a-zA-Z_@][\w@\-]*)*)(?P<wildcard>\[\*\])?$')
+# Words that have special meaning to jsonpath_rw and cannot be simple field names
+_JSON_PATH_RESERVED_WORDS = {'where'}
+
+
+def compile_json_path(expression):
+    """Compile a JSONPath expression into a function that returns the matched values
+
+    Simple expressions made of field names, unions of field names and [*] wildcards,
+    such as `Records[*]`, `logEvents[*].extractedFields` or `$.key1,key2`, are
+    compiled into direct dict/list lookups. Anything else is handled by jsonpath_rw.
+    Compiled expressions are cached, so this is cheap to call repeatedly.
+
+    Args:
+        expression (str): The JSONPath expression
+
+    Returns:
+        function: Accepts JSON data and returns a list of matched values
+    """
+    if expression not in _JSON_PATHS:
+        _JSON_PATHS[expression] = (_compile_simple_json_path(expression) or
+                                   _compile_jsonpath_rw(expression))
+
+    return _JSON_PATHS[expression]
+
+
+def _compile_jsonpath_rw(expression):
+    """Compile a JSONPath expression using jsonpath_rw"""
+    json_path = jsonpath_rw.parse(expression)
+
+    def find(data):
+        """Return the values matched by the jsonpath_rw expression"""
+        return [match.value for match in json_path.find(data)]
+
+    return find
+
+
+def _compile_simple_json_path(expression):
+    """Compile a simple JSONPath expression to a function that behaves like jsonpath_rw
+
+    Returns:
+        function: Accepts JSON data and returns a list of matched values OR
+            None if the expression is not simple enough to be compiled here
+    """
+    if expression == '$':
+        return lambda data: [data]
+
+    if expression.startswith('$.'):
+        expression = expression[2:]
+
+    steps = []
+    for segment in expression.split('.'):
+        match = _SIMPLE_JSON_PATH_SEGMENT.match(segment)
+        if not match:
+            return
+
+        fields = tuple(match.group('fields').split(','))
+        if _JSON_PATH_RESERVED_WORDS.intersection(fields):
+            return
+
+        steps.append((fields, bool(match.group('wildcard'))))
+
+    def find(data):
+        """Return the values matched by walking the compiled steps"""
+        values = [data]
+        for fields, wildcard in steps:
+            matched_values = []
+            for value in values:
+                for field in fields:
+                    try:
+                        matched_values.append(value[field])
+                    except (TypeError, KeyError, AttributeError):
+                        continue
+
+            if wildcard:
+                values = []
+                for value in matched_values:
+                    if isinstance(value, list):
+                        values.extend(value)
+                    # jsonpath_rw treats a single value as a list of one
+                    elif isinstance(value, (dict, basestring, int, long)):
+                        values.append(value)
+            else:
+                values = matched_values
+
+        return values
+
+    return find
+
 
 def parser(cls):
     """Class decorator to register parsers"""
@@ -101,8 +195,7 @@ class ParserBase:
                              'for this record: %s', field, record)
                 continue
             # Append the result of any of the log_patterns being True
-            pattern_result.append(any(fnmatch(value, pattern)
-                                      for pattern in pattern_list))
+            pattern_result.append(compile_patterns(pattern_list).matches(value))
 
         all_patterns_result = all(pattern_result)
         LOGGER.debug('%s log pattern match result: %s', self.type(), all_patterns_result)
@@ -117,6 +210,23 @@ class JSONParser(ParserBase):
     __parserid__ = 'json'
     __regex = re.compile(r'(?P<json_blob>{.+[:,].+}|\[.+[,:].+\])')
 
+    def __init__(self, options):
+        """Compile the JSONPath expressions used by this parser's options
+
+        Args:
+            options (dict): Parser options - json_path, envelope_keys, etc
+        """
+        super(JSONParser, self).__init__(options)
+
+        json_path_expression = self.options.get('json_path')
+        self._records_json_path = (compile_json_path(json_path_expression)
+                                   if json_path_expression else None)
+
+        envelope_schema = self.options.get('envelope_keys')
+        self._envelope_keys = envelope_schema.keys() if envelope_schema else []
+        self._envelope_json_path = (compile_json_path('$.' + ','.join(self._envelope_keys))
+                                    if self._envelope_keys else None)
+
     def _key_check(self, schema, json_records):
         """Verify the declared schema matches the json payload
 
@@ -124,37 +234,31 @@ class JSONParser(ParserBase):
         passed in json_records list
 
         Args:
+            schema (dict): The log schema, which is compiled here if it is not already
             json_records (list): List of dictionaries representing JSON payloads
 
         Returns:
             bool: True if any log in the list matches the schema, False if not
         """
-        schema_keys = set(schema.keys())
+        compiled_schema = compile_schema(schema)
         LOGGER.debug('Key checking %d records', len(json_records))
 
         # Because elements are deleted off of json_records during
         # iteration, this block uses a reverse range.
         for index in reversed(range(len(json_records))):
-            schema_match = False
-            json_keys = set(json_records[index].keys())
-            if json_keys == schema_keys:
-                schema_match = True
-                for key, key_type in schema.iteritems():
-                    if key == 'streamalert:envelope_keys' and isinstance(
-                            json_records[index][key], dict):
-                        continue
-                    # Nested key check
-                    if key_type and isinstance(key_type, dict):
-                        schema_match = self._key_check(schema[key], [json_records[index][key]])
+            if compiled_schema.validate(json_records[index]):
+                continue
 
-            if not schema_match:
-                if LOGGER_DEBUG_ENABLED:
-                    LOGGER.debug('Schema: \n%s', json.dumps(schema, indent=2))
-                    LOGGER.debug(
-                        'Key check failure: \n%s', json.dumps(json_records[index], indent=2))
+            if LOGGER_DEBUG_ENABLED:
+                LOGGER.debug('Schema: \n%s', json.dumps(schema, indent=2))
+                LOGGER.debug(
+                    'Key check failure: \n%s', json.dumps(json_records[index], indent=2))
+                if isinstance(json_records[index], dict):
                     LOGGER.debug(
-                        'Missing keys in record: %s', json.dumps(list(json_keys ^ schema_keys)))
-                del json_records[index]
+                        'Missing keys in record: %s',
+                        json.dumps(list(set(json_records[index]) ^
+                                        compiled_schema.key_signature)))
+            del json_records[index]
 
         return bool(json_records)
 
@@ -208,15 +312,22 @@ class JSONParser(ParserBase):
         fields present on the root record can be merged into child events
         using the `envelope_keys` option.
 
+        The json_payload may be shared with other parsers, so it is never modified.
+        Any record that is returned is a shallow copy that can safely have keys added.
+
         Args:
             json_payload (dict): The parsed json data
 
         Returns:
             list: A list of JSON recrods extracted via JSONPath.
         """
+        # Only JSON objects can be matched against a schema
+        if not isinstance(json_payload, dict):
+            return False
+
         # Check options and return the payload if there is nothing special to do
         if not self.options:
-            return [json_payload]
+            return [dict(json_payload)]
 
         envelope_schema = self.options.get('envelope_keys')
         optional_envelope_keys = self.options.get('optional_envelope_keys')
@@ -229,33 +340,34 @@ class JSONParser(ParserBase):
                 if key not in json_payload:
                     missing_keys_schema[key] = envelope_schema[key]
             if missing_keys_schema:
+                json_payload = dict(json_payload)
                 self._add_optional_keys([json_payload], envelope_schema, missing_keys_schema)
 
         # If the envelope schema is defined and all envelope keys are required
         # to be present in the record.
         elif envelope_schema and not all(x in json_payload for x in envelope_schema):
-            return [json_payload]
+            return [dict(json_payload)]
 
         envelope = {}
         if envelope_schema:
             LOGGER.debug('Parsing envelope keys')
-            schema.update({ENVELOPE_KEY: envelope_schema})
-            envelope_keys = envelope_schema.keys()
-            envelope_jsonpath = jsonpath_rw.parse("$." + ",".join(envelope_keys))
-            envelope_matches = [match.value for match in envelope_jsonpath.find(json_payload)]
-            envelope = dict(zip(envelope_keys, envelope_matches))
+            # Compiled schemas already include the envelope
+            if ENVELOPE_KEY not in schema:
+                schema.update({ENVELOPE_KEY: envelope_schema})
+            envelope_matches = self._envelope_json_path(json_payload)
+            envelope = dict(zip(self._envelope_keys, envelope_matches))
 
         json_records = []
-        json_path_expression = self.options.get('json_path')
         # Handle jsonpath extraction of records
-        if json_path_expression:
+        if self._records_json_path:
             LOGGER.debug('Parsing records with JSONPath')
-            records_jsonpath = jsonpath_rw.parse(json_path_expression)
-            matches = records_jsonpath.find(json_payload)
+            matches = self._records_json_path(json_payload)
             if not matches:
                 return False
             for match in matches:
-                record = match.value
+                if not isinstance(match, dict):
+                    continue
+                record = dict(match)
                 if envelope:
                     record.update({ENVELOPE_KEY: envelope})
                 json_records.append(record)
@@ -285,34 +397,48 @@ class JSONParser(ParserBase):
 
         # If the final parsed record is singular
         if not json_records:
-            json_records.append(json_payload)
+            json_records.append(dict(json_payload))
 
         return json_records
 
+    @staticmethod
+    def decode(data):
+        """Decode a JSON string so it can be shared by multiple calls to `parse`
+
+        Args:
+            data (str|dict): Raw JSON string, or data that has already been decoded
+
+        Returns:
+            The decoded data OR None if the data is not valid JSON
+        """
+        if not isinstance(data, (unicode, str)):
+            return data
+
+        try:
+            return json.loads(data)
+        except ValueError as err:
+            LOGGER.debug('JSON parse failed: %s', str(err))
+            LOGGER.debug('JSON parse could not load data: %s', str(data))
+            return
+
     @time_me
     def parse(self, schema, data):
         """Parse a string into a list of JSON payloads.
 
         Args:
             schema (dict): Parsing schema.
-            data (str|dict): Data to be parsed.
+            data (str|dict): Data to be parsed. Data that has already been decoded,
+                such as the result of `decode`, is not modified by parsing.
 
         Returns:
             list: A list of dictionaries representing parsed records OR
             False if the data is not JSON or the data does not follow the schema.
         """
-        if isinstance(data, (unicode, str)):
-            try:
-                loaded_data = json.loads(data)
-            except ValueError as err:
-                LOGGER.debug('JSON parse failed: %s', str(err))
-                LOGGER.debug('JSON parse could not load data: %s', str(data))
-                return False
-            else:
-                json_records = self._parse_records(schema, loaded_data)
-        else:
-            json_records = self._parse_records(schema, data)
+        loaded_data = self.decode(data)
+        if loaded_data is None:
+            return False
 
+        json_records = self._parse_records(schema, loaded_data)
         if not json_records:
             return False
 
@@ -0,0 +1,120 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import fnmatch
+import re
+
+# Characters that make a pattern a glob for fnmatch, rather than a literal value
+_GLOB_CHARS = frozenset('*?[')
+
+# The suffix that fnmatch.translate adds to every translated pattern
+_TRANSLATE_SUFFIX = r'\Z(?ms)'
+
+# Maximum number of compiled pattern sets to cache before the cache is reset
+PATTERN_CACHE_SIZE = 1024
+
+# Cache of compiled pattern sets, keyed by the frozenset of their patterns
+_PATTERN_SETS = {}
+
+# Cache of (collection, size, compiled pattern set), keyed by the id of the collection.
+# The reference to the collection keeps its id from being reused while it is cached.
+_PATTERN_SETS_BY_ID = {}
+
+
+def compile_patterns(patterns):
+    """Compile a collection of fnmatch patterns, or return the cached compiled set
+
+    A collection that is reused, such as a whitelist declared at the module level
+    of a rule file, is found by identity, so lookups do not copy or compare its
+    patterns. A collection that is changed in place is compiled again when its
+    size changes. Other collections are cached by content, so a set of patterns
+    that is rebuilt on every call, such as a set declared within a rule function,
+    is only compiled once.
+
+    Args:
+        patterns (iterable): Literal values and/or fnmatch glob patterns
+
+    Returns:
+        PatternSet: The compiled set of patterns
+    """
+    if isinstance(patterns, PatternSet):
+        return patterns
+
+    sized = hasattr(patterns, '__len__')
+    if sized:
+        cached = _PATTERN_SETS_BY_ID.get(id(patterns))
+        if cached and cached[0] is patterns and cached[1] == len(patterns):
+            return cached[2]
+
+    key = frozenset(patterns)
+    pattern_set = _PATTERN_SETS.get(key)
+    if pattern_set is None:
+        if len(_PATTERN_SETS) >= PATTERN_CACHE_SIZE:
+            _PATTERN_SETS.clear()
+        pattern_set = _PATTERN_SETS[key] = PatternSet(key)
+
+    if sized:
+        if len(_PATTERN_SETS_BY_ID) >= PATTERN_CACHE_SIZE:
+            _PATTERN_SETS_BY_ID.clear()
+        _PATTERN_SETS_BY_ID[id(patterns)] = (patterns, len(patterns), pattern_set)
+
+    return pattern_set
+
+
+def _translate(pattern):
+    """Translate an fnmatch pattern into a regex that can be merged with others"""
+    regex = fnmatch.translate(pattern)
+    if regex.endswith(_TRANSLATE_SUFFIX):
+        return regex[:-len(_TRANSLATE_SUFFIX)]
+
+    return regex
+
+
+class PatternSet(object):
+    """A compiled collection of fnmatch patterns
+
+    Literal values are kept in a frozenset for constant time membership checks,
+    and all glob patterns are merged into a single precompiled regex. Matching a
+    value is equivalent to `any(fnmatch(value, pattern) for pattern in patterns)`.
+    """
+
+    def __init__(self, patterns):
+        literals, globs = set(), []
+        for pattern in patterns:
+            if isinstance(pattern, basestring) and not _GLOB_CHARS.isdisjoint(pattern):
+                globs.append(pattern)
+            else:
+                literals.add(pattern)
+
+        self.literals = frozenset(literals)
+        self.globs = tuple(sorted(globs))
+        self._regex = None
+        if self.globs:
+            self._regex = re.compile(
+                r'(?ms)(?:%s)\Z' % '|'.join(_translate(glob) for glob in self.globs))
+
+    def matches(self, value):
+        """Check if a value matches any of the patterns in this set
+
+        Args:
+            value (str): The value to check
+
+        Returns:
+            bool: True if the value is one of the literals or matches any glob
+        """
+        if value in self.literals:
+            return True
+
+        return bool(self._regex and self._regex.match(value))
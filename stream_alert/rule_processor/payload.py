@@ -17,25 +17,63 @@ from abc import ABCMeta, abstractmethod, abstractproperty
 from logging import DEBUG as LOG_LEVEL_DEBUG
 from urllib import unquote
 import base64
-import gzip
-import os
-import tempfile
+import itertools
 import time
 import zlib
 
 import boto3
 
 from stream_alert.rule_processor import FUNCTION_NAME, LOGGER
+from stream_alert.rule_processor.checkpoint import S3Checkpoint
 from stream_alert.shared.metrics import MetricLogger
 
+# The size of the chunks read from the body of S3 objects
+S3_READ_CHUNK_SIZE = 1024 * 1024
+# The leading bytes of gzipped data
+GZIP_MAGIC = '\x1f\x8b'
+# Window bits that make zlib expect a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# Reading of an S3 object stops once this fraction of the function's timeout is
+# left in the invocation, leaving time to send the buffered alerts and records
+S3_RESERVED_TIME_FRACTION = 0.2
+# The most time reserved at the end of an invocation, in milliseconds
+S3_MAX_RESERVED_TIME_MS = 5 * 1000
+# The number of lines read between checks of the remaining time
+S3_TIME_CHECK_INTERVAL = 100
+# The number of lines skipped between checks of the remaining time, when skipping
+# the lines of a resumed gzip member, which is much cheaper than processing them
+S3_SKIP_TIME_CHECK_INTERVAL = 10000
+# The key of the checkpoint in the raw records of continuation invocations
+S3_CHECKPOINT_KEY = 'streamalert_checkpoint'
+
+
+class S3ResumeError(Exception):
+    """Exception indicating a continuation could not get back to its checkpoint in time"""
+
+
+def s3_reserved_time(timeout_ms):
+    """Get the time to reserve at the end of an invocation for a function timeout
 
-def load_stream_payload(service, entity, raw_record):
+    Args:
+        timeout_ms (int): The timeout of the function, in milliseconds
+
+    Returns:
+        int: The milliseconds to reserve after reading S3 objects
+    """
+    return min(S3_MAX_RESERVED_TIME_MS, int(timeout_ms * S3_RESERVED_TIME_FRACTION))
+
+
+def load_stream_payload(service, entity, raw_record, **kwargs):
     """Returns the right StreamPayload subclass for this service
 
     Args:
         service (str): service name to load class for
         entity (str): entity for this service
         raw_record (str): record raw payload data
+
+    Keyword Args:
+        Any additional options for the payload class, such as the remaining
+        time and checkpoint store used by S3 payloads
     """
     payload_map = {'s3': S3Payload,
                    'sns': SnsPayload,
@@ -46,7 +84,7 @@ def load_stream_payload(service, entity, raw_record):
         LOGGER.error('Service payload not supported: %s', service)
         return
 
-    return payload_map[service](raw_record=raw_record, entity=entity)
+    return payload_map[service](raw_record=raw_record, entity=entity, **kwargs)
 
 
 class StreamPayload(object):
@@ -66,6 +104,15 @@ class StreamPayload(object):
         type (str): The data type of the record - json, csv, syslog, etc.
 
         valid (bool): Whether the record is deemed valid by parsing and classification.
+
+        normalized_types (dict): The normalized types declared for the log in types.json.
+
+        normalized_paths (NormalizedPaths): The precomputed key paths of the normalized
+            types in the log's schema, used to build each record's normalization view.
+
+        sticky_log: The step of the classification plan that matched a previous record
+            in this payload, which the classifier tries first for the following records.
+            This is only useful for multi-record payloads, such as S3 objects.
     """
     __metaclass__ = ABCMeta
 
@@ -77,6 +124,7 @@ class StreamPayload(object):
         self.raw_record = kwargs['raw_record']
         self.entity = kwargs['entity']
         self.pre_parsed_record = None
+        self.sticky_log = None
 
         self._refresh_record(None)
 
@@ -127,19 +175,56 @@ class StreamPayload(object):
         self.records = None
         self.type = None
         self.valid = False
-
-
-class S3ObjectSizeError(Exception):
-    """Exception indicating the S3 object is too large to process"""
+        self.normalized_types = None
+        self.normalized_paths = None
 
 
 class S3Payload(StreamPayload):
-    """S3Payload class"""
+    """S3Payload class
+
+    Objects too large to read before the Lambda function runs out of time are
+    processed in chunks. Reading stops at a line boundary once the remaining
+    time drops below the reserved time, and the position to resume from is
+    kept as the `checkpoint` of the payload, so a continuation invocation can
+    read the rest of the object with a ranged GetObject request. Resuming from
+    within a gzip member replays it from its start, skipping the lines that
+    were already processed.
+    """
     s3_object_size = 0
+    _start_time = 0.0
+    _download_time = 0.0
+    _object_id = None
+    _resume_offset = 0
+    _resume_lines = 0
+    _skip_lines = 0
+
+    def __init__(self, **kwargs):
+        """
+        Keyword Args:
+            remaining_time (callable): Optional function that returns the number of
+                milliseconds left in the current invocation
+            reserved_time (int): The milliseconds to leave at the end of the
+                invocation, see s3_reserved_time
+            checkpoint_store (S3CheckpointStore): Optional store to persist the
+                progress made reading large objects
+        """
+        super(S3Payload, self).__init__(**kwargs)
+        self._remaining_time = kwargs.get('remaining_time')
+        self._reserved_time = kwargs.get('reserved_time', S3_MAX_RESERVED_TIME_MS)
+        self._checkpoint_store = kwargs.get('checkpoint_store')
+        self.checkpoint = None
 
     def service(self):
         return 's3'
 
+    def continuation_record(self):
+        """Build the raw record used to continue reading this object in a new invocation
+
+        Returns:
+            dict: The S3 raw record with the checkpoint to resume from embedded
+        """
+        return dict(self.raw_record, **{S3_CHECKPOINT_KEY: self.checkpoint._asdict()})
+
     def pre_parse(self):
         """Pre-parsing method for S3 objects that will download the s3 object,
         open it for reading and iterate over lines (records) in the file.
@@ -152,9 +237,10 @@ class S3Payload(StreamPayload):
                 returning a generator, providing the ability to support
                 multi-record like this (s3).
         """
-        s3_file = self._get_object()
+        s3_object = self._get_object()
         line_num, processed_size = 0, 0
-        for line_num, data in self._read_downloaded_s3_object(s3_file):
+        self.sticky_log = None
+        for line_num, data in self._read_s3_object(s3_object):
 
             self._refresh_record(data)
             yield self
@@ -182,53 +268,63 @@ class S3Payload(StreamPayload):
 
         MetricLogger.log_metric(FUNCTION_NAME, MetricLogger.TOTAL_S3_RECORDS, line_num)
 
-    def _download_object(self, region, bucket, key):
-        """Download an object from S3.
-
-        Verifies the S3 object is less than or equal to 128MB, and
-        downloads it into a temp file.  Lambda can only execute for a
-        maximum of 300 seconds, and the file to download
-        greatly impacts that time.
+    def _open_object(self, region, bucket, key, offset=0):
+        """Open a streaming read of an object from S3.
 
         Args:
             region (str): AWS region to use for boto client instance.
-            bucket (str): S3 bucket to download object from.
+            bucket (str): S3 bucket to read object from.
             key (str): Key of s3 object.
+            offset (int): The byte offset to start reading the object from.
 
         Returns:
-            str: The downloaded path of the S3 object.
+            botocore.response.StreamingBody: The body of the S3 object.
         """
         size_kb = self.s3_object_size / 1024.0
         size_mb = size_kb / 1024.0
-        if size_mb > 128:
-            raise S3ObjectSizeError('S3 object to download is above 128MB')
-
-        LOGGER.debug(os.popen('df -h /tmp | tail -1').read().strip())
-
         display_size = '{}MB'.format(size_mb) if size_mb else '{}KB'.format(size_kb)
 
         LOGGER.info('Starting download from S3: %s/%s [%s]', bucket, key, display_size)
 
-        suffix = key.replace('/', '-')
-        _, downloaded_s3_object = tempfile.mkstemp(suffix=suffix)
-        with open(downloaded_s3_object, 'wb') as data:
-            client = boto3.client('s3', region_name=region)
-            start_time = time.time()
-            client.download_fileobj(bucket, key, data)
+        request = {'Bucket': bucket, 'Key': key}
+        if offset:
+            LOGGER.info('Resuming read of S3 object from byte offset %d', offset)
+            request['Range'] = 'bytes={}-'.format(offset)
+
+        self._start_time = time.time()
+        client = boto3.client('s3', region_name=region)
+        return client.get_object(**request)['Body']
+
+    def _load_checkpoint(self):
+        """Find the position to start reading the object from
 
-        total_time = time.time() - start_time
-        LOGGER.info('Completed download in %s seconds', round(total_time, 2))
+        Only continuation invocations resume from a checkpoint. The checkpoint
+        embedded in their raw record is compared with the one in the checkpoint
+        store, which is only shared by invocations that reuse the same container,
+        and the furthest one is used. New notifications and retries for an object
+        always read it from the start, so they never skip records based on a
+        checkpoint left in the store by an earlier read of the same object.
+
+        Returns:
+            S3Checkpoint: The position to start reading from
+        """
+        embedded = self.raw_record.get(S3_CHECKPOINT_KEY)
+        if not embedded:
+            return S3Checkpoint(0, 0)
 
-        # Log a metric on how long this object took to download
-        MetricLogger.log_metric(FUNCTION_NAME, MetricLogger.S3_DOWNLOAD_TIME, total_time)
+        checkpoint = S3Checkpoint(embedded['offset'], embedded['skip_lines'])
+        if self._checkpoint_store:
+            stored = self._checkpoint_store.load(self._object_id)
+            if stored:
+                checkpoint = max(checkpoint, stored)
 
-        return downloaded_s3_object
+        return checkpoint
 
     def _get_object(self):
-        """Given an S3 record, download and parse the data.
+        """Given an S3 record, open the object for reading.
 
         Returns:
-            str: Path to the downloaded s3 object.
+            botocore.response.StreamingBody: The body of the S3 object.
         """
         # Use the urllib unquote method to decode any url encoded characters
         # (ie - %26 --> &) from the bucket and key names
@@ -242,38 +338,179 @@ class S3Payload(StreamPayload):
         LOGGER.debug('Pre-parsing record from S3. Bucket: %s, Key: %s, Size: %d',
                      bucket, key, self.s3_object_size)
 
-        return self._download_object(region, bucket, key)
+        # The eTag changes if the object is overwritten, which invalidates any checkpoint
+        self._object_id = u'{}/{}:{}'.format(
+            bucket, key, self.raw_record['s3']['object'].get('eTag', ''))
+        self._resume_offset, self._skip_lines = self._load_checkpoint()
 
-    @staticmethod
-    def _read_downloaded_s3_object(s3_object):
-        """Read lines from a downloaded file from S3
+        return self._open_object(region, bucket, key, self._resume_offset)
 
-        Supports reading both gzipped files and plaintext files.
+    def _read_chunks(self, s3_object):
+        """Read the body of an S3 object in chunks, timing how long is spent waiting on S3
 
         Args:
-            s3_object (str): A full path to the downloaded file.
+            s3_object (botocore.response.StreamingBody): The body of the S3 object.
 
         Yields:
-            (str) Lines from the downloaded s3 object.
+            str: Chunks of the raw data of the S3 object.
         """
-        _, extension = os.path.splitext(s3_object)
+        try:
+            while True:
+                read_start = time.time()
+                chunk = s3_object.read(S3_READ_CHUNK_SIZE)
+                self._download_time += time.time() - read_start
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            s3_object.close()
+
+    def _read_lines(self, chunks, gzipped):
+        """Split the data of an S3 object into lines as it is read, tracking the position
+
+        When each line is yielded, `_resume_offset` and `_resume_lines` hold the
+        position of the start of that line, which is where reading can resume from.
+        Decompression can only restart at the start of a gzip member, so for
+        gzipped objects the offset is that of the last gzip member that started on
+        a line boundary, and the lines are those read since. Objects with multiple
+        gzip members, such as concatenated gzip files, are decompressed one member
+        after the other.
 
-        if extension == '.gz':
-            for num, line in enumerate(gzip.open(s3_object, 'r'), start=1):
-                yield num, line.rstrip()
-        else:
-            for num, line in enumerate(open(s3_object, 'r'), start=1):
-                yield num, line.rstrip()
+        Args:
+            chunks (iterable): Chunks of the raw data of the S3 object.
+            gzipped (bool): True if the data is gzipped.
 
-        # AWS Lambda apparently does not reallocate disk space when files are
-        # removed using os.remove(), so we must truncate them before removal
-        open(s3_object, 'w')
+        Yields:
+            str: Lines of data, without the trailing whitespace.
+        """
+        self._resume_lines = 0
+        decompressor = zlib.decompressobj(GZIP_WBITS) if gzipped else None
+        read_offset = self._resume_offset
+        remainder = ''
+        for chunk in chunks:
+            read_offset += len(chunk)
+            while chunk:
+                member_end = None
+                if decompressor:
+                    data = decompressor.decompress(chunk)
+
+                    # Any data after the end of a gzip member is the start of the next one
+                    chunk = decompressor.unused_data
+                    if chunk:
+                        data += decompressor.flush()
+                        decompressor = zlib.decompressobj(GZIP_WBITS)
+                        member_end = read_offset - len(chunk)
+                else:
+                    data, chunk = chunk, ''
+
+                lines = (remainder + data).split('\n')
+                remainder = lines.pop()
+                for line in lines:
+                    yield line.rstrip()
+                    if gzipped:
+                        self._resume_lines += 1
+                    else:
+                        self._resume_offset += len(line) + 1
+
+                if member_end is not None and not remainder:
+                    self._resume_offset, self._resume_lines = member_end, 0
+
+        if decompressor:
+            remainder += decompressor.flush()
+
+        lines = remainder.split('\n')
+        if not lines[-1]:
+            lines.pop()
+        for line in lines:
+            yield line.rstrip()
+
+    def _out_of_time(self):
+        """Check if reading should stop to leave time to finish the invocation
 
-        os.remove(s3_object)
-        if not os.path.exists(s3_object):
-            LOGGER.debug('Removed temp S3 file: %s', s3_object)
+        Returns:
+            bool: True if the remaining time of the invocation is below the reserve
+        """
+        return bool(self._remaining_time) and self._remaining_time() < self._reserved_time
+
+    def _read_s3_object(self, s3_object):
+        """Read lines from the body of an S3 object while it is being downloaded
+
+        Supports reading both gzipped and plaintext objects. Records are
+        yielded as soon as the chunk holding them is read, so processing
+        of the object overlaps with its download. If the invocation runs low
+        on time, reading stops and the position to resume from is saved as
+        the checkpoint of this payload.
+
+        Args:
+            s3_object (botocore.response.StreamingBody): The body of the S3 object.
+
+        Yields:
+            (str) Lines from the s3 object.
+        """
+        self._download_time = 0.0
+        self.checkpoint = None
+        resumed = bool(self._resume_offset or self._skip_lines)
+        chunks = self._read_chunks(s3_object)
+
+        first_chunk = next(chunks, '')
+        chunks = itertools.chain([first_chunk], chunks)
+        gzipped = first_chunk.startswith(GZIP_MAGIC)
+
+        num, skipped = 0, 0
+        for line in self._read_lines(chunks, gzipped):
+            # Skip the lines of a resumed gzip member that were already processed
+            if skipped < self._skip_lines:
+                skipped += 1
+                if (skipped % S3_SKIP_TIME_CHECK_INTERVAL == 0 and
+                        skipped < self._skip_lines and self._out_of_time()):
+                    # No progress can be made, so fail the invocation rather than
+                    # dropping the rest of the object
+                    MetricLogger.log_metric(FUNCTION_NAME, MetricLogger.S3_RESUME_FAILURES, 1)
+                    raise S3ResumeError(
+                        'Ran out of time skipping the {} lines already read from S3 object '
+                        '{}'.format(self._skip_lines, self._object_id))
+                continue
+
+            # Always make progress, even if the invocation started low on time
+            if num and num % S3_TIME_CHECK_INTERVAL == 0 and self._out_of_time():
+                self._save_checkpoint()
+                break
+
+            num += 1
+            if num == 1:
+                MetricLogger.log_metric(FUNCTION_NAME,
+                                        MetricLogger.S3_TIME_TO_FIRST_RECORD,
+                                        time.time() - self._start_time)
+            yield num, line
+        else:
+            if resumed:
+                self._clear_checkpoint()
+
+        total_time = time.time() - self._start_time
+        if self.checkpoint:
+            LOGGER.info('Stopped reading S3 object at byte offset %d after %s seconds, '
+                        'the rest will be processed by a new invocation',
+                        self.checkpoint.offset, round(self._download_time, 2))
         else:
-            LOGGER.error('Failed to remove temp S3 file: %s', s3_object)
+            LOGGER.info('Completed download in %s seconds', round(self._download_time, 2))
+        LOGGER.debug('Read %d lines from S3 in %s seconds', num, round(total_time, 2))
+
+        # Log metrics on how long this object took to download and read
+        MetricLogger.log_metric(FUNCTION_NAME,
+                                MetricLogger.S3_DOWNLOAD_TIME,
+                                self._download_time)
+        MetricLogger.log_metric(FUNCTION_NAME, MetricLogger.S3_READ_DURATION, total_time)
+
+    def _save_checkpoint(self):
+        """Save the position of the next line to read as the checkpoint of this payload"""
+        self.checkpoint = S3Checkpoint(self._resume_offset, self._resume_lines)
+        if self._checkpoint_store and self._object_id:
+            self._checkpoint_store.save(self._object_id, self.checkpoint)
+
+    def _clear_checkpoint(self):
+        """Remove the stored checkpoint once a resumed object has been fully read"""
+        if self._checkpoint_store and self._object_id:
+            self._checkpoint_store.clear(self._object_id)
 
 
 class SnsPayload(StreamPayload):
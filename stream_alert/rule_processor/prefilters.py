@@ -0,0 +1,156 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import defaultdict
+
+from stream_alert.rule_processor.patterns import compile_patterns
+
+# Sentinel for a field that is not in a record, since None is a valid value
+_MISSING = object()
+
+
+def _field_value(record, path):
+    """Return the value of a field in a record, or _MISSING if it is not present
+
+    Args:
+        record (dict): A parsed record
+        path (tuple): The keys of the field, where all but the last key are maps
+
+    Returns:
+        The value of the field in the record, or _MISSING
+    """
+    for key in path:
+        if not isinstance(record, dict) or key not in record:
+            return _MISSING
+        record = record[key]
+
+    return record
+
+
+def _matches(pattern_set, value):
+    """Check if a field value matches a compiled set of patterns"""
+    if value is _MISSING:
+        return False
+
+    try:
+        return pattern_set.matches(value)
+    except TypeError:
+        # Unhashable values, such as maps and lists, can not be literals and
+        # non-string values can not match a glob
+        return False
+
+
+class Prefilter(object):
+    """The compiled prefilter declared for a rule
+
+    A prefilter maps record fields to the value, or collection of values, that
+    the field must equal for the rule to be evaluated. String values containing
+    fnmatch glob characters (*, ? or [) are matched as globs. A field is either a
+    top level key or a tuple of keys for a nested field. All of the fields must
+    match, and a record that does not contain a field never matches.
+
+    The first field, in sorted order, whose values are all literals is used to
+    dispatch records to the rule by value. Any other fields are checked after.
+
+    Example:
+        Prefilter({'eventName': ['ConsoleLogin', 'AssumeRole*'],
+                   ('userIdentity', 'type'): 'Root'})
+    """
+
+    def __init__(self, prefilter):
+        predicates = []
+        for field, values in sorted(prefilter.iteritems()):
+            path = field if isinstance(field, tuple) else (field,)
+            if not isinstance(values, (list, set, frozenset, tuple)):
+                values = [values]
+            predicates.append((path, compile_patterns(values)))
+
+        self.predicates = tuple(predicates)
+        self.dispatch = None
+        self._residual = self.predicates
+        for index, (path, pattern_set) in enumerate(self.predicates):
+            if not pattern_set.globs:
+                self.dispatch = (path, pattern_set.literals)
+                self._residual = self.predicates[:index] + self.predicates[index + 1:]
+                break
+
+    def matches(self, record, dispatched=False):
+        """Check if a record matches this prefilter
+
+        Args:
+            record (dict): A parsed record
+            dispatched (bool): True if the record was already matched on the
+                dispatch field, so only the remaining fields need to be checked
+
+        Returns:
+            bool: True if the rule should be evaluated against this record
+        """
+        predicates = self._residual if dispatched else self.predicates
+        return all(_matches(pattern_set, _field_value(record, path))
+                   for path, pattern_set in predicates)
+
+
+class PrefilterIndex(object):
+    """Index of the prefilters for the rules of a log source
+
+    Prefilters with a dispatch field are indexed by field, then by value, so a
+    record only reaches the prefilters of the rules that can match its value for
+    each indexed field. Prefilters that only use globs are checked for every record.
+    """
+
+    def __init__(self, prefilters):
+        """
+        Args:
+            prefilters (dict): Rule names mapped to their Prefilter
+        """
+        dispatch, scan = defaultdict(lambda: defaultdict(list)), []
+        for rule_name, prefilter in sorted(prefilters.iteritems()):
+            if not prefilter.dispatch:
+                scan.append((rule_name, prefilter))
+                continue
+
+            path, values = prefilter.dispatch
+            for value in values:
+                dispatch[path][value].append((rule_name, prefilter))
+
+        self.rule_names = frozenset(prefilters)
+        self._dispatch = tuple((path, dict(rules_by_value))
+                               for path, rules_by_value in sorted(dispatch.iteritems()))
+        self._scan = tuple(scan)
+
+    def candidates(self, record):
+        """Return the names of the prefiltered rules that should process a record
+
+        Args:
+            record (dict): A parsed record
+
+        Returns:
+            set: The names of the rules whose prefilter matches the record
+        """
+        rule_names = set()
+        for path, rules_by_value in self._dispatch:
+            value = _field_value(record, path)
+            try:
+                rules = rules_by_value.get(value, ())
+            except TypeError:
+                continue
+
+            rule_names.update(rule_name for rule_name, prefilter in rules
+                              if prefilter.matches(record, dispatched=True))
+
+        rule_names.update(rule_name for rule_name, prefilter in self._scan
+                          if prefilter.matches(record))
+
+        return rule_names
@@ -0,0 +1,156 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+from operator import attrgetter
+
+from stream_alert.rule_processor import LOGGER
+
+# Invocations of a rule that take at least this long are logged as slow by default
+DEFAULT_SLOW_RULE_THRESHOLD_MS = 100
+
+# The default number of slow rules to log for each invocation of the function
+DEFAULT_TOP_RULES = 5
+
+
+class _CostEntry(object):
+    """Accumulated cost of a single rule or matcher"""
+    __slots__ = ('name', 'invocations', 'hits', 'errors', 'total_time', 'max_time',
+                 'sample_record_size')
+
+    def __init__(self, name):
+        self.name = name
+        self.invocations = 0
+        self.hits = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.sample_record_size = None
+
+    def to_dict(self):
+        """Return the entry as a dictionary of values that can be logged"""
+        return {
+            'invocations': self.invocations,
+            'hit_rate': round(float(self.hits) / self.invocations, 4),
+            'errors': self.errors,
+            'total_ms': round(self.total_time * 1000, 3),
+            'max_ms': round(self.max_time * 1000, 3)
+        }
+
+
+class RuleStats(object):
+    """Per-rule cost accounting for the rules and matchers run by the rules engine
+
+    Stats are accumulated for each invocation of the function and then logged
+    as a single structured log line, along with the slowest rules that exceeded
+    the slow rule threshold. The size of the record is sampled for the slowest
+    invocation of each slow rule, so records are only serialized for slow rules.
+    """
+
+    def __init__(self, slow_rule_threshold_ms=DEFAULT_SLOW_RULE_THRESHOLD_MS,
+                 top_rules=DEFAULT_TOP_RULES):
+        """
+        Args:
+            slow_rule_threshold_ms (float): Invocations of a rule that take at least this
+                many milliseconds are considered slow
+            top_rules (int): The maximum number of slow rules to log
+        """
+        self.slow_rule_threshold = slow_rule_threshold_ms / 1000.0
+        self.top_rules = top_rules
+        self.rules = {}
+        self.matchers = {}
+
+    def reset(self):
+        """Clear the accumulated stats"""
+        self.rules = {}
+        self.matchers = {}
+
+    @staticmethod
+    def _entry(entries, name):
+        """Return the entry for a name, adding a new one if it does not exist"""
+        entry = entries.get(name)
+        if entry is None:
+            entry = entries[name] = _CostEntry(name)
+        return entry
+
+    def record_rule(self, rule_name, elapsed, hit, error, record):
+        """Add an invocation of a rule to its stats
+
+        Args:
+            rule_name (str): The name of the rule
+            elapsed (float): The wall time of the invocation, in seconds
+            hit (bool): True if the rule returned a result that triggers an alert
+            error (bool): True if the rule raised an exception
+            record (dict): The record the rule was invoked with
+        """
+        entry = self._entry(self.rules, rule_name)
+        entry.invocations += 1
+        entry.hits += bool(hit)
+        entry.errors += bool(error)
+        entry.total_time += elapsed
+        if elapsed > entry.max_time:
+            entry.max_time = elapsed
+            if elapsed >= self.slow_rule_threshold:
+                entry.sample_record_size = len(json.dumps(record, default=str))
+
+    def record_matcher(self, matcher_name, elapsed, hit, error):
+        """Add an invocation of a matcher to its stats
+
+        Args:
+            matcher_name (str): The name of the matcher
+            elapsed (float): The wall time of the invocation, in seconds
+            hit (bool): True if the matcher matched the record
+            error (bool): True if the matcher raised an exception
+        """
+        entry = self._entry(self.matchers, matcher_name)
+        entry.invocations += 1
+        entry.hits += bool(hit)
+        entry.errors += bool(error)
+        entry.total_time += elapsed
+        entry.max_time = max(entry.max_time, elapsed)
+
+    def slow_rules(self):
+        """Return the slowest rules that exceeded the slow rule threshold
+
+        Returns:
+            list: Up to `top_rules` entries, ordered by their slowest invocation
+        """
+        slow_rules = [entry for entry in self.rules.itervalues()
+                      if entry.max_time >= self.slow_rule_threshold]
+        return sorted(slow_rules, key=attrgetter('max_time'), reverse=True)[:self.top_rules]
+
+    def summary(self):
+        """Return the accumulated stats for all rules and matchers
+
+        Returns:
+            dict: The 'rules' and 'matchers' stats, keyed by name
+        """
+        return {
+            'rules': {name: entry.to_dict() for name, entry in self.rules.iteritems()},
+            'matchers': {name: entry.to_dict() for name, entry in self.matchers.iteritems()}
+        }
+
+    def log(self):
+        """Log the accumulated stats and the slowest rules"""
+        if not (self.rules or self.matchers):
+            return
+
+        LOGGER.info('Rule stats: %s', json.dumps(self.summary(), sort_keys=True))
+
+        for entry in self.slow_rules():
+            LOGGER.warning('Slow rule [%s] took up to %.3fms, with a sample record of '
+                           '%d bytes (%d invocations, %.3fms total)',
+                           entry.name, entry.max_time * 1000, entry.sample_record_size,
+                           entry.invocations, entry.total_time * 1000)
@@ -13,11 +13,23 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from collections import namedtuple
+from collections import defaultdict, namedtuple, OrderedDict
 from copy import copy
 import json
+from operator import attrgetter
+import time
 
 from stream_alert.rule_processor import LOGGER
+from stream_alert.rule_processor.circuit_breaker import (
+    CIRCUIT_BREAKER_OPTIONS,
+    RuleCircuitBreaker
+)
+from stream_alert.rule_processor.prefilters import Prefilter, PrefilterIndex
+from stream_alert.rule_processor.rule_stats import (
+    DEFAULT_SLOW_RULE_THRESHOLD_MS,
+    DEFAULT_TOP_RULES,
+    RuleStats
+)
 from stream_alert.shared import NORMALIZATION_KEY
 
 DEFAULT_RULE_DESCRIPTION = 'No rule description provided'
@@ -45,15 +57,249 @@ class StreamRules(object):
     the __matchers dictionary stores:
         Key: The name of the matcher
         Value: The matcher function
+
+    the __rule_index dictionary is rebuilt whenever a rule is added or disabled:
+        Key: The name of a log source, or None for rules that only declare datatypes
+        Value: Tuple of RuleAttributes, ordered by rule name, that apply to the log source
+
+    the __matcher_group_index dictionary is rebuilt along with the __rule_index:
+        Key: The name of a log source, or None for rules that only declare datatypes
+        Value: Tuple of (matchers, rules) groups, where the rules of each group declare
+            the same matchers, so a failing matcher prunes the whole group at once
+
+    the __prefilter_index dictionary is rebuilt along with the __rule_index:
+        Key: The name of a log source, or None for rules that only declare datatypes
+        Value: PrefilterIndex for the rules of the log source that declare a prefilter
+
+    Matcher results are cached per record while its rules are evaluated, so a
+    matcher shared by several rules is only called once for each record.
+
+    The __rule_stats are only set when rule stats are enabled in the 'rules_engine'
+    section of the global config, so rules and matchers are not timed otherwise.
+    Likewise, the __circuit_breaker is only set when it is enabled there, and is
+    kept across invocations of the function until its config changes.
     """
     __rules = {}
     __matchers = {}
+    __prefilters = {}
+    __rule_index = {}
+    __matcher_group_index = {}
+    __prefilter_index = {}
+    __matcher_stats = {'calls': 0, 'saved': 0}
+    __rule_stats = None
+    __circuit_breaker = None
+    __circuit_breaker_config = None
+
+    @classmethod
+    def load_config(cls, config):
+        """Configure the optional features of the rules engine
+
+        Args:
+            config (dict): The loaded StreamAlert config, where these features are
+                declared in the 'rules_engine' section of the global config
+        """
+        rules_engine_config = config.get('global', {}).get('rules_engine', {})
+
+        stats_config = rules_engine_config.get('rule_stats', {})
+        cls.__rule_stats = None
+        if stats_config.get('enabled'):
+            cls.__rule_stats = RuleStats(
+                stats_config.get('slow_rule_threshold_ms', DEFAULT_SLOW_RULE_THRESHOLD_MS),
+                stats_config.get('top_rules', DEFAULT_TOP_RULES))
+
+        breaker_config = rules_engine_config.get('circuit_breaker', {})
+        if not breaker_config.get('enabled'):
+            cls.__circuit_breaker = cls.__circuit_breaker_config = None
+        elif breaker_config != cls.__circuit_breaker_config:
+            # Keep the state of the existing breaker unless its config has changed
+            unknown_options = set(breaker_config) - CIRCUIT_BREAKER_OPTIONS - {'enabled'}
+            if unknown_options:
+                LOGGER.error('Ignoring unknown rules_engine circuit_breaker options: %s',
+                             ', '.join(sorted(unknown_options)))
+
+            cls.__circuit_breaker = RuleCircuitBreaker(**{
+                key: value for key, value in breaker_config.iteritems()
+                if key in CIRCUIT_BREAKER_OPTIONS
+            })
+            cls.__circuit_breaker_config = dict(breaker_config)
+
+    @classmethod
+    def get_rule_stats(cls):
+        """Return the per-rule stats for this invocation, or None if they are disabled"""
+        return cls.__rule_stats
+
+    @classmethod
+    def get_circuit_breaker_stats(cls, reset=False):
+        """Return the number of circuit breaker trips and skipped rule invocations
+
+        Args:
+            reset (bool): Reset the counts after returning them
+
+        Returns:
+            dict: The 'trips' and 'skipped' counts, which are zero if the circuit
+                breaker is disabled
+        """
+        if cls.__circuit_breaker is None:
+            return {'trips': 0, 'skipped': 0}
+
+        return cls.__circuit_breaker.get_stats(reset)
+
+    @classmethod
+    def log_rule_stats(cls):
+        """Log and reset the per-rule stats for this invocation, if they are enabled"""
+        if cls.__rule_stats is None:
+            return
+
+        cls.__rule_stats.log()
+        cls.__rule_stats.reset()
 
     @classmethod
     def get_rules(cls):
         """Helper method to return private class property of __rules"""
         return cls.__rules
 
+    @classmethod
+    def get_rule_index(cls):
+        """Helper method to return a copy of the private class property of __rule_index
+
+        Returns:
+            dict: Log source names mapped to the tuple of rules to process for that
+                source. The None key holds the rules that only declare datatypes
+                and therefore apply to every log source.
+        """
+        return dict(cls.__rule_index)
+
+    @classmethod
+    def _build_rule_index(cls):
+        """Rebuild the log source to rules index from the registered rules
+
+        Rules that do not declare `logs` are applicable to all log sources, so they
+        are merged into every log source's tuple and also stored under the None key
+        to be used for log sources that no rule explicitly declares.
+        """
+        all_rules = sorted(cls.__rules.values(), key=attrgetter('rule_name'))
+        datatype_rules = [rule_attrs for rule_attrs in all_rules if rule_attrs.logs is None]
+
+        rules_by_log = defaultdict(dict)
+        for rule_attrs in all_rules:
+            for log_source in rule_attrs.logs or []:
+                rules_by_log[log_source][rule_attrs.rule_name] = rule_attrs
+
+        rule_index = {
+            log_source: tuple(sorted(rules.values() + datatype_rules,
+                                     key=attrgetter('rule_name')))
+            for log_source, rules in rules_by_log.iteritems()
+        }
+        rule_index[None] = tuple(datatype_rules)
+
+        # Swap in the new indexes as a whole instead of mutating the existing ones
+        cls.__matcher_group_index = {
+            log_source: cls._group_by_matchers(rules)
+            for log_source, rules in rule_index.iteritems()
+        }
+        cls.__prefilter_index = {
+            log_source: cls._build_prefilter_index(rules)
+            for log_source, rules in rule_index.iteritems()
+        }
+        cls.__rule_index = rule_index
+
+    @classmethod
+    def _build_prefilter_index(cls, rules):
+        """Build the prefilter index for the rules of a log source
+
+        Args:
+            rules (tuple): RuleAttributes for the rules of a log source
+
+        Returns:
+            PrefilterIndex: The index for the rules that declare a prefilter, or None
+                if none of the rules do
+        """
+        prefilters = {rule_attrs.rule_name: cls.__prefilters[rule_attrs.rule_name]
+                      for rule_attrs in rules if rule_attrs.rule_name in cls.__prefilters}
+
+        return PrefilterIndex(prefilters) if prefilters else None
+
+    @staticmethod
+    def _group_by_matchers(rules):
+        """Group rules that declare the same matchers
+
+        Groups are ordered by the first rule in each, and rules keep their
+        order within a group, so rules without matchers are still processed
+        in the order of their names.
+
+        Args:
+            rules (tuple): RuleAttributes for the rules of a log source
+
+        Returns:
+            tuple: (matchers, rules) tuples, where matchers is a tuple of matcher names
+        """
+        groups = OrderedDict()
+        for rule_attrs in rules:
+            groups.setdefault(tuple(rule_attrs.matchers or ()), []).append(rule_attrs)
+
+        return tuple((matchers, tuple(group)) for matchers, group in groups.iteritems())
+
+    @classmethod
+    def rules_for_log_source(cls, log_source):
+        """Return the rules to process for a given log source
+
+        Args:
+            log_source (str): The classified log source of a payload
+
+        Returns:
+            tuple: RuleAttributes for all rules applicable to this log source
+        """
+        rules = cls.__rule_index.get(log_source)
+        if rules is None:
+            rules = cls.__rule_index.get(None, ())
+        return rules
+
+    @classmethod
+    def prefilter_index_for_log_source(cls, log_source):
+        """Return the prefilter index for a given log source
+
+        Args:
+            log_source (str): The classified log source of a payload
+
+        Returns:
+            PrefilterIndex: The index for the rules of this log source that
+                declare a prefilter, or None if none of the rules do
+        """
+        if log_source in cls.__prefilter_index:
+            return cls.__prefilter_index[log_source]
+        return cls.__prefilter_index.get(None)
+
+    @classmethod
+    def matcher_groups_for_log_source(cls, log_source):
+        """Return the rules to process for a given log source, grouped by matchers
+
+        Args:
+            log_source (str): The classified log source of a payload
+
+        Returns:
+            tuple: (matchers, rules) groups for all rules applicable to this log source
+        """
+        groups = cls.__matcher_group_index.get(log_source)
+        if groups is None:
+            groups = cls.__matcher_group_index.get(None, ())
+        return groups
+
+    @classmethod
+    def get_matcher_stats(cls, reset=False):
+        """Return the number of matcher calls made and saved by caching results
+
+        Args:
+            reset (bool): Reset the counts after returning them
+
+        Returns:
+            dict: The 'calls' and 'saved' counts
+        """
+        stats = dict(cls.__matcher_stats)
+        if reset:
+            cls.__matcher_stats.update(calls=0, saved=0)
+
+        return stats
+
     @classmethod
     def rule(cls, **opts):
         """Register a rule that evaluates records against rules.
@@ -62,6 +308,10 @@ class StreamRules(object):
         and returns a boolean. If the function returns `True`, then the event is
         passed on to the sink(s). If the function returns `False`, the event is
         dropped.
+
+        An optional `prefilter` maps record fields to the value, or values, they
+        must equal, or fnmatch globs they must match, for the rule function to be
+        called at all. See `Prefilter` for details.
         """
         def decorator(rule):
             """Rule decorator logic."""
@@ -72,6 +322,7 @@ class StreamRules(object):
             datatypes = opts.get('datatypes')
             req_subkeys = opts.get('req_subkeys')
             context = opts.get('context', {})
+            prefilter = opts.get('prefilter')
 
             if not (logs or datatypes):
                 LOGGER.error(
@@ -86,8 +337,17 @@ class StreamRules(object):
                     rule_name)
                 return
 
+            if prefilter is not None and not (prefilter and isinstance(prefilter, dict)):
+                LOGGER.error(
+                    'Invalid rule [%s] - rule \'prefilter\' must be a non-empty map '
+                    'of fields to values',
+                    rule_name)
+                return
+
             if rule_name in cls.__rules:
                 raise ValueError('rule [{}] already defined'.format(rule_name))
+            if prefilter:
+                cls.__prefilters[rule_name] = Prefilter(prefilter)
             cls.__rules[rule_name] = RuleAttributes(rule_name,
                                                     rule,
                                                     matchers,
@@ -96,6 +356,7 @@ class StreamRules(object):
                                                     outputs,
                                                     req_subkeys,
                                                     context)
+            cls._build_rule_index()
             return rule
         return decorator
 
@@ -123,11 +384,13 @@ class StreamRules(object):
             rule_name = rule.__name__
             if rule_name in cls.__rules:
                 del cls.__rules[rule_name]
+                cls.__prefilters.pop(rule_name, None)
+                cls._build_rule_index()
             return rule
         return decorator
 
     @classmethod
-    def match_event(cls, record, rule):
+    def match_event(cls, record, rule, matcher_results=None):
         """Evaluate matchers on a record.
 
         Given a list of matchers, evaluate a record through each
@@ -138,6 +401,9 @@ class StreamRules(object):
         Args:
             record: Record to be matched
             rule: Rule containing the list of matchers
+            matcher_results (dict): Optional cache of matcher name to result for
+                this record, which is used and updated instead of calling matchers
+                that have already been evaluated
 
         Returns:
             bool: result of matcher processing
@@ -147,13 +413,30 @@ class StreamRules(object):
             return True
 
         for matcher in rule.matchers:
+            if matcher_results is not None and matcher in matcher_results:
+                cls.__matcher_stats['saved'] += 1
+                if not matcher_results[matcher]:
+                    return False
+                continue
+
             matcher_function = cls.__matchers.get(matcher)
             if matcher_function:
+                cls.__matcher_stats['calls'] += 1
+                rule_stats = cls.__rule_stats
+                if rule_stats:
+                    start_time = time.time()
+                error = False
                 try:
                     matcher_result = matcher_function(record)
                 except Exception as err:  # pylint: disable=broad-except
                     matcher_result = False
+                    error = True
                     LOGGER.error('%s: %s', matcher_function.__name__, err.message)
+                if rule_stats:
+                    rule_stats.record_matcher(matcher, time.time() - start_time,
+                                              matcher_result, error)
+                if matcher_results is not None:
+                    matcher_results[matcher] = matcher_result
                 if not matcher_result:
                     return False
             else:
@@ -220,6 +503,63 @@ class StreamRules(object):
                             results[datatype].append([key])
         return results
 
+    @classmethod
+    def normalize_record(cls, record, normalized_types, normalized_paths=None):
+        """Build the normalization view of a record for all of its normalized types
+
+        The key paths precomputed from the log's schema are used where possible, so
+        only the maps that the schema does not declare the contents of are searched.
+
+        Args:
+            record (dict): Parsed payload of any log
+            normalized_types (dict): Normalized types
+            normalized_paths (NormalizedPaths): Key paths of the normalized types in
+                the log's schema. The whole record is searched if this is None.
+
+        Returns:
+            dict: All normalized types found in the record mapped to the lists of
+                original key names, in the same form as `match_types`
+        """
+        if not normalized_types:
+            return {}
+
+        if normalized_paths is None:
+            return cls.match_types_helper(record, normalized_types, normalized_types.keys())
+
+        results = {}
+        for datatype, path in normalized_paths.static:
+            if cls._has_path(record, path):
+                results.setdefault(datatype, []).append(list(path))
+
+        for path, datatypes in normalized_paths.dynamic:
+            if not cls._has_path(record, path):
+                continue
+
+            value = reduce(dict.get, path, record)
+            if not isinstance(value, dict):
+                for datatype in datatypes:
+                    results.setdefault(datatype, []).append(list(path))
+                continue
+
+            nested_results = cls.match_types_helper(value,
+                                                    normalized_types,
+                                                    normalized_types.keys())
+            for datatype, nested_paths in nested_results.iteritems():
+                results.setdefault(datatype, []).extend(
+                    list(path) + nested_path for nested_path in nested_paths)
+
+        return results
+
+    @staticmethod
+    def _has_path(record, path):
+        """Check if a record contains a key path, where all but the last key are maps"""
+        for key in path[:-1]:
+            record = record.get(key)
+            if not isinstance(record, dict):
+                return False
+
+        return path[-1] in record
+
     @classmethod
     def update(cls, results, parent_key, nested_results):
         """Update nested_results by inserting parent key to beginning of list.
@@ -279,15 +619,53 @@ class StreamRules(object):
         Returns:
             (bool): The return function of the rule
         """
+        rule_stats, circuit_breaker = cls.__rule_stats, cls.__circuit_breaker
+        if rule_stats or circuit_breaker:
+            start_time = time.time()
+        error = False
         try:
             rule_result = rule.rule_function(record)
         except Exception:  # pylint: disable=broad-except
             rule_result = False
+            error = True
             LOGGER.exception(
                 'Encountered error with rule: %s',
                 rule.rule_function.__name__)
+        if rule_stats or circuit_breaker:
+            elapsed = time.time() - start_time
+            if rule_stats:
+                rule_stats.record_rule(rule.rule_name, elapsed, rule_result, error, record)
+            if circuit_breaker:
+                circuit_breaker.record(rule.rule_name, elapsed, error)
         return rule_result
 
+    @staticmethod
+    def _pruned_matcher_calls(pruned_rules, matchers, matcher_results):
+        """Count the matcher calls avoided by pruning the rest of a matcher group
+
+        Each pruned rule would have evaluated the group's matchers up to the one
+        that failed. The prefilter and subkey checks are not run again for the
+        pruned rules, so this is an upper bound when some of them would have been
+        skipped by those checks.
+
+        Args:
+            pruned_rules (list): Rules in the group after the rule whose matchers failed
+            matchers (tuple): The matchers shared by the rules in the group
+            matcher_results (dict): Matcher name to result for this record
+
+        Returns:
+            int: The number of matcher calls avoided
+        """
+        evaluated = 0
+        for matcher in matchers:
+            if matcher not in matcher_results:
+                continue
+            evaluated += 1
+            if not matcher_results[matcher]:
+                break
+
+        return evaluated * len(pruned_rules)
+
     @classmethod
     def process_subkeys(cls, record, payload_type, rule):
         """Check payload record contains all subkeys needed for rules
@@ -346,52 +724,80 @@ class StreamRules(object):
         alerts = []
         payload = copy(input_payload)
 
-        rules = [rule_attrs for rule_attrs in cls.__rules.values()
-                 if rule_attrs.logs is None or payload.log_source in rule_attrs.logs]
+        matcher_groups = cls.matcher_groups_for_log_source(payload.log_source)
+        prefilter_index = cls.prefilter_index_for_log_source(payload.log_source)
+        circuit_breaker = cls.__circuit_breaker
 
-        if not rules:
+        if not matcher_groups:
             LOGGER.debug('No rules to process for %s', payload)
             return alerts
 
         for record in payload.records:
-            for rule in rules:
-                # subkey check
-                has_sub_keys = cls.process_subkeys(record, payload.type, rule)
-                if not has_sub_keys:
-                    continue
-
-                # matcher check
-                matcher_result = cls.match_event(record, rule)
-                if not matcher_result:
-                    continue
-
-                types_result = None
-                if rule.datatypes:
-                    types_result = cls.match_types(record,
-                                                   payload.normalized_types,
-                                                   rule.datatypes)
-
-                if types_result:
-                    record_copy = record.copy()
-                    record_copy[NORMALIZATION_KEY] = types_result
-                else:
-                    record_copy = record
-                # rule analysis
-                rule_result = cls.process_rule(record_copy, rule)
-                if rule_result:
-                    LOGGER.info('Rule [%s] triggered an alert on log type [%s] from entity \'%s\' '
-                                'in service \'%s\'', rule.rule_name, payload.log_source,
-                                payload.entity, payload.service())
-                    alert = {
-                        'record': record_copy,
-                        'rule_name': rule.rule_name,
-                        'rule_description': rule.rule_function.__doc__ or DEFAULT_RULE_DESCRIPTION,
-                        'log_source': str(payload.log_source),
-                        'log_type': payload.type,
-                        'outputs': rule.outputs,
-                        'source_service': payload.service(),
-                        'source_entity': payload.entity,
-                        'context': rule.context}
-                    alerts.append(alert)
+            # The normalization view is built once per record, when the first rule
+            # that declares datatypes needs it, and shared by all of these rules
+            normalized_view = None
+            matcher_results = {}
+            # Rules that declare a prefilter are skipped unless they are candidates
+            skipped_rules = (prefilter_index.rule_names - prefilter_index.candidates(record)
+                             if prefilter_index else ())
+            for _, group_rules in matcher_groups:
+                for index, rule in enumerate(group_rules):
+                    # prefilter check
+                    if rule.rule_name in skipped_rules:
+                        continue
+
+                    # subkey check
+                    has_sub_keys = cls.process_subkeys(record, payload.type, rule)
+                    if not has_sub_keys:
+                        continue
+
+                    # matcher check, where a failure prunes the rest of the group
+                    matcher_result = cls.match_event(record, rule, matcher_results)
+                    if not matcher_result:
+                        cls.__matcher_stats['saved'] += cls._pruned_matcher_calls(
+                            group_rules[index + 1:], rule.matchers, matcher_results)
+                        break
+
+                    # circuit breaker check, before any work is done for the rule
+                    if circuit_breaker and not circuit_breaker.allow(rule.rule_name):
+                        continue
+
+                    types_result = None
+                    if rule.datatypes:
+                        if normalized_view is None:
+                            normalized_view = cls.normalize_record(record,
+                                                                   payload.normalized_types,
+                                                                   payload.normalized_paths)
+                        # Each rule gets its own copy of the key paths, so a rule that
+                        # changes them does not affect the rules evaluated after it
+                        types_result = {datatype: [list(path)
+                                                   for path in normalized_view[datatype]]
+                                        for datatype in rule.datatypes
+                                        if datatype in normalized_view}
+
+                    if types_result:
+                        record_copy = record.copy()
+                        record_copy[NORMALIZATION_KEY] = types_result
+                    else:
+                        record_copy = record
+
+                    # rule analysis
+                    rule_result = cls.process_rule(record_copy, rule)
+                    if rule_result:
+                        LOGGER.info('Rule [%s] triggered an alert on log type [%s] from '
+                                    'entity \'%s\' in service \'%s\'', rule.rule_name,
+                                    payload.log_source, payload.entity, payload.service())
+                        alert = {
+                            'record': record_copy,
+                            'rule_name': rule.rule_name,
+                            'rule_description': (rule.rule_function.__doc__ or
+                                                 DEFAULT_RULE_DESCRIPTION),
+                            'log_source': str(payload.log_source),
+                            'log_type': payload.type,
+                            'outputs': rule.outputs,
+                            'source_service': payload.service(),
+                            'source_entity': payload.entity,
+                            'context': rule.context}
+                        alerts.append(alert)
 
         return alerts
@@ -0,0 +1,213 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import namedtuple, OrderedDict
+
+from stream_alert.rule_processor import LOGGER
+
+ENVELOPE_KEY = 'streamalert:envelope_keys'
+
+# Key paths for the normalized types of a log, as precomputed from its schema:
+#   static: tuple of (datatype, key path) for keys whose location is fixed by the schema
+#   dynamic: tuple of (key path, datatypes) for maps whose contents the schema does not
+#       declare, which must be searched in each record
+NormalizedPaths = namedtuple('NormalizedPaths', 'static, dynamic')
+
+
+def _to_string(value):
+    """Convert a value to a str, falling back on unicode for non-ascii values"""
+    try:
+        return str(value)
+    except UnicodeEncodeError:
+        return unicode(value)
+
+
+def _to_boolean(value):
+    """Convert a value to a bool, where only a string value of 'true' is True"""
+    return str(value).lower() == 'true'
+
+
+# Map of schema type -> (converter function, error message if the conversion fails)
+# Converter functions that can fail should raise a ValueError or TypeError
+_CONVERTERS = {
+    'string': (_to_string, 'Invalid schema. Value for key [%s] is not a string: %s'),
+    'integer': (int, 'Invalid schema. Value for key [%s] is not an int: %s'),
+    'float': (float, 'Invalid schema. Value for key [%s] is not a float: %s'),
+    'boolean': (_to_boolean, 'Invalid schema. Value for key [%s] is not a boolean: %s')
+}
+
+
+def compile_schema(schema, options=None):
+    """Compile a log schema, including any configured envelope keys
+
+    Args:
+        schema (dict): The log schema declared in logs.json
+        options (dict): The 'configuration' declared for the log in logs.json
+
+    Returns:
+        CompiledSchema: The compiled schema for this log type
+    """
+    if isinstance(schema, CompiledSchema):
+        return schema
+
+    schema = OrderedDict(schema)
+
+    # Parsed records will have the envelope inserted if envelope keys are configured
+    envelope_schema = (options or {}).get('envelope_keys')
+    if envelope_schema:
+        schema[ENVELOPE_KEY] = envelope_schema
+
+    return CompiledSchema(schema)
+
+
+class CompiledSchema(OrderedDict):
+    """Log schema with a precomputed validation and type conversion plan
+
+    This behaves exactly like the OrderedDict schema loaded from logs.json, so
+    it can be passed to any parser, but also holds the frozenset of keys that
+    a record must contain, a converter function for each typed key, and
+    compiled schemas for all non-empty nested maps. The plan is built when
+    the schema is created, so changes to the schema afterwards require a
+    call to `compile` to take effect.
+    """
+
+    def __init__(self, *args, **kwargs):
+        OrderedDict.__init__(self, *args, **kwargs)
+        self.compile()
+
+    def compile(self):
+        """Build the validation and conversion plan for the current schema keys"""
+        converters, nested = [], []
+        for key, value in self.items():
+            if isinstance(value, dict):
+                # Empty maps allow any value and do not need to be compiled
+                if not value:
+                    continue
+                if not isinstance(value, CompiledSchema):
+                    value = CompiledSchema(value)
+                    OrderedDict.__setitem__(self, key, value)
+                nested.append((str(key), value))
+
+            elif isinstance(value, list):
+                continue
+
+            elif value in _CONVERTERS:
+                converter, error_message = _CONVERTERS[value]
+                converters.append((str(key), converter, error_message))
+
+            else:
+                LOGGER.error('Unsupported schema type: %s', value)
+
+        self.key_signature = frozenset(self)
+        self._converters = tuple(converters)
+        self._nested = tuple(nested)
+        self._normalized_paths = None
+
+    def validate(self, record):
+        """Verify a record contains exactly the keys of this schema, including
+        the keys of any nested maps
+
+        Args:
+            record (dict): A parsed record
+
+        Returns:
+            bool: True if the record's keys match the schema, False if not
+        """
+        if not isinstance(record, dict) or record.viewkeys() != self.key_signature:
+            return False
+
+        for key, nested_schema in self._nested:
+            # The envelope is built during parsing and does not need to be checked
+            if key == ENVELOPE_KEY and isinstance(record[key], dict):
+                continue
+            if not nested_schema.validate(record[key]):
+                return False
+
+        return True
+
+    def convert(self, record):
+        """Convert a record's values, in place, into their declared types
+
+        Args:
+            record (dict): A parsed record that has been validated against this schema
+
+        Returns:
+            bool: True if all values were converted, False if any value could not be
+        """
+        for key, converter, error_message in self._converters:
+            try:
+                record[key] = converter(record[key])
+            except (ValueError, TypeError):
+                LOGGER.error(error_message, key, record[key])
+                return False
+            except KeyError:
+                LOGGER.error('Invalid schema. Key [%s] is missing from record', key)
+                return False
+
+        for key, nested_schema in self._nested:
+            value = record.get(key)
+            if not isinstance(value, dict):
+                # Skip the values for the 'streamalert:envelope_keys' key that we've
+                # added during parsing if the do not conform to being a dict
+                if key == ENVELOPE_KEY:
+                    continue
+                LOGGER.error('Invalid schema. Value for key [%s] is not a map: %s',
+                             key, value)
+                return False
+
+            if not nested_schema.convert(value):
+                return False
+
+        return True
+
+    def normalized_paths(self, normalized_types):
+        """Compute the key paths of a log's normalized types from this schema
+
+        The result is cached on the schema for the given normalized types, so this
+        is only computed once per log type when the config is loaded.
+
+        Args:
+            normalized_types (dict): Normalized types mapped to the keys they include,
+                as declared for this log type in types.json
+
+        Returns:
+            NormalizedPaths: The static and dynamic key paths of the normalized types
+        """
+        if self._normalized_paths and self._normalized_paths[0] is normalized_types:
+            return self._normalized_paths[1]
+
+        key_types = {}
+        for datatype, keys in (normalized_types or {}).iteritems():
+            for key in keys:
+                key_types.setdefault(key, []).append(datatype)
+
+        static, dynamic = [], []
+        self._collect_normalized_paths(key_types, (), static, dynamic)
+        paths = NormalizedPaths(tuple(static), tuple(dynamic))
+
+        self._normalized_paths = (normalized_types, paths)
+        return paths
+
+    def _collect_normalized_paths(self, key_types, parent, static, dynamic):
+        """Recursively add the key paths of normalized types within this schema"""
+        for key, value in self.iteritems():
+            path = parent + (key,)
+            # The envelope and empty maps can hold any keys, so search them per record
+            if (key == ENVELOPE_KEY and not parent) or (isinstance(value, dict) and not value):
+                dynamic.append((path, tuple(key_types.get(key, ()))))
+            elif isinstance(value, CompiledSchema):
+                value._collect_normalized_paths(key_types, path, static, dynamic)
+            else:
+                static.extend((datatype, path) for datatype in key_types.get(key, ()))
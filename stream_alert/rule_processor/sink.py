@@ -14,6 +14,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import json
+import threading
 
 import boto3
 from botocore.exceptions import ClientError
@@ -21,20 +22,39 @@ from botocore.exceptions import ClientError
 from stream_alert.rule_processor import LOGGER
 
 
+# Lambda limits the payload of asynchronous invocations to 128KB: http://amzn.to/2g6KUUz
+MAX_INVOKE_PAYLOAD_SIZE = 128 * 1024
+
+
 class StreamSink(object):
-    """StreamSink class is used for sending actual alerts to the alert processor"""
+    """StreamSink class is used for sending actual alerts to the alert processor
+
+    Alerts are serialized when they are sunk and buffered, then sent to the alert
+    processor as a JSON list in as few invocations as the payload size limit
+    allows. A batch is sent whenever the next alert would not fit, and any
+    remaining alerts are sent when the sink is flushed. If an I/O worker pool is
+    given, batches are sent from the pool and the caller must wait on it.
+    """
 
-    def __init__(self, env):
+    def __init__(self, env, io_pool=None):
         """StreamSink initializer
 
         Args:
             env (dict): loaded dictionary containing environment information
+            io_pool (IOWorkerPool): Optional pool used to send batches concurrently
         """
         self.env = env
         self.client_lambda = boto3.client('lambda',
                                           region_name=self.env['lambda_region'])
         self.function = self.env['lambda_function_name'].replace(
             '_streamalert_rule_processor', '_streamalert_alert_processor')
+        self._io_pool = io_pool
+        self._lock = threading.Lock()
+        self._batch = []
+        self._batch_size = 0
+        self.alerts_batched = 0
+        self.alerts_sent = 0
+        self.invocations = 0
 
     def sink(self, alerts):
         """Sink triggered alerts from the StreamRules engine.
@@ -42,7 +62,8 @@ class StreamSink(object):
         Args:
             alerts (list): a list of dictionaries representating json alerts
 
-        Sends a message to the alert processor with the following JSON format:
+        Buffers each alert, to be sent to the alert processor in a list of alerts,
+        where each alert has the following JSON format:
             {
                 "record": record,
                 "metadata": {
@@ -68,28 +89,64 @@ class StreamSink(object):
                              alert)
                 continue
 
-            try:
-                response = self.client_lambda.invoke(
-                    FunctionName=self.function,
-                    InvocationType='Event',
-                    Payload=data,
-                    Qualifier='production'
-                )
-
-            except ClientError as err:
-                LOGGER.exception('An error occurred while sending alert to '
-                                 '\'%s:production\'. Error is: %s. Alert: %s',
-                                 self.function,
-                                 err.response,
-                                 data)
-                continue
+            # Each alert adds its length plus a comma or the enclosing brackets
+            if self._batch and self._batch_size + len(data) + 1 > MAX_INVOKE_PAYLOAD_SIZE:
+                self.flush()
 
-            if response['ResponseMetadata']['HTTPStatusCode'] != 202:
-                LOGGER.error('Failed to send alert to \'%s\': %s',
-                             self.function, data)
-                continue
+            self._batch.append(data)
+            self._batch_size += len(data) + 1
 
-            if self.env['lambda_alias'] != 'development':
-                LOGGER.info('Sent alert to \'%s\' with Lambda request ID \'%s\'',
-                            self.function,
-                            response['ResponseMetadata']['RequestId'])
+    def flush(self):
+        """Send all buffered alerts to the alert processor in a single invocation"""
+        if not self._batch:
+            return
+
+        batch, self._batch, self._batch_size = self._batch, [], 0
+        if self._io_pool:
+            self._io_pool.submit(self._send_batch, batch)
+        else:
+            self._send_batch(batch)
+
+    def _send_batch(self, batch):
+        """Invoke the alert processor with a batch of alerts
+
+        Args:
+            batch (list): JSON encoded alerts
+        """
+        data = '[{}]'.format(','.join(batch))
+        if len(data) > MAX_INVOKE_PAYLOAD_SIZE:
+            LOGGER.error('Alert of %d bytes exceeds the maximum payload size of %d bytes '
+                         'for \'%s\'', len(data), MAX_INVOKE_PAYLOAD_SIZE, self.function)
+
+        with self._lock:
+            self.alerts_batched += len(batch)
+            self.invocations += 1
+        try:
+            response = self.client_lambda.invoke(
+                FunctionName=self.function,
+                InvocationType='Event',
+                Payload=data,
+                Qualifier='production'
+            )
+
+        except ClientError as err:
+            LOGGER.exception('An error occurred while sending alerts to '
+                             '\'%s:production\'. Error is: %s. Alerts: %s',
+                             self.function,
+                             err.response,
+                             data)
+            return
+
+        if response['ResponseMetadata']['HTTPStatusCode'] != 202:
+            LOGGER.error('Failed to send alerts to \'%s\': %s',
+                         self.function, data)
+            return
+
+        with self._lock:
+            self.alerts_sent += len(batch)
+
+        if self.env['lambda_alias'] != 'development':
+            LOGGER.info('Sent %d alert(s) to \'%s\' with Lambda request ID \'%s\'',
+                        len(batch),
+                        self.function,
+                        response['ResponseMetadata']['RequestId'])
@@ -15,16 +15,40 @@ limitations under the License.
 """
 import csv
 import gzip
+import json
 import os
+import time
+
+from botocore.exceptions import ClientError
 
 from stream_alert.rule_processor import LOGGER
+from stream_alert.rule_processor.bloom_filter import (
+    BloomFilter,
+    BloomFilterError,
+    PREFILTER_EXTENSION
+)
+from stream_alert.rule_processor.intel_source import load_intel_source, MANIFEST
+from stream_alert.rule_processor.intel_store import (
+    IntelOverlay,
+    IntelStore,
+    IntelStoreError,
+    STORE_EXTENSION,
+    write_intel_store
+)
 
 class StreamThreatIntel(object):
-    """Load intelligence from csv.gz files into a dictionary."""
+    """Load intelligence from compiled intel stores or csv.gz files into a dictionary."""
     IOC_KEY = 'streamalert:ioc'
 
     __intelligence = {}
     __config = {}
+    __prefilters = {}
+    __prefilter_stats = {'checks': 0, 'rejections': 0}
+    __version = 0
+    __source = None
+    __source_tag = None
+    __poll_interval = 0
+    __last_poll = 0
 
     @classmethod
     def read_compressed_files(cls, intel_dir, delimiter=','):
@@ -58,41 +82,345 @@ class StreamThreatIntel(object):
         if not os.path.exists(intel_dir):
             return
 
+        for ioc_type, indicators in cls._read_csv_files(intel_dir, delimiter):
+            if ioc_type not in cls.__intelligence:
+                cls.__intelligence[ioc_type] = dict()
+            cls.__intelligence[ioc_type].update(indicators)
+
+        return cls.__intelligence
+
+    @staticmethod
+    def _read_csv_files(intel_dir, delimiter=','):
+        """Read the indicators from each csv.gz file in a directory
+
+        Yields:
+            tuple: The IOC type for a file and a dictionary of its indicators
+        """
         gz_files = [os.path.join(intel_dir, gz_file) for gz_file
                     in os.listdir(intel_dir)
                     if gz_file.endswith('.gz')]
 
         for gz_file in gz_files:
             with gzip.open(gz_file, 'r') as ioc_file:
-                csv_reader = csv.reader(ioc_file, delimiter=delimiter)
-                ioc_type = os.path.basename(gz_file).split('.')[0]
-                if ioc_type not in cls.__intelligence:
-                    cls.__intelligence[ioc_type] = dict()
-                for row in csv_reader:
-                    if len(row) < 2:
-                        LOGGER.debug('Warning, each row in CSV file should '
-                                     'contain at least two fields. Bad row [%s]',
-                                     row)
-                        continue
-                    cls.__intelligence[ioc_type][row[0]] = row[1:]
+                indicators = StreamThreatIntel._read_csv(ioc_file, delimiter)
+
+            yield os.path.basename(gz_file).split('.')[0], indicators
+
+    @staticmethod
+    def _read_csv(ioc_file, delimiter=','):
+        """Read the indicators from a decompressed csv file
+
+        Returns:
+            dict: Each indicator mapped to the list of its values
+        """
+        indicators = dict()
+        csv_reader = csv.reader(ioc_file, delimiter=delimiter)
+        for row in csv_reader:
+            if len(row) < 2:
+                LOGGER.debug('Warning, each row in CSV file should '
+                             'contain at least two fields. Bad row [%s]',
+                             row)
+                continue
+            indicators[row[0]] = row[1:]
+
+        return indicators
+
+    @classmethod
+    def build_intel_stores(cls, intel_dir, delimiter=',', remove_sources=False,
+                           false_positive_rate=None):
+        """Compile the csv.gz files in a directory into one intel store file per IOC type
+
+        This is run when the rule processor is packaged, so the function can memory
+        map the stores instead of reading all intelligence into memory. If a false
+        positive rate is given, a bloom filter prefilter is also written for each
+        IOC type, so the function does not build them from the stores at runtime.
+
+        Args:
+            intel_dir (str): Location where stores compressed intelligence
+            delimiter (str): The delimiter used in the csv.gz files
+            remove_sources (bool): Remove the csv.gz files once they are compiled
+            false_positive_rate (float): Target false positive rate of the prefilters,
+                or None to not write any prefilters
+
+        Returns:
+            list: Paths to the intel store files that were written
+        """
+        if not os.path.exists(intel_dir):
+            return []
+
+        intelligence = {}
+        for ioc_type, indicators in cls._read_csv_files(intel_dir, delimiter):
+            intelligence.setdefault(ioc_type, {}).update(indicators)
+
+        store_paths = []
+        for ioc_type, indicators in intelligence.iteritems():
+            store_path = os.path.join(intel_dir, '{}{}'.format(ioc_type, STORE_EXTENSION))
+            write_intel_store(store_path, indicators)
+            store_paths.append(store_path)
+            LOGGER.debug('Compiled %d %s indicators into %s',
+                         len(indicators), ioc_type, store_path)
+
+            if false_positive_rate:
+                prefilter_path = os.path.join(intel_dir, '{}{}'.format(ioc_type,
+                                                                      PREFILTER_EXTENSION))
+                BloomFilter(indicators, false_positive_rate).write(prefilter_path)
+
+        if remove_sources:
+            for gz_file in os.listdir(intel_dir):
+                if gz_file.endswith('.gz'):
+                    os.remove(os.path.join(intel_dir, gz_file))
+
+        return store_paths
+
+    @classmethod
+    def read_intel_stores(cls, intel_dir):
+        """Memory map the compiled intel store files in a directory
+
+        Returns:
+            (dict): Each IOC type mapped to its IntelStore, which can be used
+                like the dictionaries returned by `read_compressed_files`
+            None: if the intelligence directory does not exist
+        """
+        if not os.path.exists(intel_dir):
+            return
+
+        for store_file in os.listdir(intel_dir):
+            if not store_file.endswith(STORE_EXTENSION):
+                continue
+            try:
+                store = IntelStore(os.path.join(intel_dir, store_file))
+            except IntelStoreError as err:
+                LOGGER.error('Unable to load intel store: %s', err)
+                continue
+            cls.__intelligence[store_file[:-len(STORE_EXTENSION)]] = store
 
         return cls.__intelligence
 
+    @staticmethod
+    def _has_intel_stores(intel_dir):
+        """Check if a directory contains any compiled intel store files"""
+        return (os.path.exists(intel_dir) and
+                any(name.endswith(STORE_EXTENSION) for name in os.listdir(intel_dir)))
+
     @classmethod
     def load_intelligence(cls, config, intel_dir='threat_intel'):
-        """Load intelligence from csv.gz files into a dictionary
+        """Load intelligence from compiled intel stores, or csv.gz files, into a dictionary
 
         Args:
             intel_dir (str): Location where stores compressed intelligence
         """
         if cls.__intelligence:
+            cls.refresh_intelligence()
             return
         if (config.get('threat_intel')
                 and config['threat_intel'].get('enabled')
                 and config['threat_intel'].get('mapping')):
-            cls.__intelligence = cls.read_compressed_files(intel_dir)
+            # Prefer the intel stores compiled when the function was packaged
+            if cls._has_intel_stores(intel_dir):
+                cls.__intelligence = cls.read_intel_stores(intel_dir)
+            else:
+                cls.__intelligence = cls.read_compressed_files(intel_dir)
             cls.__config = config['threat_intel'].get('mapping')
 
+            cls.__prefilters = {}
+            if (config['threat_intel'].get('prefilter', {}).get('enabled')
+                    and cls.__intelligence):
+                cls.read_prefilters(intel_dir)
+
+            cls.__version = cls._read_version(intel_dir)
+            cls.__source, cls.__source_tag, cls.__last_poll = None, None, 0
+            refresh_config = config['threat_intel'].get('refresh', {})
+            if refresh_config.get('enabled') and refresh_config.get('location'):
+                cls.__source = load_intel_source(refresh_config['location'])
+                cls.__poll_interval = refresh_config.get('poll_interval_seconds', 300)
+                cls.refresh_intelligence()
+
+    @staticmethod
+    def _read_version(intel_dir):
+        """Read the version of the packaged intelligence from its manifest, if it has one"""
+        manifest_path = os.path.join(intel_dir, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return 0
+
+        with open(manifest_path) as manifest_file:
+            try:
+                return int(json.load(manifest_file).get('version', 0))
+            except (ValueError, TypeError, AttributeError):
+                LOGGER.error('Invalid threat intel manifest: %s', manifest_path)
+                return 0
+
+    @classmethod
+    def refresh_intelligence(cls, force=False):
+        """Apply any new delta files from the configured intel source
+
+        The source is polled at most once per poll interval, and its manifest
+        is only read when the manifest's tag, such as its S3 ETag, has changed.
+        Deltas are applied to copies of the intelligence mappings, which are
+        swapped in once all deltas are applied, so lookups are never blocked
+        and never see a partially applied delta.
+
+        Args:
+            force (bool): Poll the source even if the poll interval has not passed
+
+        Returns:
+            bool: True if any deltas were applied
+        """
+        if not cls.__source:
+            return False
+
+        now = time.time()
+        if not force and now - cls.__last_poll < cls.__poll_interval:
+            return False
+        cls.__last_poll = now
+
+        try:
+            source_tag = cls.__source.manifest_tag()
+            if source_tag == cls.__source_tag:
+                return False
+
+            manifest = cls.__source.read_manifest()
+            deltas = sorted((delta for delta in manifest.get('deltas', [])
+                             if delta['version'] > cls.__version),
+                            key=lambda delta: delta['version'])
+
+            expected_versions = range(cls.__version + 1, manifest['version'] + 1)
+            if [delta['version'] for delta in deltas] != expected_versions:
+                LOGGER.error('Threat intel source is missing deltas to update from '
+                             'version %d to %d', cls.__version, manifest['version'])
+                return False
+
+            intelligence, prefilters = cls._apply_deltas(deltas)
+        except (ClientError, EnvironmentError, KeyError, TypeError, ValueError) as err:
+            LOGGER.error('Failed to refresh threat intel: %s', err)
+            return False
+
+        cls.__source_tag = source_tag
+        if not deltas:
+            return False
+
+        # Swap in the prefilters first, since they only ever gain indicators
+        cls.__prefilters = prefilters
+        cls.__intelligence = intelligence
+        cls.__version = manifest['version']
+        LOGGER.info('Refreshed threat intel to version %d', cls.__version)
+
+        return True
+
+    @classmethod
+    def _apply_deltas(cls, deltas, delimiter=','):
+        """Apply delta files to copies of the current intelligence and prefilters
+
+        Args:
+            deltas (list): The deltas from the source manifest, in version order
+
+        Returns:
+            tuple: The new intelligence and prefilters dictionaries
+        """
+        intelligence = dict(cls.__intelligence or {})
+        prefilters = dict(cls.__prefilters)
+        copied_prefilters = set()
+        for delta in deltas:
+            for ioc_type, files in delta['files'].iteritems():
+                adds, removes = {}, []
+                if files.get('add'):
+                    with gzip.GzipFile(fileobj=cls.__source.open(files['add'])) as ioc_file:
+                        adds = cls._read_csv(ioc_file, delimiter)
+                if files.get('remove'):
+                    with gzip.GzipFile(fileobj=cls.__source.open(files['remove'])) as ioc_file:
+                        removes = [row[0] for row in csv.reader(ioc_file, delimiter=delimiter)
+                                   if row]
+
+                indicators = intelligence.get(ioc_type, {})
+                if not isinstance(indicators, IntelOverlay):
+                    indicators = IntelOverlay(indicators)
+                intelligence[ioc_type] = indicators.apply(adds, removes)
+
+                # Removed indicators can stay in a prefilter, as false positives
+                if ioc_type in prefilters and adds:
+                    if ioc_type not in copied_prefilters:
+                        prefilters[ioc_type] = prefilters[ioc_type].copy()
+                        copied_prefilters.add(ioc_type)
+                    for indicator in adds:
+                        prefilters[ioc_type].add(indicator)
+
+                LOGGER.debug('Applied threat intel version %d for %s: %d added, %d removed',
+                             delta['version'], ioc_type, len(adds), len(removes))
+
+        return intelligence, prefilters
+
+    @classmethod
+    def get_version(cls):
+        """Return the version of the loaded intelligence"""
+        return cls.__version
+
+    @classmethod
+    def read_prefilters(cls, intel_dir):
+        """Memory map the bloom filter for each IOC type of the loaded intel stores
+
+        Most values checked against the intelligence are not IOCs, and the
+        prefilter rejects most of those without a binary search of the intel
+        store. The filters are written when the function is packaged, since
+        building them means reading every indicator of the stores. IOC types
+        loaded from csv.gz files into a dictionary are not prefiltered, since a
+        dictionary lookup is already cheaper than the filter.
+
+        Args:
+            intel_dir (str): Location of the compiled intel stores and prefilters
+        """
+        for ioc_type, indicators in cls.__intelligence.iteritems():
+            if not isinstance(indicators, IntelStore):
+                continue
+
+            prefilter_path = os.path.join(intel_dir, '{}{}'.format(ioc_type,
+                                                                  PREFILTER_EXTENSION))
+            if not os.path.exists(prefilter_path):
+                LOGGER.debug('No prefilter was packaged for %s indicators', ioc_type)
+                continue
+
+            try:
+                cls.__prefilters[ioc_type] = BloomFilter.load(prefilter_path)
+            except BloomFilterError as err:
+                LOGGER.error('Unable to load threat intel prefilter: %s', err)
+
+    @classmethod
+    def might_be_ioc(cls, ioc_type, value):
+        """Check a value against the prefilter for an IOC type
+
+        Args:
+            ioc_type (str): The IOC type, such as 'ip', 'domain' or 'md5'
+            value: The value to check
+
+        Returns:
+            bool: False if the value is definitely not an IOC of this type,
+                True if it may be or if there is no prefilter for this type
+        """
+        prefilter = cls.__prefilters.get(ioc_type)
+        if prefilter is None:
+            return True
+
+        cls.__prefilter_stats['checks'] += 1
+        if value in prefilter:
+            return True
+
+        cls.__prefilter_stats['rejections'] += 1
+        return False
+
+    @classmethod
+    def get_prefilter_stats(cls, reset=False):
+        """Return the number of values checked and rejected by the prefilters
+
+        Args:
+            reset (bool): Reset the counts after returning them
+
+        Returns:
+            dict: The 'checks' and 'rejections' counts
+        """
+        stats = dict(cls.__prefilter_stats)
+        if reset:
+            cls.__prefilter_stats.update(checks=0, rejections=0)
+
+        return stats
+
     @classmethod
     def get_intelligence(cls):
         return cls.__intelligence
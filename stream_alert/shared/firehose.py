@@ -0,0 +1,161 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import namedtuple
+
+import backoff
+from botocore.exceptions import ClientError
+from botocore.vendored.requests.exceptions import ConnectionError
+
+from stream_alert.shared import LOGGER
+from stream_alert.shared.backoff_handlers import (
+    backoff_handler,
+    success_handler,
+    giveup_handler
+)
+
+# Error codes returned when a request to Firehose was throttled
+THROTTLING_ERROR_CODES = frozenset([
+    'LimitExceededException',
+    'ServiceUnavailableException',
+    'ThrottlingException'
+])
+
+FirehoseBatchResult = namedtuple('FirehoseBatchResult',
+                                 'sent, failed, errors, resent_bytes, duplicated')
+
+
+def _is_permanent_error(err):
+    """Check if a failed request to Firehose should not be retried
+
+    Requests are only retried if they were throttled, or failed on the service
+    side. Other client errors, such as a missing Delivery Stream, will not
+    succeed by sending the same request again.
+
+    Args:
+        err (Exception): The exception raised by the request
+
+    Returns:
+        bool: True if the request should not be retried
+    """
+    if not isinstance(err, ClientError):
+        return False
+
+    if err.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+        return False
+
+    return err.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 500) < 500
+
+
+def put_record_batch(client, stream_name, records, max_tries, max_value=None):
+    """Send records to a Firehose Delivery Stream, resending only the records that failed
+
+    When a PutRecordBatch request partially fails, the 'RequestResponses' of the
+    response are used to resend only the records with an 'ErrorCode', with backoff,
+    so records that were already delivered are not duplicated in the Delivery Stream.
+
+    Records can still be duplicated when every pending record is resent: after a
+    response that does not identify the failed records, or after a request error
+    that is not throttling, where Firehose may have accepted the records anyway.
+    The records that may have been delivered before being resent are counted.
+
+    Args:
+        client (boto3.client): The Firehose client to send the records with
+        stream_name (str): The name of the Delivery Stream to send to
+        records (list): JSON encoded records to send, each ending with a newline
+        max_tries (int): The maximum number of attempts at sending the records
+        max_value (int): The maximum number of seconds to wait between attempts
+
+    Returns:
+        FirehoseBatchResult: The number of records that were sent and that failed,
+            the responses for the records that failed, the number of bytes that were
+            sent again and the number of records that may have been delivered twice
+    """
+    # List of (index, data) for the records that have not been delivered yet
+    pending = list(enumerate(records))
+    state = {'attempts': 0, 'errors': [], 'resent_bytes': 0, 'duplicated': 0,
+             'maybe_delivered': 0}
+
+    @backoff.on_predicate(backoff.fibo,
+                          lambda failed: failed,
+                          max_tries=max_tries,
+                          max_value=max_value,
+                          jitter=backoff.full_jitter,
+                          on_backoff=backoff_handler,
+                          on_success=success_handler,
+                          on_giveup=giveup_handler)
+    @backoff.on_exception(backoff.fibo,
+                          (ClientError, ConnectionError),
+                          max_tries=max_tries,
+                          giveup=_is_permanent_error,
+                          jitter=backoff.full_jitter,
+                          on_backoff=backoff_handler,
+                          on_success=success_handler,
+                          on_giveup=giveup_handler)
+    def _firehose_request_wrapper():
+        """Send the pending records, keeping only the failed records as pending
+
+        Returns:
+            bool: True if any records failed and should be sent again
+        """
+        if state['attempts']:
+            state['resent_bytes'] += sum(len(data) for _, data in pending)
+            state['duplicated'] += state['maybe_delivered']
+        state['attempts'] += 1
+
+        # Any pending record may be delivered if the request fails without a response
+        state['maybe_delivered'] = len(pending)
+
+        LOGGER.info('[Firehose] Sending %d records to %s', len(pending), stream_name)
+        try:
+            resp = client.put_record_batch(
+                DeliveryStreamName=stream_name,
+                Records=[{'Data': data} for _, data in pending])
+        except ClientError as err:
+            # Throttled requests are rejected without delivering any records
+            if err.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+                state['maybe_delivered'] = 0
+            raise
+
+        responses = resp.get('RequestResponses', [])
+        state['maybe_delivered'] = 0
+        if not resp.get('FailedPutCount'):
+            failed, state['errors'] = [], []
+        elif len(responses) != len(pending):
+            # The failed records cannot be identified, so all of them must be resent,
+            # including the records that were delivered
+            failed, state['errors'] = pending[:], responses
+            state['maybe_delivered'] = len(pending) - resp['FailedPutCount']
+        else:
+            failed, state['errors'] = [], []
+            for record, response in zip(pending, responses):
+                if response.get('ErrorCode'):
+                    failed.append(record)
+                    state['errors'].append(response)
+
+        pending[:] = failed
+
+        return bool(failed)
+
+    # The try/except here is to catch the raised error at the
+    # end of the backoff.
+    try:
+        _firehose_request_wrapper()
+    except (ClientError, ConnectionError) as err:
+        LOGGER.error('[Firehose] Failed to send %d records to %s: %s',
+                     len(pending), stream_name, err)
+
+    return FirehoseBatchResult(len(records) - len(pending), len(pending), state['errors'],
+                               state['resent_bytes'], state['duplicated'])
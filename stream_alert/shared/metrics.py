@@ -50,7 +50,11 @@ class MetricLogger(object):
 
     # Constant metric names used for CloudWatch
     FAILED_PARSES = 'FailedParses'
+    S3_CONTINUATIONS = 'S3Continuations'
     S3_DOWNLOAD_TIME = 'S3DownloadTime'
+    S3_READ_DURATION = 'S3ReadDuration'
+    S3_RESUME_FAILURES = 'S3ResumeFailures'
+    S3_TIME_TO_FIRST_RECORD = 'S3TimeToFirstRecord'
     TOTAL_PROCESSED_SIZE = 'TotalProcessedSize'
     TOTAL_RECORDS = 'TotalRecords'
     TOTAL_S3_RECORDS = 'TotalS3Records'
@@ -58,6 +62,21 @@ class MetricLogger(object):
     TRIGGERED_ALERTS = 'TriggeredAlerts'
     FIREHOSE_RECORDS_SENT = 'FirehoseRecordsSent'
     FIREHOSE_FAILED_RECORDS = 'FirehoseFailedRecords'
+    FIREHOSE_BYTES_RESENT = 'FirehoseBytesResent'
+    FIREHOSE_RECORDS_DUPLICATED = 'FirehoseRecordsDuplicated'
+    FIREHOSE_BUFFER_PEAK_BYTES = 'FirehoseBufferPeakBytes'
+    SHAPE_CACHE_HITS = 'ShapeCacheHits'
+    SHAPE_CACHE_MISSES = 'ShapeCacheMisses'
+    STICKY_SCHEMA_FALLBACKS = 'StickySchemaFallbacks'
+    THREAT_INTEL_PREFILTER_CHECKS = 'ThreatIntelPrefilterChecks'
+    THREAT_INTEL_PREFILTER_REJECTIONS = 'ThreatIntelPrefilterRejections'
+    THREAT_INTEL_VERSION = 'ThreatIntelVersion'
+    MATCHER_CALLS = 'MatcherCalls'
+    MATCHER_CALLS_SAVED = 'MatcherCallsSaved'
+    RULE_CIRCUIT_BREAKER_TRIPS = 'RuleCircuitBreakerTrips'
+    RULE_CIRCUIT_BREAKER_SKIPS = 'RuleCircuitBreakerSkips'
+    ALERTS_PER_INVOKE = 'AlertsPerInvoke'
+    ALERT_INVOKES_SAVED = 'AlertInvokesSaved'
 
     _default_filter = '{{ $.metric_name = "{}" }}'
     _default_value_lookup = '$.metric_value'
@@ -74,8 +93,16 @@ class MetricLogger(object):
         RULE_PROCESSOR_NAME: {
             FAILED_PARSES: (_default_filter.format(FAILED_PARSES),
                             _default_value_lookup),
+            S3_CONTINUATIONS: (_default_filter.format(S3_CONTINUATIONS),
+                               _default_value_lookup),
             S3_DOWNLOAD_TIME: (_default_filter.format(S3_DOWNLOAD_TIME),
                                _default_value_lookup),
+            S3_READ_DURATION: (_default_filter.format(S3_READ_DURATION),
+                               _default_value_lookup),
+            S3_RESUME_FAILURES: (_default_filter.format(S3_RESUME_FAILURES),
+                                 _default_value_lookup),
+            S3_TIME_TO_FIRST_RECORD: (_default_filter.format(S3_TIME_TO_FIRST_RECORD),
+                                      _default_value_lookup),
             TOTAL_PROCESSED_SIZE: (_default_filter.format(TOTAL_PROCESSED_SIZE),
                                    _default_value_lookup),
             TOTAL_RECORDS: (_default_filter.format(TOTAL_RECORDS),
@@ -88,8 +115,38 @@ class MetricLogger(object):
                                     _default_value_lookup),
             FIREHOSE_FAILED_RECORDS: (_default_filter.format(FIREHOSE_FAILED_RECORDS),
                                       _default_value_lookup),
+            FIREHOSE_BYTES_RESENT: (_default_filter.format(FIREHOSE_BYTES_RESENT),
+                                    _default_value_lookup),
+            FIREHOSE_RECORDS_DUPLICATED: (_default_filter.format(FIREHOSE_RECORDS_DUPLICATED),
+                                          _default_value_lookup),
+            FIREHOSE_BUFFER_PEAK_BYTES: (_default_filter.format(FIREHOSE_BUFFER_PEAK_BYTES),
+                                         _default_value_lookup),
             TOTAL_STREAM_ALERT_APP_RECORDS:
-                (_default_filter.format(TOTAL_STREAM_ALERT_APP_RECORDS), _default_value_lookup)
+                (_default_filter.format(TOTAL_STREAM_ALERT_APP_RECORDS), _default_value_lookup),
+            SHAPE_CACHE_HITS: (_default_filter.format(SHAPE_CACHE_HITS),
+                               _default_value_lookup),
+            SHAPE_CACHE_MISSES: (_default_filter.format(SHAPE_CACHE_MISSES),
+                                 _default_value_lookup),
+            STICKY_SCHEMA_FALLBACKS: (_default_filter.format(STICKY_SCHEMA_FALLBACKS),
+                                      _default_value_lookup),
+            THREAT_INTEL_PREFILTER_CHECKS:
+                (_default_filter.format(THREAT_INTEL_PREFILTER_CHECKS), _default_value_lookup),
+            THREAT_INTEL_PREFILTER_REJECTIONS:
+                (_default_filter.format(THREAT_INTEL_PREFILTER_REJECTIONS), _default_value_lookup),
+            THREAT_INTEL_VERSION: (_default_filter.format(THREAT_INTEL_VERSION),
+                                   _default_value_lookup),
+            MATCHER_CALLS: (_default_filter.format(MATCHER_CALLS),
+                            _default_value_lookup),
+            MATCHER_CALLS_SAVED: (_default_filter.format(MATCHER_CALLS_SAVED),
+                                  _default_value_lookup),
+            RULE_CIRCUIT_BREAKER_TRIPS:
+                (_default_filter.format(RULE_CIRCUIT_BREAKER_TRIPS), _default_value_lookup),
+            RULE_CIRCUIT_BREAKER_SKIPS:
+                (_default_filter.format(RULE_CIRCUIT_BREAKER_SKIPS), _default_value_lookup),
+            ALERTS_PER_INVOKE: (_default_filter.format(ALERTS_PER_INVOKE),
+                                _default_value_lookup),
+            ALERT_INVOKES_SAVED: (_default_filter.format(ALERT_INVOKES_SAVED),
+                                  _default_value_lookup)
         }
     }
 
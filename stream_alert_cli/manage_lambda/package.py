@@ -24,6 +24,8 @@ import zipfile
 import boto3
 from botocore.exceptions import ClientError
 
+from stream_alert.rule_processor.bloom_filter import DEFAULT_FALSE_POSITIVE_RATE
+from stream_alert.rule_processor.threat_intel import StreamThreatIntel
 from stream_alert_cli.helpers import run_command
 from stream_alert_cli.logger import LOGGER_CLI
 
@@ -285,6 +287,21 @@ class RuleProcessorPackage(LambdaPackage):
     config_key = 'rule_processor_config'
     third_party_libs = {'backoff', 'jsonpath_rw'}
 
+    def _copy_files(self, temp_package_path):
+        """Copy all files and folders into temporary package path, and compile
+        any threat intel csv.gz files into the intel stores used by the function"""
+        super(RuleProcessorPackage, self)._copy_files(temp_package_path)
+
+        intel_dir = os.path.join(temp_package_path, 'threat_intel')
+        prefilter_config = (self.config.get('threat_intel') or {}).get('prefilter', {})
+        false_positive_rate = (prefilter_config.get('false_positive_rate',
+                                                    DEFAULT_FALSE_POSITIVE_RATE)
+                               if prefilter_config.get('enabled') else None)
+        store_paths = StreamThreatIntel.build_intel_stores(
+            intel_dir, remove_sources=True, false_positive_rate=false_positive_rate)
+        if store_paths:
+            LOGGER_CLI.info('Compiled %d threat intel store(s)', len(store_paths))
+
 
 class AlertProcessorPackage(LambdaPackage):
     """Deployment package class for the StreamAlert Alert Processor function"""
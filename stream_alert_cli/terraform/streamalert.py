@@ -55,12 +55,21 @@ def generate_stream_alert(cluster_name, cluster_dict, config):
                 "sns_topic_arn"
               ]
             },
+            "io_workers": 4,
             "log_level": "info",
             "memory": 128,
             "timeout": 10
           }
         }
 
+    JSON Input from the threat intel config, used to grant read access to the
+    threat intel refresh location when it is an S3 prefix:
+
+        "refresh": {
+          "enabled": true,
+          "location": "s3://bucket.name/threat_intel"
+        }
+
     Returns:
         bool: Result of applying the stream_alert module
     """
@@ -76,6 +85,8 @@ def generate_stream_alert(cluster_name, cluster_dict, config):
         'kms_key_arn': '${aws_kms_key.stream_alert_secrets.arn}',
         'rule_processor_enable_metrics': modules['stream_alert'] \
             ['rule_processor'].get('enable_metrics', True),
+        'rule_processor_io_workers': modules['stream_alert'] \
+            ['rule_processor'].get('io_workers', 4),
         'rule_processor_log_level': modules['stream_alert'] \
             ['rule_processor'].get('log_level', 'info'),
         'rule_processor_memory': modules['stream_alert']['rule_processor']['memory'],
@@ -127,4 +138,17 @@ def generate_stream_alert(cluster_name, cluster_dict, config):
             'alert_processor_vpc_security_group_ids': vpc_config['security_group_ids']
         })
 
+    # Allow the Rule Processor to read threat intel refreshed from an S3 prefix
+    threat_intel_config = config.get('threat_intel') or {}
+    refresh_config = threat_intel_config.get('refresh', {})
+    location = refresh_config.get('location', '')
+    if (threat_intel_config.get('enabled') and refresh_config.get('enabled')
+            and location.startswith('s3://')):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        prefix = prefix.strip('/')
+        cluster_dict['module']['stream_alert_{}'.format(cluster_name)].update({
+            'threat_intel_bucket': bucket,
+            'threat_intel_prefix': '{}/'.format(prefix) if prefix else ''
+        })
+
     return True
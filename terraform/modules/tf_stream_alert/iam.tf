@@ -50,6 +50,29 @@ data "aws_iam_policy_document" "rule_processor_invoke_alert_proc" {
   }
 }
 
+// IAM Role Policy: Allow the Rule Processor to invoke itself to continue large S3 objects
+resource "aws_iam_role_policy" "streamalert_rule_processor_invoke_self" {
+  name = "LambdaInvokeRuleProcessor"
+  role = "${aws_iam_role.streamalert_rule_processor_role.id}"
+
+  policy = "${data.aws_iam_policy_document.rule_processor_invoke_self.json}"
+}
+
+// IAM Policy Doc: Allow the Rule Processor to invoke itself
+data "aws_iam_policy_document" "rule_processor_invoke_self" {
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "lambda:InvokeFunction",
+    ]
+
+    resources = [
+      "${aws_lambda_function.streamalert_rule_processor.arn}:*",
+    ]
+  }
+}
+
 // IAM Role Policy: Allow the Rule Processor to put data on Firehose
 resource "aws_iam_role_policy" "streamalert_rule_processor_firehose" {
   name = "FirehoseWriteData"
@@ -75,6 +98,53 @@ data "aws_iam_policy_document" "streamalert_rule_processor_firehose" {
   }
 }
 
+// IAM Role Policy: Allow the Rule Processor to read refreshed threat intel from S3
+resource "aws_iam_role_policy" "streamalert_rule_processor_threat_intel" {
+  count = "${var.threat_intel_bucket == "" ? 0 : 1}"
+  name  = "S3ReadThreatIntel"
+  role  = "${aws_iam_role.streamalert_rule_processor_role.id}"
+
+  policy = "${data.aws_iam_policy_document.rule_processor_threat_intel.json}"
+}
+
+// IAM Policy Doc: Allow reading objects under the threat intel prefix
+data "aws_iam_policy_document" "rule_processor_threat_intel" {
+  count = "${var.threat_intel_bucket == "" ? 0 : 1}"
+
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "s3:GetObject",
+    ]
+
+    resources = [
+      "arn:aws:s3:::${var.threat_intel_bucket}/${var.threat_intel_prefix}*",
+    ]
+  }
+
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "s3:ListBucket",
+    ]
+
+    resources = [
+      "arn:aws:s3:::${var.threat_intel_bucket}",
+    ]
+
+    condition {
+      test     = "StringLike"
+      variable = "s3:prefix"
+
+      values = [
+        "${var.threat_intel_prefix}*",
+      ]
+    }
+  }
+}
+
 // IAM Role: Alert Processor Execution Role
 resource "aws_iam_role" "streamalert_alert_processor_role" {
   name = "${var.prefix}_${var.cluster}_streamalert_alert_processor_role"
@@ -91,6 +91,10 @@ variable "rule_processor_config" {
   default = {}
 }
 
+variable "rule_processor_io_workers" {
+  default = 4
+}
+
 variable "rule_processor_log_level" {
   type    = "string"
   default = "info"
@@ -112,3 +116,13 @@ variable "rule_processor_metric_filters" {
 }
 
 variable "sns_topic_arn" {}
+
+variable "threat_intel_bucket" {
+  type    = "string"
+  default = ""
+}
+
+variable "threat_intel_prefix" {
+  type    = "string"
+  default = ""
+}
@@ -0,0 +1,89 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark helpers.base.in_network as the number of CIDRs grows.
+
+Usage (from the repository root):
+    python -m tests.benchmarks.networks
+"""
+import random
+import timeit
+
+from netaddr import IPAddress, IPNetwork
+from netaddr.core import AddrFormatError
+
+from helpers.base import in_network
+from stream_alert.rule_processor.networks import compile_networks
+
+CIDR_COUNTS = (10, 1000, 100000)
+LOOKUPS = 1000
+
+# The previous implementation parses every CIDR on every call, so it is given
+# fewer lookups as the CIDR count grows to keep the run time reasonable
+SCAN_LOOKUPS = {10: 1000, 1000: 100, 100000: 1}
+
+
+def _random_cidrs(count):
+    """Return a set of `count` random /24 to /32 IPv4 CIDRs
+
+    This is a plain set, as rules declare their CIDRs at the module level
+    """
+    cidrs = set()
+    while len(cidrs) < count:
+        prefix = random.randint(24, 32)
+        address = IPAddress(random.getrandbits(32))
+        cidrs.add(str(IPNetwork('{}/{}'.format(address, prefix)).cidr))
+    return cidrs
+
+
+def _linear_scan(ip_address, cidrs):
+    """The previous in_network implementation"""
+    for cidr in cidrs:
+        try:
+            network = IPNetwork(cidr)
+        except AddrFormatError:
+            continue
+        if ip_address in network:
+            return True
+    return False
+
+
+def main():
+    """Print the time per lookup with the previous and compiled implementations"""
+    random.seed(1024)
+    addresses = [str(IPAddress(random.getrandbits(32))) for _ in range(LOOKUPS)]
+
+    print '{:>8} {:>16} {:>16} {:>14} {:>12}'.format(
+        'cidrs', 'scan (us/call)', 'index (us/call)', 'compile (ms)', 'speedup')
+    for count in CIDR_COUNTS:
+        cidrs = _random_cidrs(count)
+
+        compile_time = timeit.timeit(lambda: compile_networks(cidrs), number=1)
+
+        scan_lookups = SCAN_LOOKUPS[count]
+        scan_time = timeit.timeit(
+            lambda: [_linear_scan(address, cidrs) for address in addresses[:scan_lookups]],
+            number=1) / scan_lookups
+        index_time = timeit.timeit(
+            lambda: [in_network(address, cidrs) for address in addresses],
+            number=1) / LOOKUPS
+
+        print '{:>8} {:>16.2f} {:>16.2f} {:>14.2f} {:>11.1f}x'.format(
+            count, scan_time * 1e6, index_time * 1e6, compile_time * 1000,
+            scan_time / index_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark rule selection for a payload's log source as the rule count grows.
+
+Usage (from the repository root):
+    python -m tests.benchmarks.rules_engine
+"""
+# pylint: disable=protected-access
+import timeit
+
+from stream_alert.rule_processor.rules_engine import StreamRules
+
+RULE_COUNTS = (10, 100, 500, 1000)
+LOG_SOURCE_COUNT = 50
+LOOKUPS = 10000
+
+
+def _register_rules(count):
+    """Register `count` rules spread across LOG_SOURCE_COUNT log sources"""
+    StreamRules._StreamRules__rules.clear()  # pylint: disable=no-member
+    StreamRules._StreamRules__rule_index.clear()  # pylint: disable=no-member
+    for index in range(count):
+        def rule_function(_):
+            return False
+        rule_function.__name__ = 'bench_rule_{}'.format(index)
+        if index % 10 == 0:
+            StreamRules.rule(datatypes=['sourceAddress'],
+                             outputs=['s3:bench'])(rule_function)
+        else:
+            StreamRules.rule(logs=['bench_log_{}'.format(index % LOG_SOURCE_COUNT)],
+                             outputs=['s3:bench'])(rule_function)
+
+
+def _linear_scan(log_source):
+    """The previous per-payload rule selection"""
+    return [rule_attrs for rule_attrs in StreamRules.get_rules().values()
+            if rule_attrs.logs is None or log_source in rule_attrs.logs]
+
+
+def main():
+    """Print the time taken to select rules with and without the index"""
+    print '{:>8} {:>14} {:>14} {:>10}'.format('rules', 'scan (ms)', 'index (ms)', 'speedup')
+    for count in RULE_COUNTS:
+        _register_rules(count)
+        scan_time = timeit.timeit(lambda: _linear_scan('bench_log_1'), number=LOOKUPS)
+        index_time = timeit.timeit(lambda: StreamRules.rules_for_log_source('bench_log_1'),
+                                   number=LOOKUPS)
+        print '{:>8} {:>14.2f} {:>14.2f} {:>9.1f}x'.format(
+            count, scan_time * 1000, index_time * 1000, scan_time / index_time)
+
+
+if __name__ == '__main__':
+    main()
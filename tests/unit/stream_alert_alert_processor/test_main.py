@@ -114,6 +114,22 @@ def test_running_success(creds_mock, config_mock, get_mock):
     assert_true(result[0][0])
 
 
+@patch('requests.post')
+@patch('stream_alert.alert_processor.main._load_output_config')
+@patch('stream_alert.alert_processor.outputs.output_base.OutputDispatcher._load_creds')
+def test_running_batch(creds_mock, config_mock, get_mock):
+    """Alert Processor run handler - batch of alerts"""
+    config_mock.return_value = _load_output_config('tests/unit/conf/outputs.json')
+    creds_mock.return_value = {'url': 'http://mock.url'}
+    get_mock.return_value.status_code = 200
+
+    context = get_mock_context()
+
+    result = handler([get_alert(), get_alert()], context)
+    assert_equal(len(result), 2)
+    assert_true(all(sent for sent, _ in result))
+
+
 @patch('logging.Logger.error')
 @patch('stream_alert.alert_processor.main._load_output_config')
 def test_running_bad_output(config_mock, log_mock):
@@ -239,6 +239,7 @@ class TestTerraformGenerate(object):
                     'cluster': 'test',
                     'kms_key_arn': '${aws_kms_key.stream_alert_secrets.arn}',
                     'rule_processor_enable_metrics': True,
+                    'rule_processor_io_workers': 4,
                     'rule_processor_log_level': 'info',
                     'rule_processor_memory': 128,
                     'rule_processor_timeout': 25,
@@ -275,6 +276,7 @@ class TestTerraformGenerate(object):
                     'cluster': 'advanced',
                     'kms_key_arn': '${aws_kms_key.stream_alert_secrets.arn}',
                     'rule_processor_enable_metrics': True,
+                    'rule_processor_io_workers': 4,
                     'rule_processor_log_level': 'info',
                     'rule_processor_memory': 128,
                     'rule_processor_timeout': 25,
@@ -299,6 +301,39 @@ class TestTerraformGenerate(object):
         assert_equal(self.cluster_dict['module']['stream_alert_advanced'],
                      expected_advanced_cluster['module']['stream_alert_advanced'])
 
+    def test_generate_stream_alert_threat_intel(self):
+        """CLI - Terraform Generate StreamAlert - Threat Intel Refresh from S3"""
+        self.config['threat_intel']['enabled'] = True
+        self.config['threat_intel']['refresh'] = {
+            'enabled': True,
+            'location': 's3://unit-testing.streamalert.threat-intel/intel/'
+        }
+        streamalert.generate_stream_alert(
+            'test',
+            self.cluster_dict,
+            self.config
+        )
+
+        generated_stream_alert = self.cluster_dict['module']['stream_alert_test']
+        assert_equal(generated_stream_alert['threat_intel_bucket'],
+                     'unit-testing.streamalert.threat-intel')
+        assert_equal(generated_stream_alert['threat_intel_prefix'], 'intel/')
+
+    def test_generate_stream_alert_threat_intel_local(self):
+        """CLI - Terraform Generate StreamAlert - Threat Intel Refresh from Local Path"""
+        self.config['threat_intel']['enabled'] = True
+        self.config['threat_intel']['refresh'] = {
+            'enabled': True,
+            'location': 'threat_intel'
+        }
+        streamalert.generate_stream_alert(
+            'test',
+            self.cluster_dict,
+            self.config
+        )
+
+        assert_false('threat_intel_bucket' in self.cluster_dict['module']['stream_alert_test'])
+
     def test_generate_flow_logs(self):
         """CLI - Terraform Generate Flow Logs"""
         cluster_name = 'advanced'
@@ -0,0 +1,103 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal, assert_false, assert_less, assert_true, raises
+
+from stream_alert.rule_processor.bloom_filter import BloomFilter, BloomFilterError
+
+
+class TestBloomFilter(object):
+    """Test class for BloomFilter"""
+
+    def test_sizing(self):
+        """BloomFilter - Sizing"""
+        bloom_filter = BloomFilter(['value_{}'.format(index) for index in range(1000)], 0.01)
+
+        # ~9.6 bits and ~7 hash functions per value for a 1% false positive rate
+        assert_equal(bloom_filter.size, 9586)
+        assert_equal(bloom_filter.hash_count, 7)
+
+    def test_no_false_negatives(self):
+        """BloomFilter - No False Negatives"""
+        values = ['evil{}.com'.format(index) for index in range(1000)] + ['b\xc3\xa4d.com']
+        bloom_filter = BloomFilter(values)
+
+        assert_true(all(value in bloom_filter for value in values))
+        assert_true(u'evil1.com' in bloom_filter)
+        assert_true(u'b\xe4d.com' in bloom_filter)
+
+    def test_false_positive_rate(self):
+        """BloomFilter - False Positive Rate"""
+        bloom_filter = BloomFilter(['evil{}.com'.format(index) for index in range(1000)], 0.01)
+
+        false_positives = sum('good{}.com'.format(index) in bloom_filter
+                              for index in range(10000))
+        assert_less(false_positives, 300)
+
+    def test_empty(self):
+        """BloomFilter - Empty"""
+        bloom_filter = BloomFilter([])
+
+        assert_false('evil.com' in bloom_filter)
+        assert_false(None in bloom_filter)
+
+    def test_stable_positions(self):
+        """BloomFilter - Positions Do Not Depend on the Process"""
+        bloom_filter = BloomFilter(['evil.com'], 0.01)
+
+        # Positions are derived from MD5, not the builtin hash, which varies with
+        # the hash seed and platform
+        assert_equal(bloom_filter._positions('evil.com'), [1, 9, 7, 5, 3, 1, 9])
+
+    def test_write_load(self):
+        """BloomFilter - Write and Memory Map"""
+        values = ['evil{}.com'.format(index) for index in range(1000)]
+        bloom_filter = BloomFilter(values)
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'domain.bloom')
+            bloom_filter.write(path)
+            loaded = BloomFilter.load(path)
+
+            assert_equal((loaded.size, loaded.hash_count),
+                         (bloom_filter.size, bloom_filter.hash_count))
+            assert_true(all(value in loaded for value in values))
+            assert_equal([value in loaded for value in ('good.com', 'bad.com', 'ok.com')],
+                         [value in bloom_filter for value in ('good.com', 'bad.com', 'ok.com')])
+
+            # Values are added to copies of memory mapped filters
+            copied = loaded.copy()
+            copied.add('new.com')
+            assert_true('new.com' in copied)
+            loaded.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @raises(BloomFilterError)
+    def test_load_invalid(self):
+        """BloomFilter - Load Invalid File"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'domain.bloom')
+            with open(path, 'wb') as filter_file:
+                filter_file.write('not a bloom filter file')
+            BloomFilter.load(path)
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,67 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from nose.tools import assert_equal, assert_is_none, assert_true
+
+from stream_alert.rule_processor.checkpoint import S3Checkpoint, S3CheckpointStore
+
+
+class TestS3CheckpointStore(object):
+    """Test class for S3CheckpointStore"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'checkpoints.db')
+        self.store = S3CheckpointStore(self.path)
+
+    def teardown(self):
+        """Teardown after each method"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_missing(self):
+        """S3CheckpointStore - Load Missing Checkpoint"""
+        assert_is_none(self.store.load('bucket/key:etag'))
+
+    def test_save_load(self):
+        """S3CheckpointStore - Save and Load Checkpoint"""
+        self.store.save('bucket/key:etag', S3Checkpoint(100, 0))
+        self.store.save('bucket/key:etag', S3Checkpoint(200, 3))
+
+        # Checkpoints are persisted for other instances using the same file
+        assert_equal(S3CheckpointStore(self.path).load('bucket/key:etag'), (200, 3))
+
+    def test_clear(self):
+        """S3CheckpointStore - Clear Checkpoint"""
+        self.store.save('bucket/key:etag', S3Checkpoint(100, 0))
+        self.store.save('bucket/other:etag', S3Checkpoint(50, 0))
+        self.store.clear('bucket/key:etag')
+
+        assert_is_none(self.store.load('bucket/key:etag'))
+        assert_equal(self.store.load('bucket/other:etag'), (50, 0))
+
+    @patch('stream_alert.rule_processor.checkpoint.LOGGER')
+    def test_database_error(self, log_mock):
+        """S3CheckpointStore - Database Errors Are Logged"""
+        store = S3CheckpointStore(self.temp_dir)
+
+        assert_is_none(store.load('bucket/key:etag'))
+        assert_true(log_mock.error.called)
@@ -0,0 +1,107 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+from mock import patch
+from nose.tools import assert_equal, assert_false, assert_true
+
+from stream_alert.rule_processor.circuit_breaker import RuleCircuitBreaker
+
+
+@patch('stream_alert.rule_processor.circuit_breaker.time.time')
+class TestRuleCircuitBreaker(object):
+    """Test class for RuleCircuitBreaker"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.breaker = RuleCircuitBreaker(window_seconds=100,
+                                          min_invocations=4,
+                                          max_error_rate=0.5,
+                                          max_latency_ms=100,
+                                          max_slow_rate=0.5,
+                                          cooldown_seconds=60)
+
+    def test_min_invocations(self, time_mock):
+        """RuleCircuitBreaker - Does Not Trip Below Minimum Invocations"""
+        time_mock.return_value = 1000
+        for _ in range(3):
+            self.breaker.record('test_rule', 0.001, True)
+
+        assert_true(self.breaker.allow('test_rule'))
+        assert_equal(self.breaker.get_stats(), {'trips': 0, 'skipped': 0})
+
+    def test_trip_on_errors(self, time_mock):
+        """RuleCircuitBreaker - Trip on Error Rate"""
+        time_mock.return_value = 1000
+        self.breaker.record('test_rule', 0.001, False)
+        self.breaker.record('test_rule', 0.001, False)
+        self.breaker.record('test_rule', 0.001, True)
+        self.breaker.record('test_rule', 0.001, True)
+
+        assert_true(self.breaker.is_open('test_rule'))
+        assert_false(self.breaker.allow('test_rule'))
+        assert_true(self.breaker.allow('other_rule'))
+        assert_equal(self.breaker.get_stats(reset=True), {'trips': 1, 'skipped': 1})
+        assert_equal(self.breaker.get_stats(), {'trips': 0, 'skipped': 0})
+
+    def test_trip_on_latency(self, time_mock):
+        """RuleCircuitBreaker - Trip on Slow Rate"""
+        time_mock.return_value = 1000
+        for elapsed in (0.001, 0.5, 0.001, 2.0):
+            self.breaker.record('test_rule', elapsed, False)
+
+        assert_true(self.breaker.is_open('test_rule'))
+
+    def test_healthy_rule(self, time_mock):
+        """RuleCircuitBreaker - Healthy Rule Does Not Trip"""
+        time_mock.return_value = 1000
+        for _ in range(10):
+            self.breaker.record('test_rule', 0.001, False)
+        self.breaker.record('test_rule', 5.0, True)
+
+        assert_false(self.breaker.is_open('test_rule'))
+
+    def test_rolling_window(self, time_mock):
+        """RuleCircuitBreaker - Outcomes Expire from the Rolling Window"""
+        time_mock.return_value = 1000
+        for _ in range(3):
+            self.breaker.record('test_rule', 0.001, True)
+
+        # The errors above are outside of the window by now
+        time_mock.return_value = 1200
+        self.breaker.record('test_rule', 0.001, True)
+
+        assert_false(self.breaker.is_open('test_rule'))
+        assert_equal(self.breaker._windows['test_rule'].totals(), (1, 1, 0))
+
+    @patch('stream_alert.rule_processor.circuit_breaker.LOGGER')
+    def test_cooldown(self, log_mock, time_mock):
+        """RuleCircuitBreaker - Re-enable After Cooldown"""
+        time_mock.return_value = 1000
+        for _ in range(4):
+            self.breaker.record('test_rule', 0.001, True)
+        assert_true(log_mock.error.called)
+
+        time_mock.return_value = 1059
+        assert_false(self.breaker.allow('test_rule'))
+
+        time_mock.return_value = 1060
+        assert_true(self.breaker.allow('test_rule'))
+        log_mock.info.assert_called_with(
+            'Circuit breaker for rule [%s] has cooled down, re-enabling rule', 'test_rule')
+
+        # The rule starts over with an empty window
+        self.breaker.record('test_rule', 0.001, True)
+        assert_false(self.breaker.is_open('test_rule'))
@@ -39,6 +39,8 @@ class TestStreamClassifier(object):
 
     def setup(self):
         """Setup before each method"""
+        # Some tests turn on support for multiple schema matching
+        sa_classifier.SUPPORT_MULTIPLE_SCHEMA_MATCHING = False
         config = load_config('tests/unit/conf')
         self.classifier = sa_classifier.StreamClassifier(config)
 
@@ -621,3 +623,212 @@ class TestStreamClassifier(object):
             elif name == 'test_2':
                 assert_equal(payload.records[0]['host'], 'macbook004154test')
                 assert_equal(payload.records[0]['application'], 'authd')
+
+    def test_load_sources_plan_cached(self):
+        """StreamClassifier - Load Sources, Classification Plan Cached"""
+        service, entity = 'kinesis', 'test_stream_2'
+
+        assert_true(self.classifier.load_sources(service, entity))
+        plan = self.classifier._plan
+
+        assert_equal([log_plan.log_name for log_plan in plan],
+                     ['test_log_type_json_2', 'test_log_type_json_nested_osquery',
+                      'test_log_type_syslog', 'test_multiple_schemas:01',
+                      'test_multiple_schemas:02'])
+
+        # A new classifier using the same config should reuse the cached plan
+        classifier = sa_classifier.StreamClassifier(self.classifier._config)
+        with patch.object(sa_classifier.StreamClassifier, '_build_plan') as build_mock:
+            assert_true(classifier.load_sources(service, entity))
+            build_mock.assert_not_called()
+
+        assert_true(classifier._plan is plan)
+
+    def test_dump_classification_plans(self):
+        """StreamClassifier - Dump Classification Plans"""
+        self.classifier.load_sources('kinesis', 'unit_test_default_stream')
+
+        plans = self.classifier.dump_classification_plans()
+
+        assert_equal(plans.keys(), ['kinesis:unit_test_default_stream'])
+        assert_equal(plans['kinesis:unit_test_default_stream'][0], {
+            'log_name': 'unit_test_simple_log',
+            'parser': 'json',
+            'schema_keys': ['unit_key_01', 'unit_key_02']
+        })
+
+    def test_process_log_schemas_decode_once(self):
+        """StreamClassifier - Process Log Schemas, Decode JSON Once"""
+        kinesis_data = json.dumps({
+            'name': 'file removal test',
+            'identifier': 'host4.this.test.also',
+            'time': 'Jan 01 2017',
+            'type': 'lol_file_removed_event_test',
+            'message': 'bad_001.txt was removed'
+        })
+
+        service, entity = 'kinesis', 'test_stream_2'
+        raw_record = make_kinesis_raw_record(entity, kinesis_data)
+        payload = load_stream_payload(service, entity, raw_record)
+
+        self.classifier.load_sources(service, entity)
+
+        payload = list(payload.pre_parse())[0]
+
+        with patch('stream_alert.rule_processor.parsers.json.loads',
+                   side_effect=json.loads) as loads_mock:
+            schema_matches = self.classifier._process_log_schemas(payload)
+            loads_mock.assert_called_once_with(kinesis_data)
+
+        assert_equal(schema_matches[0].log_name, 'test_multiple_schemas:02')
+
+    def _process_kinesis_data(self, entity, data):
+        """Helper method to run a kinesis record through _process_log_schemas"""
+        raw_record = make_kinesis_raw_record(entity, json.dumps(data))
+        payload = list(load_stream_payload('kinesis', entity, raw_record).pre_parse())[0]
+        self.classifier.load_sources('kinesis', entity)
+
+        return self.classifier._process_log_schemas(payload)
+
+    def test_shape_fingerprint(self):
+        """StreamClassifier - Shape Fingerprint"""
+        fingerprint = sa_classifier._shape_fingerprint(
+            {'key_01': 100, 'key_02': {'nested_01': 'value', 'nested_02': {}}, 'key_03': []})
+
+        assert_equal(fingerprint, frozenset(
+            ['key_01', ('key_02', frozenset(['nested_01', ('nested_02', frozenset())])),
+             'key_03']))
+
+        # Values do not affect the fingerprint, but map values do
+        assert_equal(sa_classifier._shape_fingerprint({'key_01': 1, 'key_02': 'a'}),
+                     sa_classifier._shape_fingerprint({'key_01': 'b', 'key_02': [2]}))
+        assert_false(sa_classifier._shape_fingerprint({'key_01': 1}) ==
+                     sa_classifier._shape_fingerprint({'key_01': {}}))
+
+    def test_shape_cache_hit(self):
+        """StreamClassifier - Shape Cache, Hit Goes to Matched Log"""
+        entity = 'unit_test_default_stream'
+        data = {'date': 'Jan 01 2017', 'unixtime': 1485556524, 'host': 'host1', 'data': {}}
+
+        schema_matches = self._process_kinesis_data(entity, data)
+        assert_equal(schema_matches[0].log_name, 'test_log_type_json_nested')
+        assert_equal(self.classifier.shape_cache_misses, 1)
+
+        data.update({'host': 'host2', 'unixtime': 1485556525})
+        with patch.object(sa_classifier.StreamClassifier, '_match_log',
+                          wraps=self.classifier._match_log) as match_mock:
+            schema_matches = self._process_kinesis_data(entity, data)
+            match_mock.assert_called_once()
+            assert_equal(match_mock.call_args[0][0].log_name, 'test_log_type_json_nested')
+
+        assert_equal(schema_matches[0].log_name, 'test_log_type_json_nested')
+        assert_equal(schema_matches[0].parsed_data[0]['host'], 'host2')
+        assert_equal(self.classifier.shape_cache_hits, 1)
+        assert_equal(self.classifier.shape_cache_misses, 1)
+
+    def test_shape_cache_no_match(self):
+        """StreamClassifier - Shape Cache, Known Bad Shape Rejected"""
+        entity = 'unit_test_default_stream'
+
+        assert_equal(self._process_kinesis_data(entity, {'bad_key': 'value'}), [])
+        assert_equal(self.classifier.shape_cache_misses, 1)
+
+        with patch.object(sa_classifier.StreamClassifier, '_match_log') as match_mock:
+            assert_equal(self._process_kinesis_data(entity, {'bad_key': 'other'}), [])
+            match_mock.assert_not_called()
+
+        assert_equal(self.classifier.shape_cache_hits, 1)
+
+    def test_shape_cache_value_dependent(self):
+        """StreamClassifier - Shape Cache, Value Dependent Match Not Cached"""
+        entity = 'test_stream_2'
+        data = {
+            'name': 'file added test',
+            'identifier': 'host4.this.test',
+            'time': 'Jan 01 2017',
+            'type': 'lol_file_added_event_test',
+            'message': 'bad_001.txt was added'
+        }
+
+        # The test_multiple_schemas logs use log_patterns and follow a syslog log,
+        # so matches for them depend on the record's values and are not cached
+        for _ in range(2):
+            schema_matches = self._process_kinesis_data(entity, data)
+            assert_equal(schema_matches[0].log_name, 'test_multiple_schemas:01')
+
+        assert_equal(self.classifier.shape_cache_hits, 0)
+        assert_equal(self.classifier.shape_cache_misses, 2)
+
+    @patch('stream_alert.rule_processor.classifier.SHAPE_CACHE_SIZE', 1)
+    def test_shape_cache_eviction(self):
+        """StreamClassifier - Shape Cache, Least Recently Used Shape Evicted"""
+        entity = 'unit_test_default_stream'
+
+        self._process_kinesis_data(entity, {'unit_key_01': 1, 'unit_key_02': 'test'})
+        self._process_kinesis_data(entity, {'bad_key': 'value'})
+        self._process_kinesis_data(entity, {'unit_key_01': 2, 'unit_key_02': 'test'})
+
+        assert_equal(self.classifier.shape_cache_hits, 0)
+        assert_equal(self.classifier.shape_cache_misses, 3)
+        assert_equal(len(sa_classifier.StreamClassifier._StreamClassifier__shape_cache), 1)
+
+    def test_sticky_log(self):
+        """StreamClassifier - Sticky Log, Tried First for Next Record"""
+        entity = 'unit_test_default_stream'
+        data = {'date': 'Jan 01 2017', 'unixtime': 1485556524, 'host': 'host1', 'data': {}}
+        raw_record = make_kinesis_raw_record(entity, json.dumps(data))
+        payload = list(load_stream_payload('kinesis', entity, raw_record).pre_parse())[0]
+        self.classifier.load_sources('kinesis', entity)
+
+        schema_matches = self.classifier._process_log_schemas(payload)
+        assert_equal(schema_matches[0].log_name, 'test_log_type_json_nested')
+        assert_equal(payload.sticky_log.log_name, 'test_log_type_json_nested')
+
+        # Emulate the next record of a multi-record payload with a different shape
+        data['data'] = {'key': 'value'}
+        payload._refresh_record(json.dumps(data))
+        with patch.object(sa_classifier.StreamClassifier, '_match_log',
+                          wraps=self.classifier._match_log) as match_mock:
+            schema_matches = self.classifier._process_log_schemas(payload)
+            match_mock.assert_called_once()
+
+        assert_equal(schema_matches[0].log_name, 'test_log_type_json_nested')
+        assert_equal(self.classifier.sticky_fallbacks, 0)
+
+    def test_sticky_log_csv(self):
+        """StreamClassifier - Sticky Log, Used for Non JSON Logs"""
+        entity = 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(
+            entity, 'jan102017,0100,host1,thisis some data with keyword1 in it')
+        payload = list(load_stream_payload('kinesis', entity, raw_record).pre_parse())[0]
+        self.classifier.load_sources('kinesis', entity)
+
+        schema_matches = self.classifier._process_log_schemas(payload)
+        assert_equal(schema_matches[0].log_name, 'test_log_type_csv')
+
+        payload._refresh_record('jan102017,0200,host2,more data with keyword1 in it')
+        with patch.object(sa_classifier.StreamClassifier, '_match_log',
+                          wraps=self.classifier._match_log) as match_mock:
+            schema_matches = self.classifier._process_log_schemas(payload)
+            match_mock.assert_called_once()
+
+        assert_equal(schema_matches[0].log_name, 'test_log_type_csv')
+        assert_equal(schema_matches[0].parsed_data[0]['host'], 'host2')
+        assert_equal(self.classifier.sticky_fallbacks, 0)
+
+    def test_sticky_log_fallback(self):
+        """StreamClassifier - Sticky Log, Fall Back on Full Plan"""
+        entity = 'unit_test_default_stream'
+        data = {'date': 'Jan 01 2017', 'unixtime': 1485556524, 'host': 'host1', 'data': {}}
+        raw_record = make_kinesis_raw_record(entity, json.dumps(data))
+        payload = list(load_stream_payload('kinesis', entity, raw_record).pre_parse())[0]
+        self.classifier.load_sources('kinesis', entity)
+
+        self.classifier._process_log_schemas(payload)
+
+        payload._refresh_record(json.dumps({'unit_key_01': 1, 'unit_key_02': 'test'}))
+        schema_matches = self.classifier._process_log_schemas(payload)
+
+        assert_equal(schema_matches[0].log_name, 'unit_test_simple_log')
+        assert_equal(payload.sticky_log.log_name, 'unit_test_simple_log')
+        assert_equal(self.classifier.sticky_fallbacks, 1)
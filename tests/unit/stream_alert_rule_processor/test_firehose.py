@@ -0,0 +1,168 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use
+import threading
+
+from nose.tools import assert_equal, assert_false, assert_is, assert_true
+
+from stream_alert.rule_processor.firehose import (
+    build_firehose_routes,
+    FirehoseBuffer,
+    MAX_BATCH_COUNT,
+    MAX_BATCH_SIZE,
+    sanitize_keys
+)
+
+
+def test_build_firehose_routes():
+    """Firehose - Build Routes"""
+    config = {
+        'global': {'infrastructure': {'firehose': {'disabled_logs': ['cloudwatch']}}},
+        'logs': {
+            'cloudwatch:events': {'schema': {'detail-type': 'string'}},
+            'osquery': {'schema': {'name': 'string', 'columns': {}, 'data': {'my-key': 'string'}}}
+        }
+    }
+
+    routes = build_firehose_routes(config)
+
+    assert_false(routes['cloudwatch:events'].enabled)
+    assert_equal(routes['cloudwatch:events'].stream_name, 'streamalert_data_cloudwatch_events')
+    assert_true(routes['osquery'].enabled)
+    assert_equal(routes['osquery'].key_map, {
+        'name': ('name', None),
+        'columns': ('columns', None),
+        'data': ('data', {'my-key': ('my_key', None)})
+    })
+
+
+def test_sanitize_keys_clean_record():
+    """Firehose - Sanitize Keys Returns Clean Records As Is"""
+    record = {'key': 'value', 'nested': {'sub_key': 1}}
+    assert_is(sanitize_keys(record), record)
+
+
+def test_sanitize_keys_key_map():
+    """Firehose - Sanitize Keys With Key Map"""
+    key_map = {
+        'my-key': ('my_key', None),
+        'clean': ('clean', {'clean_key': ('clean_key', None)}),
+        'columns': ('columns', None)
+    }
+    record = {
+        'my-key': 'value',
+        'clean': {'clean_key': 1},
+        'columns': {'unknown-key': 2}
+    }
+
+    sanitized = sanitize_keys(record, key_map)
+
+    assert_equal(sanitized, {
+        'my_key': 'value',
+        'clean': {'clean_key': 1},
+        'columns': {'unknown_key': 2}
+    })
+    # Nested maps with clean keys are not copied
+    assert_is(sanitized['clean'], record['clean'])
+    assert_equal(record['my-key'], 'value')
+
+
+class TestFirehoseBuffer(object):
+    """Test class for FirehoseBuffer"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.batches = []
+        self.buffer = FirehoseBuffer(self._send_batch, max_buffered_bytes=MAX_BATCH_SIZE * 4)
+
+    def _send_batch(self, log_type, batch):
+        """Collect the batches sent by the buffer"""
+        self.batches.append((log_type, batch))
+        self.buffer.batch_sent(batch)
+
+    def test_batches_by_size(self):
+        """FirehoseBuffer - Send Full Batches by Size"""
+        # Each record is 80KB, so 50 of them fit exactly in a single batch
+        self.buffer.add('test_log', ['a' * 79999 + '\n'] * 101)
+
+        # Full batches are sent as records are added
+        assert_equal([len(batch) for _, batch in self.batches], [50, 50])
+        assert_equal(len(''.join(self.batches[0][1])), MAX_BATCH_SIZE)
+
+        self.buffer.flush()
+        assert_equal([len(batch) for _, batch in self.batches], [50, 50, 1])
+        assert_equal(self.buffer.buffered_bytes, 0)
+
+    def test_batches_by_count(self):
+        """FirehoseBuffer - Send Full Batches by Count"""
+        self.buffer.add('test_log', ['{}\n'] * (MAX_BATCH_COUNT * 2 + 1))
+        self.buffer.flush()
+
+        assert_equal([len(batch) for _, batch in self.batches],
+                     [MAX_BATCH_COUNT, MAX_BATCH_COUNT, 1])
+
+    def test_byte_budget(self):
+        """FirehoseBuffer - Send Largest Buffer When Over Budget"""
+        self.buffer = FirehoseBuffer(self._send_batch, max_buffered_bytes=100)
+        self.buffer.add('small_log', ['a' * 19 + '\n'])
+        self.buffer.add('large_log', ['a' * 39 + '\n'] * 2)
+
+        assert_equal(self.batches, [])
+
+        self.buffer.add('small_log', ['a' * 19 + '\n'])
+
+        assert_equal(self.batches, [('large_log', ['a' * 39 + '\n'] * 2)])
+        assert_equal(self.buffer.buffered_bytes, 40)
+        assert_equal(self.buffer.peak_buffered_bytes, 120)
+
+    def test_in_flight_backpressure(self):
+        """FirehoseBuffer - Block Until In Flight Batches Are Sent When Over Budget"""
+        def _send_batch_later(log_type, batch):
+            self.batches.append((log_type, batch))
+            timer = threading.Timer(0.01, self.buffer.batch_sent, [batch])
+            timer.start()
+
+        self.buffer = FirehoseBuffer(_send_batch_later, max_buffered_bytes=100)
+        self.buffer.add('large_log', ['a' * 39 + '\n'] * 2)
+        self.buffer.add('small_log', ['a' * 39 + '\n'])
+
+        # The large buffer was sent, and adding waited until it was no longer in flight
+        assert_equal(self.batches, [('large_log', ['a' * 39 + '\n'] * 2)])
+        assert_equal(self.buffer.in_flight_bytes, 0)
+        assert_equal(self.buffer.buffered_bytes, 40)
+        assert_equal(self.buffer.peak_buffered_bytes, 120)
+
+    def test_in_flight_peak(self):
+        """FirehoseBuffer - Count In Flight Batches Toward the Peak"""
+        self.buffer = FirehoseBuffer(lambda log_type, batch: None)
+        self.buffer.add('test_log', ['{}\n'] * (MAX_BATCH_COUNT + 1))
+
+        assert_equal(self.buffer.in_flight_bytes, MAX_BATCH_COUNT * 3)
+        assert_equal(self.buffer.buffered_bytes, 3)
+        assert_equal(self.buffer.peak_buffered_bytes, (MAX_BATCH_COUNT + 1) * 3)
+
+    def test_flush_log_types(self):
+        """FirehoseBuffer - Flush Each Log Type Separately"""
+        self.buffer.add('log_01', ['{"a":1}\n'])
+        self.buffer.add('log_02', ['{"b":2}\n', '{"b":3}\n'])
+        self.buffer.flush()
+        self.buffer.flush()
+
+        assert_equal(sorted(self.batches), [
+            ('log_01', ['{"a":1}\n']),
+            ('log_02', ['{"b":2}\n', '{"b":3}\n'])
+        ])
+        assert_equal(self.buffer.peak_buffered_bytes, 24)
@@ -14,16 +14,19 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 # pylint: disable=protected-access
+from copy import deepcopy
 import base64
+import json
 import logging
 
-from mock import call, patch
+from mock import call, Mock, patch
 from moto import mock_kinesis
 from nose.tools import (
     assert_equal,
     assert_false,
     assert_list_equal,
-    assert_true
+    assert_true,
+    raises
 )
 import boto3
 
@@ -49,6 +52,13 @@ class TestStreamAlert(object):
         """Setup before each method"""
         self.__sa_handler = StreamAlert(get_mock_context(), False)
 
+    def test_s3_reserved_time(self):
+        """StreamAlert Class - S3 Reserved Time From a 10 Second Timeout"""
+        context = get_mock_context()
+        context.get_remaining_time_in_millis.return_value = 10000
+
+        assert_equal(StreamAlert(context, False)._s3_reserved_time, 2000)
+
     def test_run_no_records(self):
         """StreamAlert Class - Run, No Records"""
         passed = self.__sa_handler.run({'Records': []})
@@ -112,7 +122,68 @@ class TestStreamAlert(object):
         load_payload_mock.assert_called_with(
             'lambda',
             'entity',
-            'record'
+            'record',
+            remaining_time=self.__sa_handler._remaining_time,
+            reserved_time=5000,
+            checkpoint_store=self.__sa_handler._checkpoint_store
+        )
+
+    @patch('stream_alert.rule_processor.handler.StreamAlert._log_metrics')
+    @patch('stream_alert.rule_processor.handler.StreamAlert._invoke_continuations')
+    @raises(ValueError)
+    def test_run_io_task_error(self, continuations_mock, metrics_mock):
+        """StreamAlert Class - Run, Continue and Log Metrics When an I/O Task Fails"""
+        self.__sa_handler._io_pool.submit(Mock(side_effect=ValueError('bad'), __name__='task'))
+        try:
+            self.__sa_handler.run(get_valid_event())
+        finally:
+            assert_true(continuations_mock.called)
+            assert_true(metrics_mock.called)
+
+    @patch('stream_alert.rule_processor.handler.StreamAlert._process_alerts')
+    @raises(ValueError)
+    def test_run_process_error(self, process_mock):
+        """StreamAlert Class - Run, Drain the I/O Pool When Processing Fails"""
+        process_mock.side_effect = ValueError('bad')
+        io_pool = self.__sa_handler._io_pool
+        task = Mock(__name__='task')
+        io_pool.submit(task)
+        with patch.object(io_pool, 'shutdown', wraps=io_pool.shutdown) as shutdown_mock:
+            try:
+                self.__sa_handler.run(get_valid_event())
+            finally:
+                shutdown_mock.assert_called_once()
+                assert_true(task.called)
+
+    @patch('stream_alert.rule_processor.handler.boto3.client')
+    @patch('stream_alert.rule_processor.handler.load_stream_payload')
+    @patch('stream_alert.rule_processor.handler.StreamClassifier.load_sources')
+    @patch('stream_alert.rule_processor.handler.StreamClassifier.extract_service_and_entity')
+    def test_run_s3_continuation(
+            self,
+            extract_mock,
+            load_sources_mock,
+            load_payload_mock,
+            client_mock):
+        """StreamAlert Class - Run, Continue Partially Read S3 Object"""
+        extract_mock.return_value = ('s3', 'unit_bucket_name')
+        load_sources_mock.return_value = True
+        continuation_record = {
+            's3': {'object': {'key': 'unit_key_name'}},
+            'streamalert_checkpoint': {'offset': 1024, 'skip_lines': 0}
+        }
+        payload = load_payload_mock.return_value
+        payload.service.return_value = 's3'
+        payload.pre_parse.return_value = []
+        payload.continuation_record.return_value = continuation_record
+
+        self.__sa_handler.run({'Records': ['record']})
+
+        client_mock.return_value.invoke.assert_called_with(
+            FunctionName='corp-prefix_prod_streamalert_rule_processor',
+            InvocationType='Event',
+            Payload=json.dumps({'Records': [continuation_record]}),
+            Qualifier='development'
         )
 
     @patch('stream_alert.rule_processor.handler.StreamRules.process')
@@ -158,10 +229,11 @@ class TestStreamAlert(object):
             'Record does not match any defined schemas: %s\n%s')
         assert_equal(log_mock.call_args[0][2], '{"bad": "data"}')
 
+    @patch('stream_alert.rule_processor.sink.StreamSink.flush')
     @patch('stream_alert.rule_processor.sink.StreamSink.sink')
     @patch('stream_alert.rule_processor.handler.StreamRules.process')
     @patch('stream_alert.rule_processor.handler.StreamClassifier.extract_service_and_entity')
-    def test_run_send_alerts(self, extract_mock, rules_mock, sink_mock):
+    def test_run_send_alerts(self, extract_mock, rules_mock, sink_mock, flush_mock):
         """StreamAlert Class - Run, Send Alert"""
         extract_mock.return_value = ('kinesis', 'unit_test_default_stream')
         rules_mock.return_value = ['success!!']
@@ -175,6 +247,7 @@ class TestStreamAlert(object):
         self.__sa_handler.run(get_valid_event())
 
         sink_mock.assert_called_with(['success!!'])
+        flush_mock.assert_called_once()
 
     @patch('logging.Logger.debug')
     @patch('stream_alert.rule_processor.handler.StreamRules.process')
@@ -374,11 +447,12 @@ class TestStreamAlert(object):
             self.__sa_handler.run(test_event)
 
             firehose_mock.assert_called()
-            assert_true(mock_logging.info.called)
+            # Backoff attempts are patched to 1 for this class, so failures are not retried
+            assert_true(mock_logging.error.called)
 
     @patch('stream_alert.rule_processor.handler.LOGGER')
-    def test_firehose_limit_record_size(self, mock_logging):
-        """StreamAlert Class - Firehose - Record Size Check"""
+    def test_firehose_serialize_records(self, mock_logging):
+        """StreamAlert Class - Firehose - Serialize Records and Drop Large Records"""
         test_events = [
             # unit_test_simple_log
             {
@@ -392,17 +466,20 @@ class TestStreamAlert(object):
             # test_log_type_json_nested
             {
                 'date': 'January 01, 3005',
-                'unixtime': '32661446400',
-                'host': 'my-host.name.website.com',
                 'data': {
-                    'super': 'secret'
+                    'super-duper': 'secret'
                 }
             }
         ]
 
-        self.__sa_handler._limit_record_size(test_events)
+        serialized_records = self.__sa_handler._serialize_records(test_events)
 
-        assert_true(len(test_events), 2)
+        assert_true(all(data.endswith('\n') for data in serialized_records))
+        assert_equal([json.loads(data) for data in serialized_records], [
+            {'unit_key_01': 2, 'unit_key_02': 'test'},
+            {'date': 'January 01, 3005', 'data': {'super_duper': 'secret'}}
+        ])
+        assert_equal(len(test_events), 3)
         assert_true(mock_logging.error.called)
 
     @patch('stream_alert.rule_processor.handler.LOGGER')
@@ -487,24 +564,6 @@ class TestStreamAlert(object):
         sanitized_event = self.__sa_handler.sanitize_keys(test_event)
         assert_equal(sanitized_event, expected_sanitized_event)
 
-    def test_firehose_segment_records_by_size(self):
-        """StreamAlert Class - Firehose - Segment Large Records"""
-
-        record_batch = [
-            # unit_test_simple_log
-            {'unit_key_01': 2, 'unit_key_02': 'testtest' * 10000}
-            for _
-            in range(100)]
-
-        sized_batches = []
-
-        for sized_batch in self.__sa_handler._segment_records_by_size(record_batch):
-            sized_batches.append(sized_batch)
-
-        assert_true(len(str(sized_batches[0])) < 4000000)
-        assert_equal(len(sized_batches), 4)
-        assert_true(isinstance(sized_batches[3][0], dict))
-
     @mock_kinesis
     def test_firehose_record_delivery_disabled_logs(self):
         """StreamAlert Class - Firehose Record Delivery - Disabled Logs"""
@@ -538,12 +597,26 @@ class TestStreamAlert(object):
         with patch.object(self.__sa_handler.firehose_client, 'put_record_batch') as firehose_mock:
             firehose_mock.return_value = {'FailedPutCount': 0}
 
-            self.__sa_handler.config['global']['infrastructure']['firehose'] = {
+            # The routes are built with the config, so load a changed copy of it
+            config = deepcopy(self.__sa_handler.config)
+            config['global']['infrastructure']['firehose'] = {
                 'disabled_logs': ['unit_test_simple_log']}
-            self.__sa_handler.run(test_event)
+            with patch.object(StreamAlert, 'config', config):
+                firehose_client = self.__sa_handler.firehose_client
+                self.__sa_handler = StreamAlert(get_mock_context(), False)
+                self.__sa_handler.firehose_client = firehose_client
+                self.__sa_handler.run(test_event)
 
             firehose_mock.assert_not_called()
 
+    def test_firehose_routes_cached(self):
+        """StreamAlert Class - Firehose Routes Built Once for the Config"""
+        with patch('stream_alert.rule_processor.handler.build_firehose_routes') as build_mock:
+            StreamAlert(get_mock_context(), False)
+            build_mock.assert_not_called()
+
+        assert_true('unit_test_simple_log' in StreamAlert._firehose_routes)
+
     @patch('stream_alert.rule_processor.handler.LOGGER')
     @mock_kinesis
     def test_firehose_record_delivery_client_error(self, mock_logging):
@@ -553,7 +626,7 @@ class TestStreamAlert(object):
 
         test_events = [
             # unit_test_simple_log
-            {'unit_key_01': 2, 'unit_key_02': 'testtest'}
+            '{"unit_key_01":2,"unit_key_02":"testtest"}\n'
             for _
             in range(10)]
 
@@ -27,7 +27,8 @@ def get_mock_context():
     """Create a fake context object using Mock"""
     arn = 'arn:aws:lambda:{}:123456789012:function:{}:development'
     context = Mock(invoked_function_arn=(arn.format(REGION, FUNCTION_NAME)),
-                   function_name=FUNCTION_NAME)
+                   function_name=FUNCTION_NAME,
+                   get_remaining_time_in_millis=Mock(return_value=300000))
 
     return context
 
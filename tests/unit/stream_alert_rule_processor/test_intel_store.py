@@ -0,0 +1,140 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+import os
+import shutil
+import tempfile
+
+from nose.tools import (
+    assert_equal,
+    assert_false,
+    assert_is_none,
+    assert_list_equal,
+    assert_true,
+    raises
+)
+
+from stream_alert.rule_processor.intel_store import (
+    IntelOverlay,
+    IntelStore,
+    IntelStoreError,
+    write_intel_store
+)
+
+
+class TestIntelStore(object):
+    """Test class for IntelStore"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'domain.ioc')
+        self.indicators = {
+            'evil1.com': ['apt_domain', 'source1 reported evil1.com'],
+            'evil2.com': ['c2_domain', 'source2 reported evil2.com'],
+            'b\xc3\xa4d.com': ['c2_domain', 'source3']
+        }
+        write_intel_store(self.path, self.indicators)
+        self.store = IntelStore(self.path)
+
+    def teardown(self):
+        """Teardown after each method"""
+        self.store.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_lookup(self):
+        """IntelStore - Lookup"""
+        for key, values in self.indicators.iteritems():
+            assert_true(key in self.store)
+            assert_equal(self.store[key], values)
+
+        assert_equal(self.store.get('evil1.com'), ['apt_domain', 'source1 reported evil1.com'])
+        assert_is_none(self.store.get('good.com'))
+        assert_false('evil0.com' in self.store)
+        assert_false('evil3.com' in self.store)
+
+    def test_lookup_unicode(self):
+        """IntelStore - Lookup, Unicode Indicator"""
+        assert_true(u'evil1.com' in self.store)
+        assert_true(u'b\xe4d.com' in self.store)
+
+    def test_lookup_non_string(self):
+        """IntelStore - Lookup, Non-String Indicator"""
+        assert_false(100 in self.store)
+        assert_false(None in self.store)
+
+    def test_iterate(self):
+        """IntelStore - Iterate in Sorted Order"""
+        assert_equal(len(self.store), 3)
+        assert_list_equal(list(self.store), sorted(self.indicators))
+
+    def test_empty(self):
+        """IntelStore - Empty Store"""
+        path = os.path.join(self.temp_dir, 'ip.ioc')
+        write_intel_store(path, {})
+        store = IntelStore(path)
+
+        assert_equal(len(store), 0)
+        assert_false('1.1.1.1' in store)
+        store.close()
+
+    @raises(IntelStoreError)
+    def test_invalid_store(self):
+        """IntelStore - Invalid Store File"""
+        path = os.path.join(self.temp_dir, 'md5.ioc')
+        with open(path, 'wb') as store_file:
+            store_file.write('not an intel store')
+
+        IntelStore(path)
+
+
+class TestIntelOverlay(object):
+    """Test class for IntelOverlay"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.base = {
+            'evil1.com': ['apt_domain', 'source1'],
+            'evil2.com': ['c2_domain', 'source2']
+        }
+        self.overlay = IntelOverlay(self.base).apply(
+            {'evil3.com': ['c2_domain', 'source3'], 'evil2.com': ['c2_domain', 'updated']},
+            ['evil1.com', 'good.com'])
+
+    def test_lookup(self):
+        """IntelOverlay - Lookup"""
+        assert_false('evil1.com' in self.overlay)
+        assert_equal(self.overlay['evil2.com'], ['c2_domain', 'updated'])
+        assert_equal(self.overlay[u'evil3.com'], ['c2_domain', 'source3'])
+        assert_is_none(self.overlay.get('evil1.com'))
+        assert_false(None in self.overlay)
+
+    def test_length_and_iterate(self):
+        """IntelOverlay - Length and Iterate"""
+        assert_equal(len(self.overlay), 2)
+        assert_equal(sorted(self.overlay), ['evil2.com', 'evil3.com'])
+
+    def test_apply_does_not_modify(self):
+        """IntelOverlay - Apply Returns a New Overlay"""
+        overlay = self.overlay.apply({'evil1.com': ['apt_domain', 'readded']}, ['evil3.com'])
+
+        assert_true('evil1.com' in overlay)
+        assert_false('evil3.com' in overlay)
+        assert_equal(len(overlay), 2)
+
+        assert_false('evil1.com' in self.overlay)
+        assert_true('evil3.com' in self.overlay)
+        assert_equal(len(self.base), 2)
@@ -0,0 +1,117 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+import os
+import threading
+import time
+
+from mock import patch
+from nose.tools import assert_equal, assert_true, raises
+
+from stream_alert.rule_processor.io_pool import (
+    DEFAULT_IO_WORKERS,
+    io_worker_count,
+    IOWorkerPool
+)
+
+
+class TestIOWorkerPool(object):
+    """Test class for IOWorkerPool"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.pool = IOWorkerPool(4)
+
+    def teardown(self):
+        """Teardown after each method"""
+        self.pool.shutdown()
+
+    def test_serial(self):
+        """IOWorkerPool - Run Tasks Inline With One Worker"""
+        pool = IOWorkerPool(1)
+        results = []
+        pool.submit(results.append, 'value', key='key')
+
+        assert_equal(results, ['value'])
+        assert_equal(pool._workers, [])
+
+    def test_concurrent(self):
+        """IOWorkerPool - Run Tasks Concurrently"""
+        barrier = threading.Event()
+        results = []
+
+        def _task(value):
+            # All tasks block until the last one runs, so they must run concurrently
+            if value == 3:
+                barrier.set()
+            assert_true(barrier.wait(5))
+            results.append(value)
+
+        for value in range(4):
+            self.pool.submit(_task, value)
+        self.pool.wait()
+
+        assert_equal(sorted(results), [0, 1, 2, 3])
+        assert_equal(len(self.pool._workers), 4)
+
+    def test_key_ordering(self):
+        """IOWorkerPool - Tasks With the Same Key Run in Order"""
+        results = []
+
+        def _task(value):
+            time.sleep(0.001 * (10 - value))
+            results.append(value)
+
+        for value in range(10):
+            self.pool.submit(_task, value, key='stream')
+        self.pool.wait()
+
+        assert_equal(results, range(10))
+        assert_equal(self.pool._pending, {})
+
+    @patch('stream_alert.rule_processor.io_pool.LOGGER')
+    @raises(ValueError)
+    def test_wait_raises(self, log_mock):
+        """IOWorkerPool - Raise Task Exception on Wait"""
+        def _task():
+            raise ValueError('bad')
+
+        self.pool.submit(_task)
+        try:
+            self.pool.wait()
+        finally:
+            log_mock.exception.assert_called_with('An error occurred in I/O task %s', '_task')
+
+    def test_shutdown_stops_workers(self):
+        """IOWorkerPool - Shutdown Stops Workers"""
+        self.pool.submit(time.sleep, 0)
+        self.pool.shutdown()
+
+        assert_equal(self.pool._workers, [])
+
+
+@patch.dict(os.environ, {'IO_WORKERS': '8'})
+def test_io_worker_count():
+    """IOWorkerPool - Worker Count From Environment"""
+    assert_equal(io_worker_count(), 8)
+
+
+@patch('stream_alert.rule_processor.io_pool.LOGGER')
+@patch.dict(os.environ, {'IO_WORKERS': 'bad'})
+def test_io_worker_count_invalid(log_mock):
+    """IOWorkerPool - Invalid Worker Count From Environment"""
+    assert_equal(io_worker_count(), DEFAULT_IO_WORKERS)
+    assert_true(log_mock.error.called)
@@ -0,0 +1,95 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+from mock import patch
+from netaddr import IPAddress, IPNetwork
+from nose.tools import assert_equal, assert_false, assert_is, assert_true
+
+from stream_alert.rule_processor import networks
+from stream_alert.rule_processor.networks import compile_networks, NetworkSet
+
+
+class TestNetworkSet(object):
+    """Test class for NetworkSet"""
+
+    def setup(self):
+        """Setup before each method"""
+        networks._NETWORK_SETS.clear()
+        networks._NETWORK_SETS_BY_ID.clear()
+
+    def test_merge_intervals(self):
+        """NetworkSet - Merge Overlapping and Adjacent Networks"""
+        network_set = NetworkSet(['10.0.16.0/24', '10.0.17.0/24', '10.0.16.128/25',
+                                  '192.168.0.0/16', '2001:db8::/32'])
+
+        assert_equal(len(network_set), 3)
+        assert_equal(network_set._intervals[4][0],
+                     (IPNetwork('10.0.16.0/24').first, IPNetwork('192.168.0.0/16').first))
+        assert_equal(network_set._intervals[4][1],
+                     (IPNetwork('10.0.17.0/24').last, IPNetwork('192.168.0.0/16').last))
+
+    def test_contains(self):
+        """NetworkSet - Contains"""
+        cidrs = ['10.0.16.0/24', '10.0.18.0/24', '172.16.0.1/32', '2001:db8::/32']
+        network_set = NetworkSet(cidrs)
+
+        for ip_address in ('10.0.16.0', '10.0.16.255', '10.0.17.0', '10.0.18.24',
+                           '10.0.19.0', '172.16.0.1', '172.16.0.2', '0.0.0.0',
+                           '255.255.255.255', '2001:db8::1', '2001:db9::1', '::ffff:a00:1018'):
+            assert_equal(ip_address in network_set,
+                         any(ip_address in IPNetwork(cidr) for cidr in cidrs), ip_address)
+
+        assert_true(IPAddress('10.0.18.1') in network_set)
+
+    @patch('logging.Logger.error')
+    def test_invalid_network(self, log_mock):
+        """NetworkSet - Invalid Network"""
+        network_set = NetworkSet(['10.0.16.0/24', 'not a network'])
+
+        log_mock.assert_called_with('Invalid IP Network: %s', 'not a network')
+        assert_true('10.0.16.1' in network_set)
+
+    def test_empty(self):
+        """NetworkSet - Empty"""
+        assert_false('10.0.16.1' in NetworkSet([]))
+
+    def test_compile_networks_cached(self):
+        """NetworkSet - Compile Networks, Cached by Content"""
+        network_set = compile_networks({'10.0.16.0/24', '10.0.17.0/24'})
+
+        assert_is(compile_networks(['10.0.17.0/24', '10.0.16.0/24']), network_set)
+        assert_is(compile_networks(network_set), network_set)
+
+    def test_compile_networks_cached_by_id(self):
+        """NetworkSet - Compile Networks, Reused Collection Found by Identity"""
+        cidrs = {'10.0.16.0/24', '10.0.17.0/24'}
+        network_set = compile_networks(cidrs)
+
+        with patch('stream_alert.rule_processor.networks.frozenset') as frozenset_mock:
+            assert_is(compile_networks(cidrs), network_set)
+            frozenset_mock.assert_not_called()
+
+        # A collection changed in place is compiled again
+        cidrs.add('10.0.18.0/24')
+        assert_true('10.0.18.1' in compile_networks(cidrs))
+
+    @patch('stream_alert.rule_processor.networks.NETWORK_CACHE_SIZE', 1)
+    def test_compile_networks_cache_reset(self):
+        """NetworkSet - Compile Networks, Cache Reset When Full"""
+        compile_networks(['10.0.16.0/24'])
+        compile_networks(['10.0.17.0/24'])
+
+        assert_equal(networks._NETWORK_SETS.keys(), [frozenset(['10.0.17.0/24'])])
@@ -15,6 +15,7 @@ limitations under the License.
 """
 import json
 
+import jsonpath_rw
 from mock import patch
 from nose.tools import (
     assert_equal,
@@ -26,7 +27,8 @@ from nose.tools import (
 )
 
 from stream_alert.rule_processor.config import load_config
-from stream_alert.rule_processor.parsers import get_parser
+from stream_alert.rule_processor import parsers
+from stream_alert.rule_processor.parsers import compile_json_path, get_parser
 
 
 class TestParser(object):
@@ -490,6 +492,30 @@ class TestJSONParser(TestParser):
         assert_false(any([record['computer_name'] ==
                           'wethebest-03.prod.streamalert.io' for record in parsed_result]))
 
+    def test_pre_decoded_data_not_modified(self):
+        """JSON Parser - Pre-decoded Data is Not Modified"""
+        schema = self.config['logs']['test_cloudwatch']['schema']
+        options = self.config['logs']['test_cloudwatch']['configuration']
+
+        with open('tests/unit/fixtures/cloudwatch.json', 'r') as fixture_file:
+            data = fixture_file.readline().strip()
+
+        decoded_data = self.parser_class.decode(data)
+        original_data = json.loads(data)
+
+        parsed_result = self.parser_helper(data=decoded_data,
+                                           schema=schema,
+                                           options=options)
+
+        assert_equal(80, len(parsed_result))
+        assert_true('streamalert:envelope_keys' in parsed_result[0])
+        # The envelope should only be added to the parsed records
+        assert_equal(decoded_data, original_data)
+
+    def test_decode_invalid(self):
+        """JSON Parser - Decode Invalid JSON"""
+        assert_equal(self.parser_class.decode('{"bad": json'), None)
+
     def test_optional_keys_with_json_path(self):
         """JSON Parser - Optional top level keys and json path"""
         schema = {
@@ -552,3 +578,49 @@ class TestJSONParser(TestParser):
         assert_equal(parsed_result[0]['opt_key'], 'exists')
         assert_equal(parsed_result[1]['another_opt_key'], 'this_value_is_also_optional')
         assert_equal(parsed_result[2]['opt_key'], '')
+
+
+class TestCompileJSONPath(object):
+    """Test class for compile_json_path"""
+    def setup(self):
+        """Setup before each method"""
+        parsers._JSON_PATHS.clear()
+        self.data = {
+            'Records': [{'id': 1}, {'id': 2}],
+            'logEvents': [
+                {'extractedFields': {'name': 'a'}},
+                {'message': 'no extracted fields'},
+                {'extractedFields': {'name': 'b'}}
+            ],
+            'profiles': {'controls': {'name': 'single'}},
+            'owner': 'owner_value',
+            'logGroup': 'group_value',
+            'empty': None
+        }
+
+    def _assert_matches_jsonpath_rw(self, expression):
+        """Helper to assert the compiled expression matches the jsonpath_rw result"""
+        expected = [match.value for match in jsonpath_rw.parse(expression).find(self.data)]
+        assert_equal(compile_json_path(expression)(self.data), expected)
+
+    def test_simple_expressions(self):
+        """Compile JSONPath - Simple Expressions Match jsonpath_rw"""
+        for expression in ('Records[*]', 'logEvents[*].extractedFields', 'profiles.controls[*]',
+                           '$.owner,logGroup', '$.owner,missing,logGroup', 'Records[*].id',
+                           'missing[*]', 'owner.missing', '$'):
+            yield self._assert_matches_jsonpath_rw, expression
+
+    def test_simple_expression_no_jsonpath_rw(self):
+        """Compile JSONPath - Simple Expressions Do Not Use jsonpath_rw"""
+        with patch('jsonpath_rw.parse') as parse_mock:
+            compile_json_path('logEvents[*].extractedFields')(self.data)
+            parse_mock.assert_not_called()
+
+    def test_complex_expression(self):
+        """Compile JSONPath - Complex Expressions Fall Back to jsonpath_rw"""
+        assert_equal(compile_json_path('Records[1].id')(self.data), [2])
+        assert_items_equal(compile_json_path('$..name')(self.data), ['a', 'b', 'single'])
+
+    def test_cached(self):
+        """Compile JSONPath - Expressions are Cached"""
+        assert_true(compile_json_path('Records[*]') is compile_json_path('Records[*]'))
@@ -0,0 +1,89 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+from fnmatch import fnmatch
+
+from mock import patch
+from nose.tools import assert_equal, assert_false, assert_is, assert_is_none, assert_true
+
+from stream_alert.rule_processor import patterns
+from stream_alert.rule_processor.patterns import compile_patterns, PatternSet
+
+
+class TestPatternSet(object):
+    """Test class for PatternSet"""
+
+    def setup(self):
+        """Setup before each method"""
+        patterns._PATTERN_SETS.clear()
+        patterns._PATTERN_SETS_BY_ID.clear()
+
+    def test_split_literals_and_globs(self):
+        """PatternSet - Split Literals and Globs"""
+        pattern_set = PatternSet(['DeleteTrail', 'Stop*', 'host-?', '[ab]cd'])
+
+        assert_equal(pattern_set.literals, frozenset(['DeleteTrail']))
+        assert_equal(pattern_set.globs, ('Stop*', '[ab]cd', 'host-?'))
+
+    def test_literals_only(self):
+        """PatternSet - Literals Only"""
+        pattern_set = PatternSet({'DeleteTrail', 'StopLogging'})
+
+        assert_is_none(pattern_set._regex)
+        assert_true(pattern_set.matches('StopLogging'))
+        assert_false(pattern_set.matches('StopLoggingNow'))
+        assert_false(pattern_set.matches(None))
+
+    def test_matches_fnmatch(self):
+        """PatternSet - Matches Same Values as fnmatch"""
+        globs = ['DeleteTrail', '*file_added_event*', 'host-?', '[ab]cd', '[!x]yz',
+                 'a.b', 'end$', '*.example.com', u'unicode-\xe9*']
+        values = ['DeleteTrail', 'lol_file_added_event_test', 'host-1', 'host-12', 'acd',
+                  'ccd', 'xyz', 'yyz', 'a.b', 'axb', 'end$', 'end', 'www.example.com',
+                  'example.com', 'line\nfile_added_event', u'unicode-\xe9test', '']
+
+        pattern_set = PatternSet(globs)
+        for value in values:
+            assert_equal(pattern_set.matches(value),
+                         any(fnmatch(value, pattern) for pattern in globs), value)
+
+    def test_compile_patterns_cached(self):
+        """PatternSet - Compile Patterns, Cached by Content"""
+        pattern_set = compile_patterns({'Stop*', 'DeleteTrail'})
+
+        assert_is(compile_patterns(['DeleteTrail', 'Stop*']), pattern_set)
+        assert_is(compile_patterns(pattern_set), pattern_set)
+
+    def test_compile_patterns_cached_by_id(self):
+        """PatternSet - Compile Patterns, Reused Collection Found by Identity"""
+        whitelist = {'Stop*', 'DeleteTrail'}
+        pattern_set = compile_patterns(whitelist)
+
+        with patch('stream_alert.rule_processor.patterns.frozenset') as frozenset_mock:
+            assert_is(compile_patterns(whitelist), pattern_set)
+            frozenset_mock.assert_not_called()
+
+        # A collection changed in place is compiled again
+        whitelist.add('UpdateTrail')
+        assert_true(compile_patterns(whitelist).matches('UpdateTrail'))
+
+    @patch('stream_alert.rule_processor.patterns.PATTERN_CACHE_SIZE', 1)
+    def test_compile_patterns_cache_reset(self):
+        """PatternSet - Compile Patterns, Cache Reset When Full"""
+        compile_patterns(['a*'])
+        compile_patterns(['b*'])
+
+        assert_equal(patterns._PATTERN_SETS.keys(), [frozenset(['b*'])])
@@ -14,24 +14,31 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 # pylint: disable=protected-access
+from StringIO import StringIO
 import json
 import gzip
 import logging
-import os
-import tempfile
 
-from mock import call, patch
+from botocore.response import StreamingBody
+from mock import call, Mock, patch
 from nose.tools import (
     assert_equal,
     assert_false,
     assert_is_instance,
     assert_is_none,
-    raises,
+    assert_raises,
+    assert_true,
     with_setup
 )
 
 from stream_alert.rule_processor import LOGGER
-from stream_alert.rule_processor.payload import load_stream_payload, S3ObjectSizeError, S3Payload
+from stream_alert.rule_processor.checkpoint import S3Checkpoint
+from stream_alert.rule_processor.payload import (
+    load_stream_payload,
+    s3_reserved_time,
+    S3Payload,
+    S3ResumeError
+)
 from tests.unit.stream_alert_rule_processor.test_helpers import (
     make_kinesis_raw_record,
     make_s3_raw_record,
@@ -152,7 +159,7 @@ def test_pre_parse_sns(log_mock):
 
 
 @patch('stream_alert.rule_processor.payload.S3Payload._get_object')
-@patch('stream_alert.rule_processor.payload.S3Payload._read_downloaded_s3_object')
+@patch('stream_alert.rule_processor.payload.S3Payload._read_s3_object')
 def test_pre_parse_s3(s3_mock, *_):
     """S3Payload - Pre Parse"""
     records = ['{"record01": "value01"}', '{"record02": "value02"}']
@@ -160,15 +167,17 @@ def test_pre_parse_s3(s3_mock, *_):
 
     raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
     s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record)
+    s3_payload.sticky_log = 'unit_test_log'
 
     for index, record in enumerate(s3_payload.pre_parse()):
         assert_equal(record.pre_parsed_record, records[index])
+        assert_equal(record.sticky_log, None)
 
 
 @with_setup(setup=None, teardown=teardown_s3)
 @patch('stream_alert.rule_processor.payload.S3Payload._get_object')
 @patch('logging.Logger.debug')
-@patch('stream_alert.rule_processor.payload.S3Payload._read_downloaded_s3_object')
+@patch('stream_alert.rule_processor.payload.S3Payload._read_s3_object')
 def test_pre_parse_s3_debug(s3_mock, log_mock, _):
     """S3Payload - Pre Parse, Debug On"""
     # Cache the logger level
@@ -203,18 +212,7 @@ def test_pre_parse_s3_debug(s3_mock, log_mock, _):
     LOGGER.setLevel(log_level)
 
 
-@with_setup(setup=None, teardown=teardown_s3)
-@raises(S3ObjectSizeError)
-def test_s3_object_too_large():
-    """S3Payload - S3ObjectSizeError, Object too Large"""
-    raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
-    s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record)
-    S3Payload.s3_object_size = (128 * 1024 * 1024) + 10
-
-    s3_payload._download_object('region', 'bucket', 'key')
-
-
-@patch('stream_alert.rule_processor.payload.S3Payload._download_object')
+@patch('stream_alert.rule_processor.payload.S3Payload._open_object')
 @patch('logging.Logger.debug')
 def test_get_object(log_mock, _):
     """S3Payload - Get S3 Info from Raw Record"""
@@ -229,69 +227,246 @@ def test_get_object(log_mock, _):
 
 
 @patch('stream_alert.rule_processor.payload.boto3.client')
-@patch('stream_alert.rule_processor.payload.S3Payload._read_downloaded_s3_object')
 @patch('logging.Logger.info')
-def test_s3_download_object(log_mock, *_):
-    """S3Payload - Download Object"""
+def test_s3_open_object(log_mock, client_mock):
+    """S3Payload - Open Object"""
+    raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
+    s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record)
+    s3_payload._open_object('us-east-1', 'unit_bucket_name', 'unit_key_name')
+
+    client_mock.return_value.get_object.assert_called_with(Bucket='unit_bucket_name',
+                                                           Key='unit_key_name')
+    assert_equal(log_mock.call_args_list[0][0][0], 'Starting download from S3: %s/%s [%s]')
+
+
+@patch('stream_alert.rule_processor.payload.boto3.client')
+def test_s3_open_object_offset(client_mock):
+    """S3Payload - Open Object From Byte Offset"""
     raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
     s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record)
-    s3_payload._download_object('us-east-1', 'unit_bucket_name', 'unit_key_name')
+    s3_payload._open_object('us-east-1', 'unit_bucket_name', 'unit_key_name', 1024)
+
+    client_mock.return_value.get_object.assert_called_with(Bucket='unit_bucket_name',
+                                                           Key='unit_key_name',
+                                                           Range='bytes=1024-')
 
-    assert_equal(log_mock.call_args_list[1][0][0], 'Completed download in %s seconds')
+
+@patch('stream_alert.rule_processor.payload.S3Payload._open_object')
+def test_get_object_checkpoint(open_mock):
+    """S3Payload - Get Object From the Furthest Checkpoint"""
+    raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
+    raw_record['streamalert_checkpoint'] = {'offset': 100, 'skip_lines': 2}
+    store = Mock()
+    store.load.return_value = S3Checkpoint(100, 5)
+    s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record,
+                                     checkpoint_store=store)
+
+    s3_payload._get_object()
+
+    store.load.assert_called_with(
+        'unit_bucket_name/unit_key_name:0123456789abcdef0123456789abcdef')
+    open_mock.assert_called_with('us-east-1', 'unit_bucket_name', 'unit_key_name', 100)
+    assert_equal(s3_payload._skip_lines, 5)
+
+
+@patch('stream_alert.rule_processor.payload.S3Payload._open_object')
+def test_get_object_new_notification(open_mock):
+    """S3Payload - Get Object From the Start for New Notifications"""
+    raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
+    store = Mock()
+    store.load.return_value = S3Checkpoint(100, 5)
+    s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record,
+                                     checkpoint_store=store)
+
+    s3_payload._get_object()
+
+    assert_false(store.load.called)
+    open_mock.assert_called_with('us-east-1', 'unit_bucket_name', 'unit_key_name', 0)
+    assert_equal(s3_payload._skip_lines, 0)
 
 
 @with_setup(setup=None, teardown=teardown_s3)
 @patch('stream_alert.rule_processor.payload.boto3.client')
-@patch('stream_alert.rule_processor.payload.S3Payload._read_downloaded_s3_object')
 @patch('logging.Logger.info')
-def test_s3_download_object_mb(log_mock, *_):
-    """S3Payload - Download Object, Size in MB"""
+def test_s3_open_object_mb(log_mock, _):
+    """S3Payload - Open Object, Size in MB"""
     raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
     s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record)
     S3Payload.s3_object_size = (127.8 * 1024 * 1024)
-    s3_payload._download_object('us-east-1', 'unit_bucket_name', 'unit_key_name')
+    s3_payload._open_object('us-east-1', 'unit_bucket_name', 'unit_key_name')
 
     assert_equal(log_mock.call_args_list[0],
                  call('Starting download from S3: %s/%s [%s]',
                       'unit_bucket_name', 'unit_key_name', '127.8MB'))
 
-    assert_equal(log_mock.call_args_list[1][0][0], 'Completed download in %s seconds')
+
+def _streaming_body(data):
+    """Helper to wrap data in the body returned by an S3 GetObject request"""
+    return StreamingBody(StringIO(data), len(data))
+
+
+def _gzip_data(data):
+    """Helper to gzip data in memory"""
+    gzip_data = StringIO()
+    with gzip.GzipFile(fileobj=gzip_data, mode='w') as gzip_file:
+        gzip_file.write(data)
+    return gzip_data.getvalue()
 
 
-def test_read_local_s3_obj_gz():
-    """S3Payload - Read S3 Object On Disk, gzipped"""
-    temp_gzip_file_path = os.path.join(tempfile.gettempdir(), 's3_test.gz')
+def test_read_s3_obj_gz():
+    """S3Payload - Read S3 Object, gzipped"""
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None)
+    body = _streaming_body(_gzip_data('test line of gzip data'))
 
-    with gzip.open(temp_gzip_file_path, 'w') as temp_gzip_file:
-        temp_gzip_file.write('test line of gzip data')
+    assert_equal(list(s3_payload._read_s3_object(body)), [(1, 'test line of gzip data')])
 
-    for line_num, line in S3Payload._read_downloaded_s3_object(temp_gzip_file_path):
-        assert_equal(line_num, 1)
-        assert_equal(line, 'test line of gzip data')
 
+def test_read_s3_obj_non_gz():
+    """S3Payload - Read S3 Object, non-gzipped"""
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None)
+    body = _streaming_body('test line of data\r\nsecond line\n\nlast line')
 
-def test_read_local_s3_obj_non_gz():
-    """S3Payload - Read S3 Object On Disk, non-gzipped"""
-    temp_file_path = os.path.join(tempfile.gettempdir(), 's3_test.json')
+    assert_equal(list(s3_payload._read_s3_object(body)),
+                 [(1, 'test line of data'), (2, 'second line'), (3, ''), (4, 'last line')])
 
-    with open(temp_file_path, 'w') as temp_file:
-        temp_file.write('test line of data')
 
-    for line_num, line in S3Payload._read_downloaded_s3_object(temp_file_path):
-        assert_equal(line_num, 1)
-        assert_equal(line, 'test line of data')
+@patch('stream_alert.rule_processor.payload.S3_READ_CHUNK_SIZE', 7)
+def test_read_s3_obj_gz_members():
+    """S3Payload - Read S3 Object, Multiple gzip Members in Small Chunks"""
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None)
+    lines = ['first line of data', 'second line of data', 'third line of data']
+    body = _streaming_body(_gzip_data('{}\n{}\n'.format(*lines[:2])) +
+                           _gzip_data('{}\n'.format(lines[2])))
 
+    assert_equal(list(s3_payload._read_s3_object(body)), list(enumerate(lines, start=1)))
 
-@patch('stream_alert.rule_processor.payload.LOGGER.error')
-@patch('stream_alert.rule_processor.payload.os.path.exists', return_value=True)
-def test_read_s3_failed_remove(_, log_mock):
-    """S3Payload - Read S3 Object On Disk, Removal Failure"""
 
-    temp_file_path = os.path.join(tempfile.gettempdir(), 's3_test.json')
+@patch('stream_alert.rule_processor.payload.MetricLogger.log_metric')
+def test_read_s3_obj_metrics(metric_mock):
+    """S3Payload - Read S3 Object, Time to First Record Before Reading Ends"""
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None)
+    reader = s3_payload._read_s3_object(_streaming_body('line 1\nline 2\n'))
 
-    with open(temp_file_path, 'w') as temp_file:
-        temp_file.write('test line of data')
+    assert_equal(next(reader), (1, 'line 1'))
+    assert_equal([args[0][1] for args in metric_mock.call_args_list],
+                 ['S3TimeToFirstRecord'])
 
-    _ = [_ for _ in S3Payload._read_downloaded_s3_object(temp_file_path)]
+    _ = list(reader)
+    assert_equal([args[0][1] for args in metric_mock.call_args_list],
+                 ['S3TimeToFirstRecord', 'S3DownloadTime', 'S3ReadDuration'])
 
-    log_mock.assert_called_with('Failed to remove temp S3 file: %s', temp_file_path)
+
+def _read_in_invocations(data):
+    """Helper to read an object in several invocations, resuming from each checkpoint
+
+    Returns:
+        list: The lines read by each invocation
+    """
+    raw_record = make_s3_raw_record('unit_bucket_name', 'unit_key_name')
+    store = Mock()
+    store.load.return_value = None
+    invocations = []
+    while True:
+        remaining_time = Mock(return_value=0)
+        s3_payload = load_stream_payload('s3', 'unit_key_name', raw_record,
+                                         remaining_time=remaining_time,
+                                         checkpoint_store=store)
+        with patch.object(S3Payload, '_open_object') as open_mock:
+            open_mock.side_effect = lambda *args: _streaming_body(data[args[3]:])
+            invocations.append([record.pre_parsed_record for record in s3_payload.pre_parse()])
+
+        if not s3_payload.checkpoint:
+            return invocations, store
+        raw_record = s3_payload.continuation_record()
+
+
+@patch('stream_alert.rule_processor.payload.S3_TIME_CHECK_INTERVAL', 2)
+def test_read_s3_obj_resume():
+    """S3Payload - Read S3 Object in Several Invocations, non-gzipped"""
+    lines = ['line {}'.format(num) for num in range(5)]
+    invocations, store = _read_in_invocations('\r\n'.join(lines) + '\r\n')
+
+    assert_equal(invocations, [lines[0:2], lines[2:4], lines[4:]])
+    assert_equal(store.save.call_args_list, [
+        call('unit_bucket_name/unit_key_name:0123456789abcdef0123456789abcdef',
+             S3Checkpoint(16, 0)),
+        call('unit_bucket_name/unit_key_name:0123456789abcdef0123456789abcdef',
+             S3Checkpoint(32, 0))
+    ])
+    assert_true(store.clear.called)
+
+
+@patch('stream_alert.rule_processor.payload.S3_READ_CHUNK_SIZE', 7)
+@patch('stream_alert.rule_processor.payload.S3_TIME_CHECK_INTERVAL', 2)
+def test_read_s3_obj_resume_gz_members():
+    """S3Payload - Read S3 Object in Several Invocations, Multiple gzip Members"""
+    lines = ['line {}'.format(num) for num in range(7)]
+    first_member = _gzip_data('\n'.join(lines[:3]) + '\n')
+    data = first_member + _gzip_data('\n'.join(lines[3:]) + '\n')
+
+    invocations, store = _read_in_invocations(data)
+
+    assert_equal(invocations, [lines[0:2], lines[2:4], lines[4:6], lines[6:]])
+    assert_equal([args[0][1] for args in store.save.call_args_list], [
+        S3Checkpoint(0, 2),
+        S3Checkpoint(len(first_member), 1),
+        S3Checkpoint(len(first_member), 3)
+    ])
+
+
+@patch('stream_alert.rule_processor.payload.S3_READ_CHUNK_SIZE', 16)
+@patch('stream_alert.rule_processor.payload.S3_TIME_CHECK_INTERVAL', 2)
+def test_read_s3_obj_resume_large_gz_member():
+    """S3Payload - Read S3 Object in Several Invocations, Replaying a Large gzip Member"""
+    lines = ['line {}'.format(num) for num in range(5)]
+    invocations, store = _read_in_invocations(_gzip_data('\n'.join(lines) + '\n'))
+
+    assert_equal(invocations, [lines[0:2], lines[2:4], lines[4:]])
+    assert_equal([args[0][1] for args in store.save.call_args_list],
+                 [S3Checkpoint(0, 2), S3Checkpoint(0, 4)])
+
+
+@patch('stream_alert.rule_processor.payload.MetricLogger.log_metric')
+@patch('stream_alert.rule_processor.payload.S3_SKIP_TIME_CHECK_INTERVAL', 2)
+def test_read_s3_obj_skip_out_of_time(metric_mock):
+    """S3Payload - Read S3 Object, Out of Time Skipping Lines Already Read"""
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None,
+                                     remaining_time=Mock(return_value=0))
+    s3_payload._skip_lines = 4
+    body = _streaming_body(_gzip_data('line\n' * 10))
+
+    assert_raises(S3ResumeError, list, s3_payload._read_s3_object(body))
+    assert_is_none(s3_payload.checkpoint)
+    metric_mock.assert_called_with('rule_processor', 'S3ResumeFailures', 1)
+
+
+def test_read_s3_obj_short_timeout():
+    """S3Payload - Read S3 Object With a 10 Second Timeout"""
+    remaining_time = Mock(return_value=9000)
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None,
+                                     remaining_time=remaining_time,
+                                     reserved_time=s3_reserved_time(10000))
+    body = _streaming_body('line\n' * 300)
+
+    assert_equal(len(list(s3_payload._read_s3_object(body))), 300)
+    assert_is_none(s3_payload.checkpoint)
+
+    # Reading stops once the remaining time drops below the reserve
+    remaining_time.return_value = 1900
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None,
+                                     remaining_time=remaining_time,
+                                     reserved_time=s3_reserved_time(10000))
+    body = _streaming_body('line\n' * 300)
+
+    assert_equal(len(list(s3_payload._read_s3_object(body))), 100)
+    assert_equal(s3_payload.checkpoint, (500, 0))
+
+
+def test_read_s3_obj_enough_time():
+    """S3Payload - Read S3 Object Without Running Low on Time"""
+    s3_payload = load_stream_payload('s3', 'unit_key_name', None,
+                                     remaining_time=Mock(return_value=300000))
+    body = _streaming_body('line\n' * 300)
+
+    assert_equal(len(list(s3_payload._read_s3_object(body))), 300)
+    assert_is_none(s3_payload.checkpoint)
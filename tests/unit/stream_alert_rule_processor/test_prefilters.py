@@ -0,0 +1,120 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+from nose.tools import assert_equal, assert_false, assert_is_none, assert_true
+
+from stream_alert.rule_processor.prefilters import Prefilter, PrefilterIndex
+
+
+class TestPrefilter(object):
+    """Test class for Prefilter"""
+
+    def test_equality(self):
+        """Prefilter - Field Equality"""
+        prefilter = Prefilter({'action': 'create'})
+
+        assert_equal(prefilter.dispatch, (('action',), frozenset(['create'])))
+        assert_true(prefilter.matches({'action': 'create'}))
+        assert_false(prefilter.matches({'action': 'delete'}))
+
+    def test_membership(self):
+        """Prefilter - Field Membership"""
+        prefilter = Prefilter({'eventName': ['ConsoleLogin', 'AssumeRole']})
+
+        assert_true(prefilter.matches({'eventName': 'AssumeRole'}))
+        assert_false(prefilter.matches({'eventName': 'GetObject'}))
+
+    def test_glob(self):
+        """Prefilter - Glob Fields are not Dispatched"""
+        prefilter = Prefilter({'eventName': ['Delete*', 'StopLogging']})
+
+        assert_is_none(prefilter.dispatch)
+        assert_true(prefilter.matches({'eventName': 'DeleteTrail'}))
+        assert_true(prefilter.matches({'eventName': 'StopLogging'}))
+        assert_false(prefilter.matches({'eventName': 'CreateTrail'}))
+
+    def test_nested_field(self):
+        """Prefilter - Nested Field"""
+        prefilter = Prefilter({('userIdentity', 'type'): 'Root'})
+
+        assert_true(prefilter.matches({'userIdentity': {'type': 'Root'}}))
+        assert_false(prefilter.matches({'userIdentity': {'type': 'IAMUser'}}))
+        assert_false(prefilter.matches({'userIdentity': None}))
+
+    def test_missing_field(self):
+        """Prefilter - Missing Field Does Not Match"""
+        assert_false(Prefilter({'action': 'create'}).matches({'other': 'create'}))
+        assert_false(Prefilter({'action': None}).matches({}))
+        assert_true(Prefilter({'action': None}).matches({'action': None}))
+
+    def test_unsupported_values(self):
+        """Prefilter - Unhashable and Non-String Values Do Not Match"""
+        prefilter = Prefilter({'action': ['create', 'update*']})
+
+        assert_false(prefilter.matches({'action': {'create': True}}))
+        assert_false(prefilter.matches({'action': 10}))
+
+    def test_all_fields(self):
+        """Prefilter - All Fields Must Match"""
+        prefilter = Prefilter({'action': 'create', 'name': 'sa-*'})
+
+        assert_equal(prefilter.dispatch, (('action',), frozenset(['create'])))
+        assert_true(prefilter.matches({'action': 'create', 'name': 'sa-test'}))
+        assert_false(prefilter.matches({'action': 'create', 'name': 'test'}))
+        assert_true(prefilter.matches({'action': 'delete', 'name': 'sa-test'}, dispatched=True))
+
+
+class TestPrefilterIndex(object):
+    """Test class for PrefilterIndex"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.index = PrefilterIndex({
+            'console_login': Prefilter({'eventName': 'ConsoleLogin'}),
+            'root_login': Prefilter({'eventName': 'ConsoleLogin',
+                                     ('userIdentity', 'type'): 'Root'}),
+            'assume_role': Prefilter({'eventName': ['AssumeRole', 'AssumeRoleWithSAML']}),
+            'deletes': Prefilter({'eventName': 'Delete*'}),
+            'region': Prefilter({'awsRegion': 'us-east-1'})
+        })
+
+    def test_rule_names(self):
+        """PrefilterIndex - Rule Names"""
+        assert_equal(self.index.rule_names, frozenset(['console_login', 'root_login',
+                                                       'assume_role', 'deletes', 'region']))
+
+    def test_candidates(self):
+        """PrefilterIndex - Candidates"""
+        record = {
+            'eventName': 'ConsoleLogin',
+            'awsRegion': 'us-west-2',
+            'userIdentity': {'type': 'IAMUser'}
+        }
+        assert_equal(self.index.candidates(record), {'console_login'})
+
+        record['userIdentity']['type'] = 'Root'
+        record['awsRegion'] = 'us-east-1'
+        assert_equal(self.index.candidates(record), {'console_login', 'root_login', 'region'})
+
+    def test_candidates_glob(self):
+        """PrefilterIndex - Candidates with Glob Prefilter"""
+        record = {'eventName': 'DeleteTrail', 'awsRegion': 'us-west-2'}
+        assert_equal(self.index.candidates(record), {'deletes'})
+
+    def test_candidates_unhashable(self):
+        """PrefilterIndex - Candidates with Unhashable Value"""
+        record = {'eventName': ['AssumeRole'], 'awsRegion': 'us-east-1'}
+        assert_equal(self.index.candidates(record), {'region'})
@@ -13,6 +13,8 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import shutil
+import tempfile
 import time
 
 from nose.tools import assert_equal, with_setup
@@ -20,6 +22,8 @@ from nose.tools import assert_equal, with_setup
 from helpers import base
 from stream_alert.rule_processor.threat_intel import StreamThreatIntel
 
+INTEL_DIR = None
+
 
 def test_in_set():
     """Helpers - In Set"""
@@ -251,6 +255,50 @@ def test_is_ioc_with_lowercase_ioc_is_false():
     ioc_result = base.is_ioc(rec, lowercase_ioc=False)
     assert_equal(ioc_result, False)
 
+def setup_prefilter():
+    """Setup before each method, with threat intel stores and prefilters"""
+    global INTEL_DIR  # pylint: disable=global-statement
+    INTEL_DIR = tempfile.mkdtemp()
+    shutil.copy('tests/unit/fixtures/ip.csv.gz', INTEL_DIR)
+    StreamThreatIntel.build_intel_stores(INTEL_DIR, false_positive_rate=0.001)
+
+    test_config = {
+        'threat_intel': {
+            'enabled': True,
+            'mapping': {
+                'sourceAddress': 'ip'
+            },
+            'prefilter': {
+                'enabled': True,
+                'false_positive_rate': 0.001
+            }
+        }
+    }
+    StreamThreatIntel.load_intelligence(test_config, INTEL_DIR)
+    StreamThreatIntel.get_prefilter_stats(reset=True)
+
+def teardown_prefilter():
+    """Clear class variable and remove intel stores after each method"""
+    StreamThreatIntel.get_intelligence()['ip'].close()
+    teardown()
+    shutil.rmtree(INTEL_DIR)
+
+@with_setup(setup=setup_prefilter, teardown=teardown_prefilter)
+def test_is_ioc_with_prefilter():
+    """Helpers - IOC detection with threat intel prefilters"""
+    rec = {
+        'source': '90.163.54.11',
+        'destination': '90.163.54.12',
+        'streamalert:normalization': {
+            'sourceAddress': [['source'], ['destination']]
+        }
+    }
+
+    assert_equal(base.is_ioc(rec), True)
+    assert_equal(rec[StreamThreatIntel.IOC_KEY], {'ip': ['90.163.54.11']})
+    assert_equal(StreamThreatIntel.get_prefilter_stats(reset=True),
+                 {'checks': 2, 'rejections': 1})
+
 @with_setup(setup=setup, teardown=teardown)
 def test_insert_ioc_info():
     """Helpers - Insert IOC info to a record"""
@@ -0,0 +1,100 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+import json
+
+from mock import patch
+from nose.tools import assert_equal, assert_false, assert_is_none
+
+from stream_alert.rule_processor.rule_stats import RuleStats
+
+
+class TestRuleStats(object):
+    """Test class for RuleStats"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.stats = RuleStats(slow_rule_threshold_ms=10, top_rules=2)
+
+    def test_record_rule(self):
+        """RuleStats - Record Rule Invocations"""
+        self.stats.record_rule('test_rule', 0.002, True, False, {'key': 'value'})
+        self.stats.record_rule('test_rule', 0.004, False, True, {'key': 'value'})
+
+        assert_equal(self.stats.summary()['rules'], {
+            'test_rule': {
+                'invocations': 2,
+                'hit_rate': 0.5,
+                'errors': 1,
+                'total_ms': 6.0,
+                'max_ms': 4.0
+            }
+        })
+        # Records are only sized for slow invocations
+        assert_is_none(self.stats.rules['test_rule'].sample_record_size)
+
+    def test_record_matcher(self):
+        """RuleStats - Record Matcher Invocations"""
+        self.stats.record_matcher('prod', 0.001, False, False)
+
+        assert_equal(self.stats.summary()['matchers'], {
+            'prod': {
+                'invocations': 1,
+                'hit_rate': 0.0,
+                'errors': 0,
+                'total_ms': 1.0,
+                'max_ms': 1.0
+            }
+        })
+
+    def test_slow_rules(self):
+        """RuleStats - Slowest Rules Above Threshold"""
+        record = {'key': 'value'}
+        self.stats.record_rule('fast_rule', 0.001, False, False, record)
+        self.stats.record_rule('slow_rule', 0.02, False, False, record)
+        self.stats.record_rule('slower_rule', 0.05, False, False, record)
+        self.stats.record_rule('slowest_rule', 0.5, False, False, record)
+
+        slow_rules = self.stats.slow_rules()
+        assert_equal([entry.name for entry in slow_rules], ['slowest_rule', 'slower_rule'])
+        assert_equal(slow_rules[0].sample_record_size, len(json.dumps(record)))
+
+    def test_reset(self):
+        """RuleStats - Reset"""
+        self.stats.record_rule('test_rule', 0.002, True, False, {})
+        self.stats.record_matcher('prod', 0.001, False, False)
+        self.stats.reset()
+
+        assert_equal(self.stats.summary(), {'rules': {}, 'matchers': {}})
+
+    @patch('stream_alert.rule_processor.rule_stats.LOGGER')
+    def test_log(self, log_mock):
+        """RuleStats - Log Stats and Slow Rules"""
+        self.stats.record_rule('slow_rule', 0.02, True, False, {'key': 'value'})
+        self.stats.log()
+
+        log_mock.info.assert_called_with(
+            'Rule stats: %s', json.dumps(self.stats.summary(), sort_keys=True))
+        log_mock.warning.assert_called_with(
+            'Slow rule [%s] took up to %.3fms, with a sample record of '
+            '%d bytes (%d invocations, %.3fms total)',
+            'slow_rule', 20.0, 16, 1, 20.0)
+
+    @patch('stream_alert.rule_processor.rule_stats.LOGGER')
+    def test_log_empty(self, log_mock):
+        """RuleStats - Log Nothing Without Invocations"""
+        self.stats.log()
+        assert_false(log_mock.info.called)
@@ -14,10 +14,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 # pylint: disable=no-self-use,protected-access
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import json
 
-from mock import patch
+from mock import Mock, patch
 from nose.tools import (
     assert_equal,
     assert_false,
@@ -29,6 +29,7 @@ from nose.tools import (
 from stream_alert.rule_processor.config import load_config, load_env
 from stream_alert.rule_processor.parsers import get_parser
 from stream_alert.rule_processor.rules_engine import RuleAttributes, StreamRules
+from stream_alert.rule_processor.schema import compile_schema
 from stream_alert.shared import NORMALIZATION_KEY
 
 from tests.unit.stream_alert_rule_processor.test_helpers import (
@@ -63,6 +64,14 @@ class TestStreamRules(object):
         # Clear out the cached matchers and rules to avoid conflicts with production code
         StreamRules._StreamRules__matchers.clear()  # pylint: disable=no-member
         StreamRules._StreamRules__rules.clear()  # pylint: disable=no-member
+        StreamRules._StreamRules__rule_index.clear()  # pylint: disable=no-member
+        StreamRules._StreamRules__matcher_group_index.clear()  # pylint: disable=no-member
+        StreamRules._StreamRules__prefilters.clear()  # pylint: disable=no-member
+        StreamRules._StreamRules__prefilter_index.clear()  # pylint: disable=no-member
+        StreamRules._StreamRules__rule_stats = None  # pylint: disable=no-member
+        StreamRules._StreamRules__circuit_breaker = None  # pylint: disable=no-member
+        StreamRules._StreamRules__circuit_breaker_config = None  # pylint: disable=no-member
+        StreamRules.get_matcher_stats(reset=True)
 
     def test_alert_format(self):
         """Rules Engine - Alert Format"""
@@ -297,6 +306,407 @@ class TestStreamRules(object):
         invalid_subkey_check = StreamRules.process_subkeys(invalid_record, 'json', rule_attrs)
         assert_false(invalid_subkey_check)
 
+    def test_matcher_results_cached(self):
+        """Rules Engine - Matcher Results Cached per Record"""
+        calls = []
+
+        @matcher
+        def prod(rec):  # pylint: disable=unused-variable
+            calls.append(rec['host'])
+            return rec['environment'] == 'prod'
+
+        @rule(matchers=['prod'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def cached_matcher_chef(rec):  # pylint: disable=unused-variable
+            return rec['application'] == 'chef'
+
+        @rule(matchers=['prod'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def cached_matcher_eu(rec):  # pylint: disable=unused-variable
+            return rec['data']['source'] == 'eu'
+
+        kinesis_data = {
+            'date': 'Dec 01 2016',
+            'unixtime': '1483139547',
+            'host': 'host1.web.prod.net',
+            'application': 'chef',
+            'environment': 'prod',
+            'data': {
+                'category': 'web-server',
+                'type': '1',
+                'source': 'eu'
+            }
+        }
+
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, json.dumps(kinesis_data))
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        alerts = StreamRules.process(payload)
+
+        assert_equal(len(alerts), 2)
+        assert_equal(calls, ['host1.web.prod.net'])
+        assert_equal(StreamRules.get_matcher_stats(reset=True), {'calls': 1, 'saved': 1})
+        assert_equal(StreamRules.get_matcher_stats(), {'calls': 0, 'saved': 0})
+
+    def test_matcher_group_pruned(self):
+        """Rules Engine - Failing Matcher Prunes Rules in the Group"""
+        rule_calls = []
+
+        @matcher
+        def dev(rec):  # pylint: disable=unused-variable
+            return rec['environment'] == 'dev'
+
+        @rule(matchers=['dev'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def pruned_first(_):  # pylint: disable=unused-variable
+            rule_calls.append('pruned_first')
+            return True
+
+        @rule(matchers=['dev'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def pruned_second(_):  # pylint: disable=unused-variable
+            rule_calls.append('pruned_second')
+            return True
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def not_pruned(_):  # pylint: disable=unused-variable
+            rule_calls.append('not_pruned')
+            return True
+
+        groups = StreamRules.matcher_groups_for_log_source('test_log_type_json_nested_with_data')
+        assert_equal([(matchers, [rule_attrs.rule_name for rule_attrs in group_rules])
+                      for matchers, group_rules in groups],
+                     [((), ['not_pruned']), (('dev',), ['pruned_first', 'pruned_second'])])
+
+        kinesis_data = {
+            'date': 'Dec 01 2016',
+            'unixtime': '1483139547',
+            'host': 'host1.web.prod.net',
+            'application': 'chef',
+            'environment': 'prod',
+            'data': {
+                'category': 'web-server',
+                'type': '1',
+                'source': 'eu'
+            }
+        }
+
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, json.dumps(kinesis_data))
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        alerts = StreamRules.process(payload)
+
+        assert_equal([alert['rule_name'] for alert in alerts], ['not_pruned'])
+        assert_equal(rule_calls, ['not_pruned'])
+        assert_equal(StreamRules.get_matcher_stats(), {'calls': 1, 'saved': 1})
+
+    def test_matcher_group_pruned_stats(self):
+        """Rules Engine - Pruned Rules Count the Matcher Calls Avoided"""
+        @matcher
+        def prod(rec):  # pylint: disable=unused-variable
+            return rec['environment'] == 'prod'
+
+        @matcher
+        def dev(rec):  # pylint: disable=unused-variable
+            return rec['environment'] == 'dev'
+
+        @rule(matchers=['prod', 'dev'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def pruned_stats_a(_):  # pylint: disable=unused-variable
+            return True
+
+        @rule(matchers=['prod', 'dev'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def pruned_stats_b(_):  # pylint: disable=unused-variable
+            return True
+
+        @rule(matchers=['prod', 'dev'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'],
+              req_subkeys={'data': ['missing']})
+        def pruned_stats_c(_):  # pylint: disable=unused-variable
+            return True
+
+        @rule(matchers=['prod', 'dev'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def pruned_stats_d(_):  # pylint: disable=unused-variable
+            return True
+
+        kinesis_data = {
+            'date': 'Dec 01 2016',
+            'unixtime': '1483139547',
+            'host': 'host1.web.prod.net',
+            'application': 'chef',
+            'environment': 'prod',
+            'data': {
+                'category': 'web-server',
+                'type': '1',
+                'source': 'eu'
+            }
+        }
+
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, json.dumps(kinesis_data))
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        with patch.object(StreamRules, 'process_subkeys',
+                          wraps=StreamRules.process_subkeys) as subkeys_mock:
+            assert_equal(StreamRules.process(payload), [])
+            # Only the first rule in the group has its subkeys checked
+            subkeys_mock.assert_called_once()
+
+        # Rules b, c and d are counted for both matchers, since the subkey check
+        # for rule c is not run for the pruned rules
+        assert_equal(StreamRules.get_matcher_stats(), {'calls': 2, 'saved': 6})
+
+    def test_process_prefilter(self):
+        """Rules Engine - Prefilter Skips Rules"""
+        rule_calls = []
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'],
+              prefilter={'application': ['chef', 'puppet']})
+        def prefilter_chef(rec):  # pylint: disable=unused-variable
+            rule_calls.append('prefilter_chef')
+            return rec['environment'] == 'prod'
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'],
+              prefilter={'application': 'web-app'})
+        def prefilter_web_app(_):  # pylint: disable=unused-variable
+            rule_calls.append('prefilter_web_app')
+            return True
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'],
+              prefilter={('data', 'source'): 'us*'})
+        def prefilter_us_source(_):  # pylint: disable=unused-variable
+            rule_calls.append('prefilter_us_source')
+            return True
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def no_prefilter(_):  # pylint: disable=unused-variable
+            rule_calls.append('no_prefilter')
+            return True
+
+        kinesis_data = {
+            'date': 'Dec 01 2016',
+            'unixtime': '1483139547',
+            'host': 'host1.web.prod.net',
+            'application': 'chef',
+            'environment': 'prod',
+            'data': {
+                'category': 'web-server',
+                'type': '1',
+                'source': 'eu'
+            }
+        }
+
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, json.dumps(kinesis_data))
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        alerts = StreamRules.process(payload)
+
+        assert_equal([alert['rule_name'] for alert in alerts],
+                     ['no_prefilter', 'prefilter_chef'])
+        assert_equal(rule_calls, ['no_prefilter', 'prefilter_chef'])
+
+    @patch('stream_alert.rule_processor.rules_engine.LOGGER.error')
+    def test_invalid_prefilter(self, log_mock):
+        """Rules Engine - Invalid Prefilter"""
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'],
+              prefilter=['application'])
+        def invalid_prefilter(_):  # pylint: disable=unused-variable
+            return True
+
+        assert_false('invalid_prefilter' in StreamRules.get_rules())
+        log_mock.assert_called_with(
+            'Invalid rule [%s] - rule \'prefilter\' must be a non-empty map of fields to values',
+            'invalid_prefilter')
+
+    def test_rule_stats(self):
+        """Rules Engine - Rule Stats"""
+        @matcher
+        def prod(rec):  # pylint: disable=unused-variable
+            return rec['environment'] == 'prod'
+
+        @rule(matchers=['prod'],
+              logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def stats_chef(rec):  # pylint: disable=unused-variable
+            return rec['application'] == 'chef'
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def stats_error(rec):  # pylint: disable=unused-variable
+            return rec['missing_key']
+
+        config = {'global': {'rules_engine': {'rule_stats': {'enabled': True}}}}
+        StreamRules.load_config(config)
+
+        kinesis_data = {
+            'date': 'Dec 01 2016',
+            'unixtime': '1483139547',
+            'host': 'host1.web.prod.net',
+            'application': 'chef',
+            'environment': 'prod',
+            'data': {
+                'category': 'web-server',
+                'type': '1',
+                'source': 'eu'
+            }
+        }
+
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, json.dumps(kinesis_data))
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        StreamRules.process(payload)
+        StreamRules.process(payload)
+
+        summary = StreamRules.get_rule_stats().summary()
+        assert_equal(sorted(summary['rules']), ['stats_chef', 'stats_error'])
+        assert_equal(summary['rules']['stats_chef']['invocations'], 2)
+        assert_equal(summary['rules']['stats_chef']['hit_rate'], 1.0)
+        assert_equal(summary['rules']['stats_error']['errors'], 2)
+        assert_equal(summary['rules']['stats_error']['hit_rate'], 0.0)
+        assert_equal(summary['matchers']['prod']['invocations'], 2)
+
+        with patch.object(StreamRules.get_rule_stats(), 'log') as log_mock:
+            StreamRules.log_rule_stats()
+            log_mock.assert_called_once()
+
+        assert_equal(StreamRules.get_rule_stats().summary(), {'rules': {}, 'matchers': {}})
+
+        # Disabling rule stats removes them
+        StreamRules.load_config({'global': {}})
+        assert_equal(StreamRules.get_rule_stats(), None)
+
+    def test_circuit_breaker(self):
+        """Rules Engine - Circuit Breaker Skips Failing Rule"""
+        rule_calls = []
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def breaker_error(rec):  # pylint: disable=unused-variable
+            rule_calls.append('breaker_error')
+            return rec['missing_key']
+
+        @rule(logs=['test_log_type_json_nested_with_data'],
+              outputs=['s3:sample_bucket'])
+        def breaker_healthy(_):  # pylint: disable=unused-variable
+            rule_calls.append('breaker_healthy')
+            return True
+
+        config = {
+            'global': {
+                'rules_engine': {
+                    'circuit_breaker': {
+                        'enabled': True,
+                        'min_invocations': 2,
+                        'cooldown_seconds': 300
+                    }
+                }
+            }
+        }
+        StreamRules.load_config(config)
+
+        kinesis_data = {
+            'date': 'Dec 01 2016',
+            'unixtime': '1483139547',
+            'host': 'host1.web.prod.net',
+            'application': 'chef',
+            'environment': 'prod',
+            'data': {
+                'category': 'web-server',
+                'type': '1',
+                'source': 'eu'
+            }
+        }
+
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, json.dumps(kinesis_data))
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        for _ in range(2):
+            StreamRules.process(payload)
+
+        # Reloading the same config keeps the tripped breaker
+        StreamRules.load_config(config)
+        alerts = StreamRules.process(payload)
+
+        assert_equal([alert['rule_name'] for alert in alerts], ['breaker_healthy'])
+        assert_equal(rule_calls.count('breaker_error'), 2)
+        assert_equal(rule_calls.count('breaker_healthy'), 3)
+        assert_equal(StreamRules.get_circuit_breaker_stats(reset=True),
+                     {'trips': 1, 'skipped': 1})
+
+        # Disabling the breaker removes it
+        StreamRules.load_config({'global': {}})
+        assert_equal(StreamRules.get_circuit_breaker_stats(), {'trips': 0, 'skipped': 0})
+
+    @patch('stream_alert.rule_processor.rules_engine.LOGGER.error')
+    def test_circuit_breaker_unknown_option(self, log_mock):
+        """Rules Engine - Circuit Breaker Ignores Unknown Options"""
+        StreamRules.load_config({
+            'global': {
+                'rules_engine': {
+                    'circuit_breaker': {
+                        'enabled': True,
+                        'min_invocations': 2,
+                        'max_errors': 5
+                    }
+                }
+            }
+        })
+
+        log_mock.assert_called_with(
+            'Ignoring unknown rules_engine circuit_breaker options: %s', 'max_errors')
+        assert_equal(StreamRules.get_circuit_breaker_stats(), {'trips': 0, 'skipped': 0})
+
+    def test_circuit_breaker_skips_normalization(self):
+        """Rules Engine - Circuit Breaker Skips Tripped Rule Before Normalization"""
+        @rule(datatypes=['sourceAddress'],
+              outputs=['s3:sample_bucket'])
+        def breaker_tripped(_):  # pylint: disable=unused-variable
+            return True
+
+        kinesis_data = json.dumps({
+            'account': 123456,
+            'region': '123456123456',
+            'source': '1.1.1.2',
+            'detail': {
+                'eventName': 'ConsoleLogin',
+                'sourceIPAddress': '1.1.1.2',
+                'recipientAccountId': '654321'
+            }
+        })
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, kinesis_data)
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        breaker = Mock()
+        breaker.allow.return_value = False
+        StreamRules._StreamRules__circuit_breaker = breaker  # pylint: disable=no-member
+        with patch.object(StreamRules, 'normalize_record') as normalize_mock:
+            assert_equal(StreamRules.process(payload), [])
+            normalize_mock.assert_not_called()
+
+        breaker.allow.assert_called_with('breaker_tripped')
+
     def test_process_subkeys(self):
         """Rules Engine - Req Subkeys"""
         @rule(logs=['test_log_type_json_nested'],
@@ -664,6 +1074,93 @@ class TestStreamRules(object):
         }
         assert_equal(results, expected_results)
 
+    def test_normalize_record(self):
+        """Rules Engine - Normalize record with precomputed key paths"""
+        schema = compile_schema(OrderedDict([
+            ('account', 'integer'),
+            ('detail', OrderedDict([('awsRegion', 'string'), ('source', 'string')])),
+            ('extra', {}),
+            ('sourceIPAddress', 'string')
+        ]))
+        normalized_types = {
+            'account': ['account'],
+            'region': ['awsRegion'],
+            'ipv4': ['source', 'sourceIPAddress']
+        }
+        record = {
+            'account': 123456,
+            'detail': {
+                'awsRegion': 'region_name',
+                'source': '1.1.1.2'
+            },
+            'extra': {
+                'nested': {'source': '1.1.1.3'}
+            },
+            'sourceIPAddress': '1.1.1.2'
+        }
+        results = StreamRules.normalize_record(record,
+                                               normalized_types,
+                                               schema.normalized_paths(normalized_types))
+        expected_results = {
+            'account': [['account']],
+            'ipv4': [['detail', 'source'], ['sourceIPAddress'], ['extra', 'nested', 'source']],
+            'region': [['detail', 'awsRegion']]
+        }
+        assert_equal(results, expected_results)
+
+        # The same view is built by searching the whole record
+        results = StreamRules.normalize_record(record, normalized_types)
+        assert_equal(results.keys(), expected_results.keys())
+        for datatype, paths in expected_results.iteritems():
+            assert_items_equal(results[datatype], paths)
+
+    def test_normalize_record_once(self):
+        """Rules Engine - Normalization view built once per record"""
+        @rule(logs=['cloudwatch:test_match_types'],
+              outputs=['s3:sample_bucket'],
+              datatypes=['sourceAddress'])
+        def normalize_once_source(rec): # pylint: disable=unused-variable
+            """Testing rule using the sourceAddress type"""
+            return '1.1.1.2' in fetch_values_by_datatype(rec, 'sourceAddress')
+
+        @rule(logs=['cloudwatch:test_match_types'],
+              outputs=['s3:sample_bucket'],
+              datatypes=['destinationAddress'])
+        def normalize_once_destination(rec): # pylint: disable=unused-variable
+            """Testing rule using the destinationAddress type"""
+            return '172.31.0.2' in fetch_values_by_datatype(rec, 'destinationAddress')
+
+        kinesis_data_items = [
+            {
+                'account': 123456,
+                'region': '123456123456',
+                'source': '1.1.1.2',
+                'detail': {
+                    'eventName': 'ConsoleLogin',
+                    'sourceIPAddress': '1.1.1.2',
+                    'recipientAccountId': '654321'
+                }
+            }
+        ]
+
+        alerts = []
+        with patch.object(StreamRules, 'normalize_record',
+                          wraps=StreamRules.normalize_record) as normalize_mock:
+            for data in kinesis_data_items:
+                kinesis_data = json.dumps(data)
+                service, entity = 'kinesis', 'test_kinesis_stream'
+                raw_record = make_kinesis_raw_record(entity, kinesis_data)
+                payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+                assert_true(payload.normalized_paths.static)
+                alerts.extend(StreamRules.process(payload))
+
+            assert_equal(normalize_mock.call_count, 1)
+
+        assert_equal(len(alerts), 1)
+        assert_equal(alerts[0]['rule_name'], 'normalize_once_source')
+        assert_equal(alerts[0]['record'][NORMALIZATION_KEY].keys(), ['sourceAddress'])
+
     def test_process_optional_logs(self):
         """Rules Engine - Logs is optional when datatypes are present"""
         @rule(datatypes=['sourceAddress'],
@@ -813,3 +1310,87 @@ class TestStreamRules(object):
                 assert_equal(has_key_normalized_types, False)
             else:
                 assert_equal(has_key_normalized_types, True)
+
+    def test_normalized_types_not_shared(self):
+        """Rules Engine - Normalized types changed by a rule are not seen by other rules"""
+        @rule(datatypes=['sourceAddress'],
+              outputs=['s3:sample_bucket'])
+        def test_01_mutate_normalized_types(rec): # pylint: disable=unused-variable
+            """Testing rule that changes the normalized key paths"""
+            for path in rec[NORMALIZATION_KEY]['sourceAddress']:
+                del path[:]
+            return True
+
+        @rule(datatypes=['sourceAddress'],
+              outputs=['s3:sample_bucket'])
+        def test_02_read_normalized_types(rec): # pylint: disable=unused-variable
+            """Testing rule that reads the normalized values"""
+            return '1.1.1.2' in fetch_values_by_datatype(rec, 'sourceAddress')
+
+        kinesis_data = json.dumps({
+            'account': 123456,
+            'region': '123456123456',
+            'source': '1.1.1.2',
+            'detail': {
+                'eventName': 'ConsoleLogin',
+                'sourceIPAddress': '1.1.1.2',
+                'recipientAccountId': '654321'
+            }
+        })
+        service, entity = 'kinesis', 'test_kinesis_stream'
+        raw_record = make_kinesis_raw_record(entity, kinesis_data)
+        payload = load_and_classify_payload(self.config, service, entity, raw_record)
+
+        alerts = StreamRules.process(payload)
+        assert_equal(sorted(alert['rule_name'] for alert in alerts),
+                     ['test_01_mutate_normalized_types', 'test_02_read_normalized_types'])
+
+    def test_rule_index(self):
+        """Rules Engine - Rule Index by Log Source"""
+        @rule(logs=['test_log_type_json', 'test_log_type_json_2'],
+              outputs=['s3:sample_bucket'])
+        def index_rule_b(_):  # pylint: disable=unused-variable
+            return True
+
+        @rule(logs=['test_log_type_json'],
+              outputs=['s3:sample_bucket'])
+        def index_rule_a(_):  # pylint: disable=unused-variable
+            return True
+
+        @rule(datatypes=['sourceAddress'],
+              outputs=['s3:sample_bucket'])
+        def index_rule_c(_):  # pylint: disable=unused-variable
+            return True
+
+        rule_index = StreamRules.get_rule_index()
+        assert_items_equal(rule_index.keys(),
+                           [None, 'test_log_type_json', 'test_log_type_json_2'])
+        assert_equal([item.rule_name for item in rule_index['test_log_type_json']],
+                     ['index_rule_a', 'index_rule_b', 'index_rule_c'])
+        assert_equal([item.rule_name for item in rule_index['test_log_type_json_2']],
+                     ['index_rule_b', 'index_rule_c'])
+        assert_equal([item.rule_name for item in rule_index[None]], ['index_rule_c'])
+
+        # Log sources without explicit rules should fall back on datatype-only rules
+        assert_equal([item.rule_name for item in
+                      StreamRules.rules_for_log_source('unknown_log_type')],
+                     ['index_rule_c'])
+
+    def test_rule_index_disable(self):
+        """Rules Engine - Rule Index Updated on Disable"""
+        @rule(logs=['test_log_type_json'],
+              outputs=['s3:sample_bucket'])
+        def index_rule_enabled(_):  # pylint: disable=unused-variable
+            return True
+
+        @disable
+        @rule(logs=['test_log_type_json', 'test_log_type_json_2'],
+              outputs=['s3:sample_bucket'])
+        def index_rule_disabled(_):  # pylint: disable=unused-variable
+            return True
+
+        rule_index = StreamRules.get_rule_index()
+        assert_equal([item.rule_name for item in rule_index['test_log_type_json']],
+                     ['index_rule_enabled'])
+        assert_false('test_log_type_json_2' in rule_index)
+        assert_equal(StreamRules.rules_for_log_source('test_log_type_json_2'), ())
@@ -0,0 +1,136 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use,protected-access
+from collections import OrderedDict
+
+from nose.tools import assert_equal, assert_false, assert_is_instance, assert_true
+
+from stream_alert.rule_processor.config import load_config
+from stream_alert.rule_processor.schema import CompiledSchema, compile_schema, ENVELOPE_KEY
+
+
+class TestCompiledSchema(object):
+    """Test class for CompiledSchema"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.schema = compile_schema(OrderedDict([
+            ('name', 'string'),
+            ('count', 'integer'),
+            ('detail', OrderedDict([('ratio', 'float'), ('enabled', 'boolean')])),
+            ('tags', []),
+            ('extra', {})
+        ]))
+
+    def _record(self):
+        """Helper to return a record that matches the schema"""
+        return {
+            'name': 'test',
+            'count': '10',
+            'detail': {'ratio': '0.5', 'enabled': 'True'},
+            'tags': ['a'],
+            'extra': {'anything': 'goes'}
+        }
+
+    def test_compile(self):
+        """CompiledSchema - Compile Nested Schemas"""
+        assert_equal(self.schema.key_signature,
+                     frozenset(['name', 'count', 'detail', 'tags', 'extra']))
+        assert_is_instance(self.schema['detail'], CompiledSchema)
+        # Empty maps are not compiled, since they allow any value
+        assert_false(isinstance(self.schema['extra'], CompiledSchema))
+
+    def test_compile_envelope(self):
+        """CompiledSchema - Compile with Envelope Keys"""
+        schema = compile_schema({'key': 'string'}, {'envelope_keys': {'host': 'string'}})
+        assert_equal(schema.key_signature, frozenset(['key', ENVELOPE_KEY]))
+        assert_is_instance(schema[ENVELOPE_KEY], CompiledSchema)
+
+    def test_compile_idempotent(self):
+        """CompiledSchema - Compiling a Compiled Schema is a No-op"""
+        assert_true(compile_schema(self.schema) is self.schema)
+
+    def test_validate(self):
+        """CompiledSchema - Validate"""
+        assert_true(self.schema.validate(self._record()))
+
+    def test_validate_missing_key(self):
+        """CompiledSchema - Validate, Missing Key"""
+        record = self._record()
+        del record['count']
+        assert_false(self.schema.validate(record))
+
+    def test_validate_nested_mismatch(self):
+        """CompiledSchema - Validate, Nested Key Mismatch"""
+        record = self._record()
+        record['detail']['bad_key'] = 'value'
+        assert_false(self.schema.validate(record))
+
+    def test_validate_nested_not_map(self):
+        """CompiledSchema - Validate, Nested Value Not a Map"""
+        record = self._record()
+        record['detail'] = None
+        assert_false(self.schema.validate(record))
+
+    def test_convert(self):
+        """CompiledSchema - Convert"""
+        record = self._record()
+        assert_true(self.schema.convert(record))
+        assert_equal(record['count'], 10)
+        assert_equal(record['detail'], {'ratio': 0.5, 'enabled': True})
+        assert_equal(record['tags'], ['a'])
+
+    def test_convert_all_nested(self):
+        """CompiledSchema - Convert, Keys After Nested Maps"""
+        schema = compile_schema(OrderedDict([
+            ('first', OrderedDict([('value', 'integer')])),
+            ('second', OrderedDict([('value', 'integer')]))
+        ]))
+        record = {'first': {'value': '1'}, 'second': {'value': '2'}}
+        assert_true(schema.convert(record))
+        assert_equal(record, {'first': {'value': 1}, 'second': {'value': 2}})
+
+    def test_load_config_compiled(self):
+        """CompiledSchema - Schemas Compiled in load_config"""
+        config = load_config('tests/unit/conf')
+        for attrs in config['logs'].itervalues():
+            assert_is_instance(attrs['schema'], CompiledSchema)
+
+        assert_true(ENVELOPE_KEY in config['logs']['test_cloudwatch']['schema'])
+
+    def test_normalized_paths(self):
+        """CompiledSchema - Normalized Paths"""
+        normalized_types = {
+            'name': ['name', 'enabled'],
+            'extra': ['extra', 'key']
+        }
+        paths = self.schema.normalized_paths(normalized_types)
+        assert_equal(paths.static, (('name', ('name',)), ('name', ('detail', 'enabled'))))
+        assert_equal(paths.dynamic, ((('extra',), ('extra',)),))
+
+    def test_normalized_paths_envelope(self):
+        """CompiledSchema - Normalized Paths, Envelope Searched per Record"""
+        schema = compile_schema({'name': 'string'}, {'envelope_keys': {'key': 'string'}})
+        paths = schema.normalized_paths({'key': ['key']})
+        assert_equal(paths.static, ())
+        assert_equal(paths.dynamic, (((ENVELOPE_KEY,), ()),))
+
+    def test_normalized_paths_cached(self):
+        """CompiledSchema - Normalized Paths Cached for the Same Types"""
+        normalized_types = {'name': ['name']}
+        paths = self.schema.normalized_paths(normalized_types)
+        assert_true(self.schema.normalized_paths(normalized_types) is paths)
+        assert_false(self.schema.normalized_paths({'name': ['name']}) is paths)
@@ -14,13 +14,15 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from datetime import datetime
+import json
 
 from botocore.exceptions import ClientError
 from mock import patch
-from nose.tools import assert_equal
+from nose.tools import assert_equal, assert_true
 
 from stream_alert.rule_processor.config import load_env
-from stream_alert.rule_processor.sink import StreamSink
+from stream_alert.rule_processor.io_pool import IOWorkerPool
+from stream_alert.rule_processor.sink import MAX_INVOKE_PAYLOAD_SIZE, StreamSink
 from tests.unit.stream_alert_rule_processor.test_helpers import get_mock_context
 
 
@@ -60,12 +62,13 @@ class TestStreamSink(object):
             err_response, 'operation')
 
         self.sinker.sink(['alert!!!'])
+        self.sinker.flush()
 
-        log_mock.assert_called_with('An error occurred while sending alert to '
-                                    '\'%s:production\'. Error is: %s. Alert: %s',
+        log_mock.assert_called_with('An error occurred while sending alerts to '
+                                    '\'%s:production\'. Error is: %s. Alerts: %s',
                                     'corp-prefix_prod_streamalert_alert_processor',
                                     err_response,
-                                    '"alert!!!"')
+                                    '["alert!!!"]')
 
     @patch('stream_alert.rule_processor.sink.LOGGER.error')
     def test_streamsink_sink_resp_error(self, log_mock):
@@ -74,10 +77,11 @@ class TestStreamSink(object):
             'ResponseMetadata': {'HTTPStatusCode': 201}}]
 
         self.sinker.sink(['alert!!!'])
+        self.sinker.flush()
 
-        log_mock.assert_called_with('Failed to send alert to \'%s\': %s',
+        log_mock.assert_called_with('Failed to send alerts to \'%s\': %s',
                                     'corp-prefix_prod_streamalert_alert_processor',
-                                    '"alert!!!"')
+                                    '["alert!!!"]')
 
     @patch('stream_alert.rule_processor.sink.LOGGER.info')
     def test_streamsink_sink_success(self, log_mock):
@@ -92,9 +96,11 @@ class TestStreamSink(object):
         # Swap out the alias so the logging occurs
         self.sinker.env['lambda_alias'] = 'production'
 
-        self.sinker.sink(['alert!!!'])
+        self.sinker.sink(['alert!!!', 'alert2!!!'])
+        self.sinker.flush()
 
-        log_mock.assert_called_with('Sent alert to \'%s\' with Lambda request ID \'%s\'',
+        log_mock.assert_called_with('Sent %d alert(s) to \'%s\' with Lambda request ID \'%s\'',
+                                    2,
                                     'corp-prefix_prod_streamalert_alert_processor',
                                     'reqID')
 
@@ -108,3 +114,55 @@ class TestStreamSink(object):
             'An error occurred while dumping alert to JSON: %s Alert: %s',
             '\'datetime.datetime\' object has no attribute \'__dict__\'',
             bad_object)
+
+    def test_streamsink_batches(self):
+        """StreamSink - Alerts Sent in Size Limited Batches"""
+        sinker = StreamSink(load_env(get_mock_context()))
+        sinker.client_lambda.invoke.side_effect = None
+        sinker.client_lambda.invoke.return_value = {
+            'ResponseMetadata': {
+                'HTTPStatusCode': 202,
+                'RequestId': 'reqID'
+            }
+        }
+
+        # Each alert is 50KB once encoded, so only two fit in each invocation
+        alerts = ['a' * (50 * 1024 - 2)] * 5
+        sinker.sink(alerts)
+
+        # Full batches are sent as soon as the next alert does not fit
+        assert_equal(sinker.client_lambda.invoke.call_count, 2)
+
+        sinker.flush()
+        sinker.flush()
+
+        assert_equal(sinker.client_lambda.invoke.call_count, 3)
+        payloads = [json.loads(call[1]['Payload'])
+                    for call in sinker.client_lambda.invoke.call_args_list]
+        assert_equal([len(payload) for payload in payloads], [2, 2, 1])
+        assert_true(all(len(call[1]['Payload']) <= MAX_INVOKE_PAYLOAD_SIZE
+                        for call in sinker.client_lambda.invoke.call_args_list))
+        assert_equal(sinker.alerts_sent, 5)
+        assert_equal(sinker.alerts_batched, 5)
+        assert_equal(sinker.invocations, 3)
+
+    def test_streamsink_io_pool(self):
+        """StreamSink - Alerts Sent from the I/O Worker Pool"""
+        pool = IOWorkerPool(4)
+        sinker = StreamSink(load_env(get_mock_context()), pool)
+        sinker.client_lambda.invoke.reset_mock()
+        sinker.client_lambda.invoke.side_effect = None
+        sinker.client_lambda.invoke.return_value = {
+            'ResponseMetadata': {
+                'HTTPStatusCode': 202,
+                'RequestId': 'reqID'
+            }
+        }
+
+        sinker.sink(['a' * (50 * 1024 - 2)] * 5)
+        sinker.flush()
+        pool.shutdown()
+
+        assert_equal(sinker.client_lambda.invoke.call_count, 3)
+        assert_equal(sinker.alerts_sent, 5)
+        assert_equal(sinker.invocations, 3)
@@ -14,13 +14,23 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 # pylint: disable=protected-access,no-self-use
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from mock import patch
 from nose.tools import (
     assert_list_equal,
     assert_equal,
+    assert_false,
     assert_is_instance,
-    assert_items_equal
+    assert_items_equal,
+    assert_true
 )
 
+from stream_alert.rule_processor.intel_store import IntelStore
 from stream_alert.rule_processor.threat_intel import StreamThreatIntel
 
 
@@ -31,6 +41,11 @@ class TestStreamStreamThreatIntel(object):
         # Clear out the cached matchers and rules to avoid conflicts with production code
         StreamThreatIntel._StreamThreatIntel__intelligence.clear()  # pylint: disable=no-member
         StreamThreatIntel._StreamThreatIntel__config.clear()  # pylint: disable=no-member
+        StreamThreatIntel._StreamThreatIntel__prefilters.clear()  # pylint: disable=no-member
+        StreamThreatIntel.get_prefilter_stats(reset=True)
+        StreamThreatIntel._StreamThreatIntel__version = 0
+        StreamThreatIntel._StreamThreatIntel__source = None
+        StreamThreatIntel._StreamThreatIntel__source_tag = None
 
     def test_read_compressed_files(self):
         """Theat Intel - Read compressed csv.gz files into a dictionary"""
@@ -139,3 +154,266 @@ class TestStreamStreamThreatIntel(object):
         StreamThreatIntel.load_intelligence(test_config, 'tests/unit/fixtures')
         datatypes_ioc_mapping = StreamThreatIntel.get_config()
         assert_equal(len(datatypes_ioc_mapping), 0)
+
+    def test_build_intel_stores(self):
+        """Threat Intel - Build intel stores from csv.gz files"""
+        intel_dir = tempfile.mkdtemp()
+        try:
+            for ioc_type in ('domain', 'ip', 'md5'):
+                shutil.copy('tests/unit/fixtures/{}.csv.gz'.format(ioc_type), intel_dir)
+
+            store_paths = StreamThreatIntel.build_intel_stores(intel_dir, remove_sources=True)
+
+            assert_items_equal(os.listdir(intel_dir), ['domain.ioc', 'ip.ioc', 'md5.ioc'])
+            assert_items_equal(store_paths, [os.path.join(intel_dir, name)
+                                             for name in os.listdir(intel_dir)])
+            # Building the stores should not load any intelligence
+            assert_equal(len(StreamThreatIntel.get_intelligence()), 0)
+        finally:
+            shutil.rmtree(intel_dir)
+
+    def test_load_intelligence_from_stores(self):
+        """Threat Intel - Load intelligence from intel stores"""
+        test_config = {
+            'threat_intel': {
+                'enabled': True,
+                'mapping': {
+                    'sourceAddress': 'ip'
+                }
+            }
+        }
+        intel_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy('tests/unit/fixtures/ip.csv.gz', intel_dir)
+            StreamThreatIntel.build_intel_stores(intel_dir)
+
+            StreamThreatIntel.load_intelligence(test_config, intel_dir)
+            intelligence = StreamThreatIntel.get_intelligence()
+
+            assert_equal(intelligence.keys(), ['ip'])
+            assert_is_instance(intelligence['ip'], IntelStore)
+            assert_equal(len(intelligence['ip']), 10)
+            assert_true('90.163.54.11' in intelligence['ip'])
+            assert_equal(intelligence['ip']['90.163.54.11'], ['c2_ip', 'ioc_source'])
+            assert_false('90.163.54.12' in intelligence['ip'])
+            intelligence['ip'].close()
+        finally:
+            shutil.rmtree(intel_dir)
+
+    def test_load_intelligence_prefilters(self):
+        """Threat Intel - Load intelligence with prefilters"""
+        test_config = {
+            'threat_intel': {
+                'enabled': True,
+                'mapping': {
+                    'sourceAddress': 'ip'
+                },
+                'prefilter': {
+                    'enabled': True,
+                    'false_positive_rate': 0.001
+                }
+            }
+        }
+        intel_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy('tests/unit/fixtures/ip.csv.gz', intel_dir)
+            StreamThreatIntel.build_intel_stores(intel_dir, false_positive_rate=0.001)
+            StreamThreatIntel.load_intelligence(test_config, intel_dir)
+
+            assert_true(StreamThreatIntel.might_be_ioc('ip', '90.163.54.11'))
+            assert_false(StreamThreatIntel.might_be_ioc('ip', '90.163.54.12'))
+            # IOC types without a prefilter always pass
+            assert_true(StreamThreatIntel.might_be_ioc('url', 'www.evil.com'))
+
+            assert_equal(StreamThreatIntel.get_prefilter_stats(reset=True),
+                         {'checks': 2, 'rejections': 1})
+            assert_equal(StreamThreatIntel.get_prefilter_stats(),
+                         {'checks': 0, 'rejections': 0})
+            StreamThreatIntel.get_intelligence()['ip'].close()
+        finally:
+            shutil.rmtree(intel_dir)
+
+    def test_load_intelligence_prefilters_not_packaged(self):
+        """Threat Intel - Load intelligence, no prefilters if they were not packaged"""
+        test_config = {
+            'threat_intel': {
+                'enabled': True,
+                'mapping': {
+                    'sourceAddress': 'ip'
+                },
+                'prefilter': {
+                    'enabled': True
+                }
+            }
+        }
+        intel_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy('tests/unit/fixtures/ip.csv.gz', intel_dir)
+            StreamThreatIntel.build_intel_stores(intel_dir)
+            StreamThreatIntel.load_intelligence(test_config, intel_dir)
+
+            # The stores are not read at runtime to build the missing prefilters
+            assert_true(StreamThreatIntel.might_be_ioc('ip', '90.163.54.12'))
+            assert_equal(StreamThreatIntel.get_prefilter_stats()['checks'], 0)
+            StreamThreatIntel.get_intelligence()['ip'].close()
+        finally:
+            shutil.rmtree(intel_dir)
+
+    def test_load_intelligence_prefilters_dictionary(self):
+        """Threat Intel - Load intelligence, no prefilters for csv.gz files"""
+        test_config = {
+            'threat_intel': {
+                'enabled': True,
+                'mapping': {
+                    'sourceAddress': 'ip'
+                },
+                'prefilter': {
+                    'enabled': True
+                }
+            }
+        }
+        StreamThreatIntel.load_intelligence(test_config, 'tests/unit/fixtures')
+
+        assert_true(StreamThreatIntel.might_be_ioc('ip', '90.163.54.12'))
+        assert_equal(StreamThreatIntel.get_prefilter_stats()['checks'], 0)
+
+    def test_load_intelligence_no_prefilters(self):
+        """Threat Intel - Load intelligence without prefilters"""
+        test_config = {
+            'threat_intel': {
+                'enabled': True,
+                'mapping': {
+                    'sourceAddress': 'ip'
+                },
+                'prefilter': {
+                    'enabled': False
+                }
+            }
+        }
+        StreamThreatIntel.load_intelligence(test_config, 'tests/unit/fixtures')
+
+        assert_true(StreamThreatIntel.might_be_ioc('ip', '90.163.54.12'))
+        assert_equal(StreamThreatIntel.get_prefilter_stats()['checks'], 0)
+
+
+class TestStreamThreatIntelRefresh(object):
+    """Test class for refreshing StreamThreatIntel from an intel source"""
+    def setup(self):
+        """Setup before each method"""
+        StreamThreatIntel._StreamThreatIntel__intelligence.clear()  # pylint: disable=no-member
+        StreamThreatIntel._StreamThreatIntel__config.clear()  # pylint: disable=no-member
+        StreamThreatIntel._StreamThreatIntel__prefilters.clear()  # pylint: disable=no-member
+        self.source_dir = tempfile.mkdtemp()
+        self.config = {
+            'threat_intel': {
+                'enabled': True,
+                'mapping': {
+                    'sourceAddress': 'ip'
+                },
+                'refresh': {
+                    'enabled': True,
+                    'location': self.source_dir,
+                    'poll_interval_seconds': 300
+                }
+            }
+        }
+
+    def teardown(self):
+        """Teardown after each method"""
+        StreamThreatIntel._StreamThreatIntel__source = None
+        shutil.rmtree(self.source_dir)
+
+    def _write_delta(self, version, files):
+        """Helper to write the csv.gz files for a delta and add it to the manifest"""
+        manifest_path = os.path.join(self.source_dir, 'manifest.json')
+        manifest = {'version': 0, 'deltas': []}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+
+        delta_files = {}
+        for ioc_type, changes in files.iteritems():
+            delta_files[ioc_type] = {}
+            for change, rows in changes.iteritems():
+                name = '{}_{}_{}.csv.gz'.format(version, ioc_type, change)
+                with gzip.open(os.path.join(self.source_dir, name), 'w') as delta_file:
+                    delta_file.write('\n'.join(','.join(row) for row in rows))
+                delta_files[ioc_type][change] = name
+
+        manifest['version'] = version
+        manifest['deltas'].append({'version': version, 'files': delta_files})
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+
+    def test_refresh_applies_deltas(self):
+        """Threat Intel - Refresh, Apply Deltas"""
+        self._write_delta(1, {'ip': {'add': [['1.1.1.1', 'scan_ip', 'source']],
+                                     'remove': [['90.163.54.11']]}})
+        self._write_delta(2, {'domain': {'add': [['evil.com', 'c2_domain', 'source']]}})
+
+        StreamThreatIntel.load_intelligence(self.config, 'tests/unit/fixtures')
+        intelligence = StreamThreatIntel.get_intelligence()
+
+        assert_equal(StreamThreatIntel.get_version(), 2)
+        assert_equal(intelligence['ip']['1.1.1.1'], ['scan_ip', 'source'])
+        assert_false('90.163.54.11' in intelligence['ip'])
+        assert_true('93.182.11.140' in intelligence['ip'])
+        assert_equal(len(intelligence['ip']), 10)
+        assert_true('evil.com' in intelligence['domain'])
+        assert_equal(len(intelligence['domain']), 11)
+
+    def test_refresh_not_modified(self):
+        """Threat Intel - Refresh, Manifest Not Modified"""
+        self._write_delta(1, {'ip': {'add': [['1.1.1.1', 'scan_ip', 'source']]}})
+        StreamThreatIntel.load_intelligence(self.config, 'tests/unit/fixtures')
+
+        with patch.object(StreamThreatIntel._StreamThreatIntel__source,  # pylint: disable=no-member
+                          'read_manifest') as manifest_mock:
+            assert_false(StreamThreatIntel.refresh_intelligence(force=True))
+            manifest_mock.assert_not_called()
+
+    def test_refresh_poll_interval(self):
+        """Threat Intel - Refresh, Poll Interval Not Passed"""
+        self._write_delta(1, {'ip': {'add': [['1.1.1.1', 'scan_ip', 'source']]}})
+        StreamThreatIntel.load_intelligence(self.config, 'tests/unit/fixtures')
+
+        self._write_delta(2, {'ip': {'add': [['2.2.2.2', 'scan_ip', 'source']]}})
+        # The intelligence is already loaded, so this only polls for new deltas
+        StreamThreatIntel.load_intelligence(self.config, 'tests/unit/fixtures')
+        assert_equal(StreamThreatIntel.get_version(), 1)
+
+        previous = StreamThreatIntel.get_intelligence()
+        assert_true(StreamThreatIntel.refresh_intelligence(force=True))
+        assert_equal(StreamThreatIntel.get_version(), 2)
+        assert_true('2.2.2.2' in StreamThreatIntel.get_intelligence()['ip'])
+
+        # The previous intelligence is swapped out, not modified
+        assert_false('2.2.2.2' in previous['ip'])
+
+    @patch('logging.Logger.error')
+    def test_refresh_missing_delta(self, log_mock):
+        """Threat Intel - Refresh, Missing Delta"""
+        self._write_delta(2, {'ip': {'add': [['1.1.1.1', 'scan_ip', 'source']]}})
+        StreamThreatIntel.load_intelligence(self.config, 'tests/unit/fixtures')
+
+        log_mock.assert_called_with('Threat intel source is missing deltas to update from '
+                                    'version %d to %d', 0, 2)
+        assert_equal(StreamThreatIntel.get_version(), 0)
+        assert_false('1.1.1.1' in StreamThreatIntel.get_intelligence()['ip'])
+
+    def test_refresh_prefilters(self):
+        """Threat Intel - Refresh, Added Indicators Pass Prefilters"""
+        self.config['threat_intel']['prefilter'] = {'enabled': True}
+        intel_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy('tests/unit/fixtures/ip.csv.gz', intel_dir)
+            StreamThreatIntel.build_intel_stores(intel_dir, false_positive_rate=0.01)
+
+            self._write_delta(1, {'ip': {'add': [['1.1.1.1', 'scan_ip', 'source']]}})
+            StreamThreatIntel.load_intelligence(self.config, intel_dir)
+
+            assert_true(StreamThreatIntel.might_be_ioc('ip', '1.1.1.1'))
+            assert_true('1.1.1.1' in StreamThreatIntel.get_intelligence()['ip'])
+            StreamThreatIntel.get_intelligence()['ip'].base.close()
+        finally:
+            shutil.rmtree(intel_dir)
@@ -0,0 +1,150 @@
+"""
+Copyright 2017-present, Airbnb Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# pylint: disable=no-self-use
+from botocore.exceptions import ClientError
+from mock import Mock, patch
+from nose.tools import assert_equal, assert_true
+
+from stream_alert.shared.firehose import put_record_batch
+
+
+def _client_error(code, status):
+    """Helper to create a ClientError for a PutRecordBatch request"""
+    return ClientError({'Error': {'Code': code, 'Message': 'error'},
+                        'ResponseMetadata': {'HTTPStatusCode': status}},
+                       'PutRecordBatch')
+
+
+@patch('backoff.full_jitter', Mock(return_value=0))
+class TestPutRecordBatch(object):
+    """Test class for put_record_batch"""
+
+    def setup(self):
+        """Setup before each method"""
+        self.client = Mock()
+        self.records = ['{"key":1}\n', '{"key":2}\n', '{"key":3}\n']
+
+    def _sent_records(self):
+        """Return the data of the records sent in each request"""
+        return [[record['Data'] for record in call[1]['Records']]
+                for call in self.client.put_record_batch.call_args_list]
+
+    def test_success(self):
+        """Firehose - PutRecordBatch Success"""
+        self.client.put_record_batch.return_value = {'FailedPutCount': 0}
+
+        result = put_record_batch(self.client, 'stream', self.records, 3)
+
+        assert_equal(result, (3, 0, [], 0, 0))
+        assert_equal(self._sent_records(), [self.records])
+
+    def test_partial_failure(self):
+        """Firehose - PutRecordBatch Resends Only Failed Records"""
+        error = {'ErrorCode': 'ServiceUnavailableException', 'ErrorMessage': 'Slow down.'}
+        self.client.put_record_batch.side_effect = [
+            {
+                'FailedPutCount': 1,
+                'RequestResponses': [{'RecordId': '1'}, error, {'RecordId': '3'}]
+            },
+            {
+                'FailedPutCount': 0,
+                'RequestResponses': [{'RecordId': '2'}]
+            }
+        ]
+
+        result = put_record_batch(self.client, 'stream', self.records, 3)
+
+        assert_equal(self._sent_records(), [self.records, [self.records[1]]])
+        assert_equal(result.sent, 3)
+        assert_equal(result.failed, 0)
+        assert_equal(result.resent_bytes, len(self.records[1]))
+        assert_equal(result.duplicated, 0)
+
+    def test_partial_failure_give_up(self):
+        """Firehose - PutRecordBatch Gives Up on Failed Records"""
+        error = {'ErrorCode': 'InternalFailure', 'ErrorMessage': 'Failed.'}
+        self.client.put_record_batch.return_value = {
+            'FailedPutCount': 1,
+            'RequestResponses': [error]
+        }
+
+        result = put_record_batch(self.client, 'stream', self.records[:1], 3)
+
+        assert_equal(self.client.put_record_batch.call_count, 3)
+        assert_equal(result, (0, 1, [error], 2 * len(self.records[0]), 0))
+
+    def test_unknown_failures(self):
+        """Firehose - PutRecordBatch Resends All Records When Failures Are Unknown"""
+        self.client.put_record_batch.side_effect = [
+            {'FailedPutCount': 3, 'RequestResponses': []},
+            {'FailedPutCount': 0}
+        ]
+
+        result = put_record_batch(self.client, 'stream', self.records, 3)
+
+        assert_equal(self._sent_records(), [self.records, self.records])
+        assert_equal(result.sent, 3)
+        assert_equal(result.duplicated, 0)
+
+    def test_unknown_failures_duplicated(self):
+        """Firehose - PutRecordBatch Counts Delivered Records Resent With Unknown Failures"""
+        self.client.put_record_batch.side_effect = [
+            {'FailedPutCount': 1, 'RequestResponses': []},
+            {'FailedPutCount': 0}
+        ]
+
+        result = put_record_batch(self.client, 'stream', self.records, 3)
+
+        assert_equal(self._sent_records(), [self.records, self.records])
+        assert_equal(result.duplicated, 2)
+
+    def test_request_error_duplicated(self):
+        """Firehose - PutRecordBatch Counts Records Resent After a Request Error"""
+        self.client.put_record_batch.side_effect = [
+            _client_error('InternalFailure', 500),
+            {'FailedPutCount': 0}
+        ]
+
+        result = put_record_batch(self.client, 'stream', self.records, 3)
+
+        assert_equal(self.client.put_record_batch.call_count, 2)
+        assert_equal(result.sent, 3)
+        assert_equal(result.duplicated, 3)
+
+    def test_throttled(self):
+        """Firehose - PutRecordBatch Retries Throttled Requests"""
+        self.client.put_record_batch.side_effect = [
+            _client_error('ServiceUnavailableException', 400),
+            {'FailedPutCount': 0}
+        ]
+
+        result = put_record_batch(self.client, 'stream', self.records, 3)
+
+        assert_equal(self.client.put_record_batch.call_count, 2)
+        assert_equal(result.sent, 3)
+        assert_equal(result.duplicated, 0)
+
+    @patch('stream_alert.shared.firehose.LOGGER')
+    def test_permanent_error(self, log_mock):
+        """Firehose - PutRecordBatch Does Not Retry Client Errors"""
+        self.client.put_record_batch.side_effect = _client_error(
+            'ResourceNotFoundException', 400)
+
+        result = put_record_batch(self.client, 'stream', self.records, 3)
+
+        assert_equal(self.client.put_record_batch.call_count, 1)
+        assert_equal(result.failed, 3)
+        assert_true(log_mock.error.called)